@@ -1,4 +1,3 @@
-# Minimal placeholder - run `alembic init` locally for a proper setup.
 from logging.config import fileConfig
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
@@ -6,18 +5,58 @@ from alembic import context
 import os
 
 config = context.config
-fileConfig(config.config_file_name)
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
 
-from app.database import Base
+from app.database import Base, DATABASE_URL, sqlalchemy_url
 from app import models
 
+config.set_main_option("sqlalchemy.url", sqlalchemy_url(os.getenv("DATABASE_URL", DATABASE_URL)))
+
 target_metadata = Base.metadata
 
+
+def include_object(object, name, type_, reflected, compare_to):
+    # Per-job staging tables are created and dropped by the import worker
+    if type_ == "table" and name.startswith("import_stage_"):
+        return False
+    return True
+
+
 def run_migrations_offline():
-    pass
+    """Emit the migration SQL without connecting (alembic upgrade head --sql)."""
+    context.configure(
+        url=config.get_main_option("sqlalchemy.url"),
+        target_metadata=target_metadata,
+        include_object=include_object,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
 
 def run_migrations_online():
-    pass
+    connectable = engine_from_config(
+        config.get_section(config.config_ini_section, {}),
+        prefix="sqlalchemy.",
+        poolclass=pool.NullPool,
+    )
+
+    with connectable.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_object=include_object,
+            # Each revision commits on its own, so index builds that run
+            # outside a transaction (CONCURRENTLY) can follow a schema change
+            transaction_per_migration=True,
+        )
+
+        with context.begin_transaction():
+            context.run_migrations()
+
 
 if context.is_offline_mode():
     run_migrations_offline()
@@ -0,0 +1,92 @@
+"""Initial schema: products, webhooks, import_checkpoints
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+
+Databases created by hand from the README already have most of this schema,
+so every statement is idempotent and only fills in what is missing.
+"""
+from alembic import op
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS products (
+            id BIGSERIAL PRIMARY KEY,
+            sku TEXT NOT NULL,
+            name TEXT NOT NULL,
+            description TEXT,
+            price NUMERIC(12,2),
+            image_url TEXT,
+            category TEXT,
+            stock_quantity INTEGER DEFAULT 0,
+            active BOOLEAN NOT NULL DEFAULT true,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+    for column in (
+        "description TEXT",
+        "price NUMERIC(12,2)",
+        "image_url TEXT",
+        "category TEXT",
+        "stock_quantity INTEGER DEFAULT 0",
+        "active BOOLEAN NOT NULL DEFAULT true",
+        "created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()",
+        "updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()",
+    ):
+        op.execute(f"ALTER TABLE products ADD COLUMN IF NOT EXISTS {column}")
+
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS webhooks (
+            id BIGSERIAL PRIMARY KEY,
+            url TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            is_active BOOLEAN NOT NULL DEFAULT true,
+            description TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+    for column in (
+        "is_active BOOLEAN NOT NULL DEFAULT true",
+        "description TEXT",
+        "created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()",
+        "updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()",
+    ):
+        op.execute(f"ALTER TABLE webhooks ADD COLUMN IF NOT EXISTS {column}")
+
+    # Same definition as tasks/process_csv.py creates on first import
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS import_checkpoints (
+            job_id TEXT PRIMARY KEY,
+            file_path TEXT NOT NULL,
+            engine TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            stage_table TEXT NOT NULL,
+            phase TEXT NOT NULL DEFAULT 'staging',
+            byte_offset BIGINT NOT NULL DEFAULT 0,
+            rows_read BIGINT NOT NULL DEFAULT 0,
+            unique_count BIGINT,
+            merged_through BIGINT NOT NULL DEFAULT 0,
+            rows_processed BIGINT NOT NULL DEFAULT 0,
+            deleted BIGINT NOT NULL DEFAULT 0,
+            deactivated_through BIGINT NOT NULL DEFAULT 0,
+            deactivated BIGINT NOT NULL DEFAULT 0,
+            result JSONB,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS import_checkpoints")
+    op.execute("DROP TABLE IF EXISTS webhooks")
+    op.execute("DROP TABLE IF EXISTS products")
@@ -0,0 +1,66 @@
+"""Indexes for the import upsert and the product/webhook list queries
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+
+All indexes are built with CREATE INDEX CONCURRENTLY so a deploy never
+blocks writes to a live catalog. A concurrent build that fails leaves an
+INVALID index behind; it is dropped and rebuilt on the next run.
+"""
+from alembic import op
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    # Conflict target of the import upsert: ON CONFLICT (LOWER(sku))
+    'products_sku_lower_unique': "CREATE UNIQUE INDEX CONCURRENTLY {name} ON products (LOWER(sku))",
+    # list_products ?category= filter
+    'products_category_lower_idx': "CREATE INDEX CONCURRENTLY {name} ON products (LOWER(category))",
+    # list_products ORDER BY created_at DESC, with id as a stable tiebreaker
+    'products_created_at_id_idx': "CREATE INDEX CONCURRENTLY {name} ON products (created_at DESC, id DESC)",
+    # list_products ?active= filter, and stats' active/inactive counts
+    'products_active_created_at_idx': "CREATE INDEX CONCURRENTLY {name} ON products (created_at DESC, id DESC) WHERE active",
+    'products_inactive_created_at_idx': "CREATE INDEX CONCURRENTLY {name} ON products (created_at DESC, id DESC) WHERE NOT active",
+    # list_webhooks ?active_only=, and matching subscribers by event type
+    'webhooks_active_event_type_idx': "CREATE INDEX CONCURRENTLY {name} ON webhooks (event_type) WHERE is_active",
+    'webhooks_created_at_idx': "CREATE INDEX CONCURRENTLY {name} ON webhooks (created_at DESC)",
+}
+
+
+def _create_index(name, ddl):
+    if op.get_context().as_sql:
+        # Offline (--sql) mode can't inspect the catalog
+        op.execute(ddl.format(name=f"IF NOT EXISTS {name}"))
+        return
+    bind = op.get_bind()
+    valid = bind.exec_driver_sql(
+        """
+        SELECT i.indisvalid
+        FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+        WHERE c.relname = %(name)s
+        """,
+        {"name": name},
+    ).scalar()
+    if valid:
+        return
+    if valid is False:
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    op.execute(ddl.format(name=name))
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, ddl in INDEXES.items():
+            _create_index(name, ddl)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            # The LOWER(sku) index predates migrations and the importer depends on it
+            if name != 'products_sku_lower_unique':
+                op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
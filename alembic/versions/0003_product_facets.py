@@ -0,0 +1,99 @@
+"""Aggregate table of product counts per category and active state
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+
+product_facets is kept current by statement-level triggers on products,
+so CRUD, imports and bulk deletes all update it in the same transaction
+without per-row overhead. GET /products/facets and /products/stats/summary
+read it instead of counting the products table.
+"""
+from alembic import op
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE product_facets (
+            category TEXT NOT NULL,
+            active BOOLEAN NOT NULL,
+            count BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (category, active)
+        )
+    """)
+
+    # Deltas are applied in key order so concurrent writers lock facet rows
+    # in the same order and can't deadlock each other.
+    op.execute("""
+        CREATE FUNCTION product_facets_apply() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                INSERT INTO product_facets (category, active, count)
+                SELECT COALESCE(category, ''), active, -COUNT(*)
+                FROM old_rows GROUP BY 1, 2 ORDER BY 1, 2
+                ON CONFLICT (category, active)
+                DO UPDATE SET count = product_facets.count + EXCLUDED.count;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO product_facets (category, active, count)
+                SELECT COALESCE(category, ''), active, COUNT(*)
+                FROM new_rows GROUP BY 1, 2 ORDER BY 1, 2
+                ON CONFLICT (category, active)
+                DO UPDATE SET count = product_facets.count + EXCLUDED.count;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE FUNCTION product_facets_truncate() RETURNS trigger AS $$
+        BEGIN
+            DELETE FROM product_facets;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+
+    # Transition tables allow only one event per trigger
+    op.execute("""
+        CREATE TRIGGER products_facets_insert AFTER INSERT ON products
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION product_facets_apply()
+    """)
+    op.execute("""
+        CREATE TRIGGER products_facets_update AFTER UPDATE ON products
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION product_facets_apply()
+    """)
+    op.execute("""
+        CREATE TRIGGER products_facets_delete AFTER DELETE ON products
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION product_facets_apply()
+    """)
+    op.execute("""
+        CREATE TRIGGER products_facets_truncate AFTER TRUNCATE ON products
+        FOR EACH STATEMENT EXECUTE FUNCTION product_facets_truncate()
+    """)
+
+    # Backfill while writes are blocked, so no change slips between the count and the triggers
+    op.execute("LOCK TABLE products IN SHARE MODE")
+    op.execute("""
+        INSERT INTO product_facets (category, active, count)
+        SELECT COALESCE(category, ''), active, COUNT(*)
+        FROM products GROUP BY 1, 2
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS products_facets_truncate ON products")
+    op.execute("DROP TRIGGER IF EXISTS products_facets_delete ON products")
+    op.execute("DROP TRIGGER IF EXISTS products_facets_update ON products")
+    op.execute("DROP TRIGGER IF EXISTS products_facets_insert ON products")
+    op.execute("DROP FUNCTION IF EXISTS product_facets_truncate()")
+    op.execute("DROP FUNCTION IF EXISTS product_facets_apply()")
+    op.execute("DROP TABLE IF EXISTS product_facets")
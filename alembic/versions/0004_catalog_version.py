@@ -0,0 +1,53 @@
+"""Catalog version counter for conditional GETs on products
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+
+catalog_version holds a single row whose version is bumped by a
+statement-level trigger on every write to products. The products API
+uses it as the ETag of its read endpoints, so an unchanged page can be
+answered with 304 Not Modified.
+
+The bump takes a row lock until commit, so product writes queue behind
+each other on it. Imports commit their writes in batches, one batch at a
+time under the catalog lock, and API writes are single statements, so
+the wait is short.
+"""
+from alembic import op
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE catalog_version (
+            id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+            version BIGINT NOT NULL DEFAULT 1,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+    op.execute("INSERT INTO catalog_version (id) VALUES (true)")
+
+    op.execute("""
+        CREATE FUNCTION catalog_version_bump() RETURNS trigger AS $$
+        BEGIN
+            UPDATE catalog_version SET version = version + 1, updated_at = NOW();
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER products_catalog_version
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON products
+        FOR EACH STATEMENT EXECUTE FUNCTION catalog_version_bump()
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS products_catalog_version ON products")
+    op.execute("DROP FUNCTION IF EXISTS catalog_version_bump()")
+    op.execute("DROP TABLE IF EXISTS catalog_version")
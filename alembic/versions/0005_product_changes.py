@@ -0,0 +1,105 @@
+"""Change feed (outbox) of product writes
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+
+Statement-level triggers append one product_changes row per inserted,
+changed or deleted product, in the writing transaction, so CRUD, import
+merges and bulk deletes are all captured. Updates that leave every
+product field as it was are skipped.
+
+Feed order is (txid, id). A row is served only once its transaction is
+older than every running one, so a consumer's cursor never skips a change
+that commits late. product_changes_horizon records the newest key removed
+by retention, so a consumer behind it knows it has to resync.
+"""
+from alembic import op
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+FIELDS = ('sku', 'name', 'description', 'price', 'image_url', 'category', 'stock_quantity', 'active')
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE product_changes (
+            id BIGSERIAL PRIMARY KEY,
+            txid XID8 NOT NULL DEFAULT pg_current_xact_id(),
+            op TEXT NOT NULL,
+            product_id BIGINT,
+            sku TEXT,
+            changed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+    op.execute("CREATE INDEX product_changes_txid_id_idx ON product_changes (txid, id)")
+    # Compaction looks up newer changes of the same product
+    op.execute("CREATE INDEX product_changes_product_id_idx ON product_changes (product_id)")
+
+    op.execute("""
+        CREATE TABLE product_changes_horizon (
+            id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+            txid XID8 NOT NULL DEFAULT '0',
+            change_id BIGINT NOT NULL DEFAULT 0
+        )
+    """)
+    op.execute("INSERT INTO product_changes_horizon (id) VALUES (true)")
+
+    new_fields = ", ".join(f"n.{f}" for f in FIELDS)
+    old_fields = ", ".join(f"o.{f}" for f in FIELDS)
+    op.execute(f"""
+        CREATE FUNCTION product_changes_capture() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO product_changes (op, product_id, sku)
+                SELECT 'insert', id, sku FROM new_rows ORDER BY id;
+            ELSIF TG_OP = 'UPDATE' THEN
+                INSERT INTO product_changes (op, product_id, sku)
+                SELECT 'update', n.id, n.sku
+                FROM new_rows n JOIN old_rows o ON o.id = n.id
+                WHERE ({new_fields}) IS DISTINCT FROM ({old_fields})
+                ORDER BY n.id;
+            ELSIF TG_OP = 'DELETE' THEN
+                INSERT INTO product_changes (op, product_id, sku)
+                SELECT 'delete', id, sku FROM old_rows ORDER BY id;
+            ELSE
+                -- TRUNCATE: consumers must drop everything they hold
+                INSERT INTO product_changes (op) VALUES ('truncate');
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+
+    op.execute("""
+        CREATE TRIGGER products_changes_insert AFTER INSERT ON products
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION product_changes_capture()
+    """)
+    op.execute("""
+        CREATE TRIGGER products_changes_update AFTER UPDATE ON products
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION product_changes_capture()
+    """)
+    op.execute("""
+        CREATE TRIGGER products_changes_delete AFTER DELETE ON products
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION product_changes_capture()
+    """)
+    op.execute("""
+        CREATE TRIGGER products_changes_truncate AFTER TRUNCATE ON products
+        FOR EACH STATEMENT EXECUTE FUNCTION product_changes_capture()
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS products_changes_truncate ON products")
+    op.execute("DROP TRIGGER IF EXISTS products_changes_delete ON products")
+    op.execute("DROP TRIGGER IF EXISTS products_changes_update ON products")
+    op.execute("DROP TRIGGER IF EXISTS products_changes_insert ON products")
+    op.execute("DROP FUNCTION IF EXISTS product_changes_capture()")
+    op.execute("DROP TABLE IF EXISTS product_changes_horizon")
+    op.execute("DROP TABLE IF EXISTS product_changes")
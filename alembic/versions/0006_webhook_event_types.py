@@ -0,0 +1,25 @@
+"""Multiple event types (with wildcards) per webhook
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+
+event_types lists the event patterns a webhook subscribes to, e.g.
+{'product.created', 'import.*'}. event_type is kept, holding the first
+pattern, for clients that still read or write a single type.
+"""
+from alembic import op
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE webhooks ADD COLUMN IF NOT EXISTS event_types TEXT[] NOT NULL DEFAULT '{}'")
+    op.execute("UPDATE webhooks SET event_types = ARRAY[event_type] WHERE event_types = '{}'")
+
+
+def downgrade():
+    op.execute("ALTER TABLE webhooks DROP COLUMN IF EXISTS event_types")
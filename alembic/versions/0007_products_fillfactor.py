@@ -0,0 +1,31 @@
+"""Leave free space in products pages for HOT updates of price and stock
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+
+Price and stock_quantity change far more often than the rest of a
+product. No index covers them (or updated_at), so an update that only
+touches them can be a heap-only tuple (HOT) update, skipping every index,
+as long as the new row version fits on the same page. With the default
+fillfactor of 100 pages are packed full and almost every update moves the
+row and inserts new entries into all six indexes.
+
+Only pages written from now on honour the setting. Existing pages pick it
+up when the table is rewritten: a replace import (which copies the
+table's storage options), VACUUM FULL or pg_repack.
+"""
+from alembic import op
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE products SET (fillfactor = 85)")
+
+
+def downgrade():
+    op.execute("ALTER TABLE products RESET (fillfactor)")
@@ -0,0 +1,26 @@
+"""Unchanged and missing row counts on import checkpoints
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19
+
+unchanged counts staged rows whose values already matched the catalog;
+missing counts inventory rows whose SKU isn't in the catalog. Both are
+carried across merge batches so a resumed import reports them in full.
+"""
+from alembic import op
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE import_checkpoints ADD COLUMN IF NOT EXISTS unchanged BIGINT NOT NULL DEFAULT 0")
+    op.execute("ALTER TABLE import_checkpoints ADD COLUMN IF NOT EXISTS missing BIGINT NOT NULL DEFAULT 0")
+
+
+def downgrade():
+    op.execute("ALTER TABLE import_checkpoints DROP COLUMN IF EXISTS missing")
+    op.execute("ALTER TABLE import_checkpoints DROP COLUMN IF EXISTS unchanged")
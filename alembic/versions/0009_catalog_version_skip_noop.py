@@ -0,0 +1,79 @@
+"""Bump catalog_version only for statements that change rows
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19
+
+The statement-level trigger of 0004 bumped the version for every
+statement on products, including the ones that touch no rows: no-op
+PUTs, unchanged inventory updates, empty merge and deactivation batches.
+Each of those invalidated every catalog ETag and the upload-reuse check.
+
+Transition tables can't be shared by several events (or used by TRUNCATE),
+so, as for product_facets, there is one trigger per event; the function
+bumps only when the statement's transition table has rows.
+"""
+from alembic import op
+
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE OR REPLACE FUNCTION catalog_version_bump() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                IF NOT EXISTS (SELECT 1 FROM new_rows) THEN
+                    RETURN NULL;
+                END IF;
+            ELSIF TG_OP IN ('UPDATE', 'DELETE') THEN
+                IF NOT EXISTS (SELECT 1 FROM old_rows) THEN
+                    RETURN NULL;
+                END IF;
+            END IF;
+            UPDATE catalog_version SET version = version + 1, updated_at = NOW();
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("DROP TRIGGER IF EXISTS products_catalog_version ON products")
+    op.execute("""
+        CREATE TRIGGER products_catalog_version_insert AFTER INSERT ON products
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION catalog_version_bump()
+    """)
+    op.execute("""
+        CREATE TRIGGER products_catalog_version_update AFTER UPDATE ON products
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION catalog_version_bump()
+    """)
+    op.execute("""
+        CREATE TRIGGER products_catalog_version_delete AFTER DELETE ON products
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION catalog_version_bump()
+    """)
+    op.execute("""
+        CREATE TRIGGER products_catalog_version_truncate AFTER TRUNCATE ON products
+        FOR EACH STATEMENT EXECUTE FUNCTION catalog_version_bump()
+    """)
+
+
+def downgrade():
+    for event in ('truncate', 'delete', 'update', 'insert'):
+        op.execute(f"DROP TRIGGER IF EXISTS products_catalog_version_{event} ON products")
+    op.execute("""
+        CREATE OR REPLACE FUNCTION catalog_version_bump() RETURNS trigger AS $$
+        BEGIN
+            UPDATE catalog_version SET version = version + 1, updated_at = NOW();
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER products_catalog_version
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON products
+        FOR EACH STATEMENT EXECUTE FUNCTION catalog_version_bump()
+    """)
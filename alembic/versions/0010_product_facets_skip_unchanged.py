@@ -0,0 +1,96 @@
+"""Apply facet deltas on UPDATE only for rows whose facet key changed
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-19
+
+The UPDATE trigger of 0003 subtracted every old row and added every new
+one, so each price or stock change, merge batch and no-op PUT rewrote
+(and row-locked) the product_facets rows of the categories it touched.
+That serialized unrelated writers on busy categories and left a dead
+facet tuple per statement.
+
+Updates now pair old and new rows by id and apply only the net change per
+(category, active), skipping zero deltas; a statement that moves no
+product between facets doesn't touch product_facets at all.
+"""
+from alembic import op
+
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE OR REPLACE FUNCTION product_facets_apply() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' THEN
+                IF NOT EXISTS (
+                    SELECT 1 FROM old_rows o JOIN new_rows n USING (id)
+                    WHERE (COALESCE(o.category, ''), o.active) IS DISTINCT FROM (COALESCE(n.category, ''), n.active)
+                ) THEN
+                    RETURN NULL;
+                END IF;
+                INSERT INTO product_facets (category, active, count)
+                SELECT category, active, SUM(delta)
+                FROM (
+                    SELECT COALESCE(o.category, '') AS category, o.active, -1 AS delta,
+                           COALESCE(n.category, '') AS new_category, n.active AS new_active
+                    FROM old_rows o JOIN new_rows n USING (id)
+                    UNION ALL
+                    SELECT COALESCE(n.category, ''), n.active, 1,
+                           COALESCE(o.category, ''), o.active
+                    FROM old_rows o JOIN new_rows n USING (id)
+                ) moved
+                WHERE (category, active) IS DISTINCT FROM (new_category, new_active)
+                GROUP BY 1, 2
+                HAVING SUM(delta) <> 0
+                ORDER BY 1, 2
+                ON CONFLICT (category, active)
+                DO UPDATE SET count = product_facets.count + EXCLUDED.count;
+                RETURN NULL;
+            END IF;
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO product_facets (category, active, count)
+                SELECT COALESCE(category, ''), active, -COUNT(*)
+                FROM old_rows GROUP BY 1, 2 ORDER BY 1, 2
+                ON CONFLICT (category, active)
+                DO UPDATE SET count = product_facets.count + EXCLUDED.count;
+            END IF;
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO product_facets (category, active, count)
+                SELECT COALESCE(category, ''), active, COUNT(*)
+                FROM new_rows GROUP BY 1, 2 ORDER BY 1, 2
+                ON CONFLICT (category, active)
+                DO UPDATE SET count = product_facets.count + EXCLUDED.count;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+
+
+def downgrade():
+    op.execute("""
+        CREATE OR REPLACE FUNCTION product_facets_apply() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                INSERT INTO product_facets (category, active, count)
+                SELECT COALESCE(category, ''), active, -COUNT(*)
+                FROM old_rows GROUP BY 1, 2 ORDER BY 1, 2
+                ON CONFLICT (category, active)
+                DO UPDATE SET count = product_facets.count + EXCLUDED.count;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO product_facets (category, active, count)
+                SELECT COALESCE(category, ''), active, COUNT(*)
+                FROM new_rows GROUP BY 1, 2 ORDER BY 1, 2
+                ON CONFLICT (category, active)
+                DO UPDATE SET count = product_facets.count + EXCLUDED.count;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
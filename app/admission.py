@@ -0,0 +1,200 @@
+"""
+Admission control for the API.
+
+Every HTTP request is put in a route class and has to get one of that
+class's slots before it runs. When the slots are taken it waits, in
+arrival order, for at most the class's queue budget. A request that would
+wait behind a full queue is refused at once with 429, and one whose budget
+runs out gets 503. Both carry Retry-After. Refusing early keeps requests from
+piling up on database connections until they all time out together.
+
+Classes (per process, see classify()):
+
+- light: single products by id and job status; fast index lookups
+- read: listing, facets, stats, lookup and the change feed
+- heavy: uploads, bulk delete, inventory updates and text search (listing or facets)
+- stream: SSE progress and long-polled changes; they hold a slot for
+  their whole duration but no database connection while waiting
+
+/health and / are never queued. The default read and heavy limits leave
+ADMISSION_RESERVED_CONNECTIONS of the database pool to light requests, so a
+product page still loads while search and imports are saturated.
+
+Each class is configured with ADMISSION_<CLASS>_LIMIT (concurrent requests),
+ADMISSION_<CLASS>_QUEUE (waiting requests) and ADMISSION_<CLASS>_WAIT_MS
+(queue budget). ADMISSION_CONTROL=0 turns it all off.
+"""
+import asyncio
+import collections
+import json
+import math
+import os
+import re
+import time
+from urllib.parse import parse_qs
+from app.database import DB_POOL_SIZE, DB_MAX_OVERFLOW
+
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "1") != "0"
+ADMISSION_RESERVED_CONNECTIONS = int(os.getenv("ADMISSION_RESERVED_CONNECTIONS", "3"))
+
+_POOL = DB_POOL_SIZE + DB_MAX_OVERFLOW
+_HEAVY_LIMIT = 2
+_READ_LIMIT = max(1, _POOL - _HEAVY_LIMIT - ADMISSION_RESERVED_CONNECTIONS)
+
+_PRODUCT_BY_ID = re.compile(r"^/products/\d+/?$")
+_UNQUEUED = {"/", "/health"}
+
+
+class RouteClass:
+    """A bounded number of slots with a bounded FIFO queue in front of them."""
+
+    def __init__(self, name: str, limit: int, queue: int, wait_ms: int):
+        env = f"ADMISSION_{name.upper()}_"
+        self.name = name
+        self.limit = int(os.getenv(env + "LIMIT", str(limit)))
+        self.queue = int(os.getenv(env + "QUEUE", str(queue)))
+        self.wait = int(os.getenv(env + "WAIT_MS", str(wait_ms))) / 1000
+        self.retry_after = str(max(1, math.ceil(self.wait)))
+        self.active = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._waiters = collections.deque()
+
+    async def acquire(self):
+        """Take a slot: None when admitted, else the status code to refuse with."""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return None
+        if len(self._waiters) >= self.queue:
+            self.rejected += 1
+            return 429
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait({waiter}, timeout=self.wait)
+        except BaseException:
+            # Client went away while queued; pass on a slot that was already handed to us
+            if self._leave(waiter):
+                self.release()
+            raise
+        if self._leave(waiter):
+            return None
+        self.timed_out += 1
+        return 503
+
+    def _leave(self, waiter):
+        """Stop waiting; True if `waiter` had already been given a slot."""
+        if waiter.done() and not waiter.cancelled():
+            return True
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        return False
+
+    def release(self):
+        # Hand the slot straight to the longest waiter, so it can't be taken by a newcomer
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def status(self):
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": len(self._waiters),
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+ROUTE_CLASSES = {
+    route_class.name: route_class for route_class in (
+        RouteClass("light", limit=_POOL, queue=200, wait_ms=1000),
+        RouteClass("read", limit=_READ_LIMIT, queue=50, wait_ms=2000),
+        RouteClass("heavy", limit=_HEAVY_LIMIT, queue=10, wait_ms=5000),
+        RouteClass("stream", limit=200, queue=0, wait_ms=0),
+    )
+}
+
+
+def classify(method: str, path: str, query_string: bytes):
+    """The route class name for a request, or None if it is never queued."""
+    if path in _UNQUEUED:
+        return None
+    if _PRODUCT_BY_ID.match(path) or path.startswith("/upload/status/") or path == "/changes/cursor":
+        return "light"
+    if path.startswith("/upload/progress/"):
+        return "stream"
+    if path.startswith("/upload") or path.startswith("/products/inventory"):
+        return "heavy"
+    if path.rstrip("/") == "/products" and method == "DELETE":
+        return "heavy"
+    if path.rstrip("/") in ("/products", "/products/facets"):
+        query = parse_qs(query_string.decode("latin-1"))
+        # Substring search scans the table (facets aggregate over it too); an exact SKU is an index lookup
+        if query.get("search", [""])[0]:
+            return "heavy"
+    if path.rstrip("/") == "/changes":
+        query = parse_qs(query_string.decode("latin-1"))
+        try:
+            if float(query.get("wait", ["0"])[0]) > 0:
+                return "stream"
+        except ValueError:
+            pass
+    return "read"
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying the route classes above to HTTP requests."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_CONTROL:
+            return await self.app(scope, receive, send)
+        name = classify(scope["method"], scope["path"], scope.get("query_string", b""))
+        if name is None:
+            return await self.app(scope, receive, send)
+
+        route_class = ROUTE_CLASSES[name]
+        started = time.monotonic()
+        refused = await route_class.acquire()
+        if refused is not None:
+            return await _refuse(send, refused, route_class)
+        try:
+            queued_ms = int((time.monotonic() - started) * 1000)
+
+            async def send_with_queue_time(message):
+                if message["type"] == "http.response.start":
+                    message.setdefault("headers", [])
+                    message["headers"] = [*message["headers"], (b"x-queue-time-ms", str(queued_ms).encode())]
+                await send(message)
+
+            await self.app(scope, receive, send_with_queue_time)
+        finally:
+            route_class.release()
+
+
+async def _refuse(send, status_code: int, route_class: RouteClass):
+    detail = "Too many requests, try again later" if status_code == 429 else "Server busy, try again later"
+    body = json.dumps({"detail": detail, "route_class": route_class.name}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", route_class.retry_after.encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def status():
+    return {name: route_class.status() for name, route_class in ROUTE_CLASSES.items()}
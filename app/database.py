@@ -1,9 +1,46 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:postgres@db:5432/acme")
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+# Per-process pool; with several web workers the database sees workers x (size + overflow)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Connections opened at startup so the first requests don't pay for the handshake
+DB_POOL_WARM = int(os.getenv("DB_POOL_WARM", "2"))
+
+
+def sqlalchemy_url(url: str):
+    """Pin the psycopg2 driver (newer SQLAlchemy defaults postgresql:// to psycopg 3)."""
+    for prefix in ("postgres://", "postgresql://"):
+        if url.startswith(prefix):
+            return "postgresql+psycopg2://" + url[len(prefix):]
+    return url
+
+
+# The one engine of the API process, shared by every router
+engine = create_engine(
+    sqlalchemy_url(DATABASE_URL),
+    pool_pre_ping=True,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+
+
+def warm_pool(connections: int = DB_POOL_WARM):
+    """Open up to `connections` pooled connections now instead of on first use."""
+    opened = []
+    try:
+        for _ in range(min(connections, DB_POOL_SIZE)):
+            conn = engine.connect()
+            conn.execute(text("SELECT 1"))
+            opened.append(conn)
+    except Exception as e:
+        print(f"Warning: could not warm the database pool: {e}")
+    finally:
+        for conn in opened:
+            conn.close()
+    return len(opened)
@@ -0,0 +1,162 @@
+"""
+Job progress for the API process.
+
+One async Redis pool per process (REDIS_POOL_SIZE connections at most),
+opened in the app lifespan, serves job status reads. Progress streams (SSE
+and WebSocket) share a single pub/sub connection: it subscribes to every
+job channel (tasks/progress.py) and hands each message to the streams of
+that job in this process. So 1,000 open streams cost one subscription plus
+the pooled connections they use to read the current state now and then.
+
+A stream starts from the stored state, then follows the published ones. If
+nothing arrives for JOB_STREAM_REFRESH_SECONDS, it reads the stored state
+again, so a message lost while the subscription was reconnecting can't
+leave a stream waiting forever.
+"""
+import asyncio
+import collections
+import contextlib
+import json
+import os
+from redis.asyncio import BlockingConnectionPool, Redis
+from redis.exceptions import RedisError
+from starlette.concurrency import run_in_threadpool
+from tasks.celery_app import celery
+from tasks.progress import (
+    JOB_CHANNEL_PATTERN, JOB_STATE_KEY, FINAL_STATUSES, QUEUED_STATE, progress_state, completed_state, failed_state,
+)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+REDIS_POOL_SIZE = int(os.getenv("REDIS_POOL_SIZE", "10"))
+JOB_STREAM_REFRESH_SECONDS = float(os.getenv("JOB_STREAM_REFRESH_SECONDS", "5"))
+_RESUBSCRIBE_SECONDS = 1
+
+
+class _Listener:
+    """The newest state published for one job, for one stream."""
+
+    def __init__(self):
+        self.state = None
+        self.changed = asyncio.Event()
+
+    def put(self, state: dict):
+        # Only the latest state matters, so a slow stream skips the ones it missed
+        self.state = state
+        self.changed.set()
+
+    async def next(self, timeout: float):
+        """The next published state, or None after `timeout` seconds without one."""
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self.changed.clear()
+        return self.state
+
+
+class JobEvents:
+    def __init__(self, url: str):
+        self.url = url
+        self.redis = None
+        self._listeners = collections.defaultdict(set)
+        self._reader = None
+
+    async def start(self):
+        if self.redis is None:
+            self.redis = Redis(connection_pool=BlockingConnectionPool.from_url(
+                self.url, max_connections=REDIS_POOL_SIZE, timeout=5
+            ))
+
+    async def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._reader
+            self._reader = None
+        if self.redis is not None:
+            await self.redis.aclose()
+            self.redis = None
+
+    async def get_state(self, job_id: str):
+        """The job's latest stored state, or None if there is none."""
+        await self.start()
+        raw = await self.redis.get(JOB_STATE_KEY.format(job_id))
+        return json.loads(raw) if raw else None
+
+    @contextlib.asynccontextmanager
+    async def listen(self, job_id: str):
+        """A _Listener receiving the states published for `job_id` while the block runs."""
+        await self.start()
+        listener = _Listener()
+        self._listeners[job_id].add(listener)
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read())
+        try:
+            yield listener
+        finally:
+            listeners = self._listeners[job_id]
+            listeners.discard(listener)
+            if not listeners:
+                del self._listeners[job_id]
+
+    async def stream(self, job_id: str, fetch_state):
+        """
+        Yield the job's state until it is final: first the current one from the
+        coroutine `fetch_state(job_id)`, then each published one. The current
+        state is yielded again every JOB_STREAM_REFRESH_SECONDS without news.
+        """
+        async with self.listen(job_id) as listener:
+            state = await fetch_state(job_id)
+            while True:
+                yield state
+                if state.get("status") in FINAL_STATUSES:
+                    return
+                state = await listener.next(JOB_STREAM_REFRESH_SECONDS) or await fetch_state(job_id)
+
+    async def _read(self):
+        """Dispatch job messages to this process's listeners, resubscribing after errors."""
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(JOB_CHANNEL_PATTERN)
+                async for message in pubsub.listen():
+                    if message["type"] != "pmessage":
+                        continue
+                    job_id = message["channel"].decode().split(":", 1)[1]
+                    listeners = self._listeners.get(job_id)
+                    if listeners:
+                        state = json.loads(message["data"])
+                        for listener in listeners:
+                            listener.put(state)
+            except (RedisError, OSError) as e:
+                print(f"Warning: job progress subscription lost, resubscribing: {e}")
+                await asyncio.sleep(_RESUBSCRIBE_SECONDS)
+            finally:
+                with contextlib.suppress(RedisError, OSError):
+                    await pubsub.aclose()
+
+
+jobs = JobEvents(REDIS_URL)
+
+
+def _backend_state(job_id: str):
+    result = celery.AsyncResult(job_id)
+    if result.ready():
+        return completed_state(result.result) if result.successful() else failed_state(result.info)
+    info = result.info
+    if isinstance(info, dict):
+        return progress_state(info.get("progress", 0), info.get("current", 0), info.get("total", 0),
+                              info.get("message", "Processing..."))
+    return dict(QUEUED_STATE)
+
+
+async def job_state(job_id: str):
+    """
+    The job's current state: the stored one, else the Celery result backend's
+    (jobs queued before their progress was stored, or stored state that expired).
+    """
+    state = await jobs.get_state(job_id)
+    if state is None:
+        # The backend client is synchronous; keep it off the event loop
+        state = await run_in_threadpool(_backend_state, job_id)
+    return state
@@ -1,8 +1,29 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import upload, products, webhooks
+from .admission import AdmissionMiddleware, status as admission_status
+from .database import engine, warm_pool
+from .jobs import jobs
+from .replicas import replicas
+from .routers import upload, products, webhooks, changes
+from . import ws
 
-app = FastAPI(title="Acme Product Importer API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in each serving process, after gunicorn forks it
+    warm_pool()
+    await jobs.start()
+    yield
+    await jobs.close()
+    engine.dispose()
+    replicas.dispose()
+
+
+app = FastAPI(title="Acme Product Importer API", lifespan=lifespan)
+
+# Per-route-class concurrency limits; added first so CORS headers still wrap its 429/503s
+app.add_middleware(AdmissionMiddleware)
 
 # Add CORS middleware - THIS FIXES THE CORS ERROR
 app.add_middleware(
@@ -17,6 +38,8 @@ app.add_middleware(
 app.include_router(upload.router)
 app.include_router(products.router)
 app.include_router(webhooks.router)
+app.include_router(changes.router)
+app.include_router(ws.router)
 
 @app.get("/")
 def root():
@@ -24,4 +47,4 @@ def root():
 
 @app.get("/health")
 def health():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy", "admission": admission_status()}
\ No newline at end of file
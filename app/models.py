@@ -1,23 +1,109 @@
-from sqlalchemy import Column, BigInteger, Text, Numeric, Boolean, TIMESTAMP, func
+from sqlalchemy import Column, BigInteger, Integer, Text, Numeric, Boolean, TIMESTAMP, Index, func, text
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.sql import expression
+from sqlalchemy.types import UserDefinedType
 from .database import Base
 
+# Schema changes go through alembic/versions; keep these models in step with them.
+
 class Product(Base):
     __tablename__ = 'products'
     id = Column(BigInteger, primary_key=True)
     sku = Column(Text, nullable=False)
-    name = Column(Text)
+    name = Column(Text, nullable=False)
     description = Column(Text)
     price = Column(Numeric(12,2))
+    image_url = Column(Text)
+    category = Column(Text)
+    stock_quantity = Column(Integer, server_default=text('0'))
     active = Column(Boolean, server_default=expression.true(), nullable=False)
-    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
-    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now())
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('products_sku_lower_unique', func.lower(sku), unique=True),
+        Index('products_category_lower_idx', func.lower(category)),
+        Index('products_created_at_id_idx', created_at.desc(), id.desc()),
+        Index('products_active_created_at_idx', created_at.desc(), id.desc(), postgresql_where=active),
+        Index('products_inactive_created_at_idx', created_at.desc(), id.desc(), postgresql_where=~active),
+    )
+
+class ProductFacet(Base):
+    # Maintained by the products_facets_* triggers (alembic 0003); never written directly
+    __tablename__ = 'product_facets'
+    category = Column(Text, primary_key=True)
+    active = Column(Boolean, primary_key=True)
+    count = Column(BigInteger, nullable=False, server_default=text('0'))
+
+class CatalogVersion(Base):
+    # Single row bumped by the products_catalog_version trigger (alembic 0004)
+    __tablename__ = 'catalog_version'
+    id = Column(Boolean, primary_key=True, server_default=expression.true())
+    version = Column(BigInteger, nullable=False, server_default=text('1'))
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+
+class XID8(UserDefinedType):
+    cache_ok = True
+
+    def get_col_spec(self):
+        return "XID8"
+
+class ProductChange(Base):
+    # Appended by the products_changes_* triggers (alembic 0005); served by GET /changes
+    __tablename__ = 'product_changes'
+    id = Column(BigInteger, primary_key=True)
+    txid = Column(XID8, nullable=False, server_default=text('pg_current_xact_id()'))
+    op = Column(Text, nullable=False)
+    product_id = Column(BigInteger)
+    sku = Column(Text)
+    changed_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('product_changes_txid_id_idx', txid, id),
+        Index('product_changes_product_id_idx', product_id),
+    )
+
+class ProductChangesHorizon(Base):
+    __tablename__ = 'product_changes_horizon'
+    id = Column(Boolean, primary_key=True, server_default=expression.true())
+    txid = Column(XID8, nullable=False, server_default=text("'0'"))
+    change_id = Column(BigInteger, nullable=False, server_default=text('0'))
 
 class Webhook(Base):
     __tablename__ = 'webhooks'
     id = Column(BigInteger, primary_key=True)
     url = Column(Text, nullable=False)
-    event_types = Column(Text)
-    enabled = Column(Boolean, server_default=expression.true(), nullable=False)
-    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
-    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now())
+    event_type = Column(Text, nullable=False)
+    # Subscribed event patterns ('product.created', 'product.*', '*'); event_type mirrors the first
+    event_types = Column(ARRAY(Text), nullable=False, server_default=text("'{}'"))
+    is_active = Column(Boolean, server_default=expression.true(), nullable=False)
+    description = Column(Text)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('webhooks_active_event_type_idx', event_type, postgresql_where=is_active),
+        Index('webhooks_created_at_idx', created_at.desc()),
+    )
+
+class ImportCheckpoint(Base):
+    __tablename__ = 'import_checkpoints'
+    job_id = Column(Text, primary_key=True)
+    file_path = Column(Text, nullable=False)
+    engine = Column(Text, nullable=False)
+    mode = Column(Text, nullable=False)
+    stage_table = Column(Text, nullable=False)
+    phase = Column(Text, nullable=False, server_default='staging')
+    byte_offset = Column(BigInteger, nullable=False, server_default=text('0'))
+    rows_read = Column(BigInteger, nullable=False, server_default=text('0'))
+    unique_count = Column(BigInteger)
+    merged_through = Column(BigInteger, nullable=False, server_default=text('0'))
+    rows_processed = Column(BigInteger, nullable=False, server_default=text('0'))
+    deleted = Column(BigInteger, nullable=False, server_default=text('0'))
+    deactivated_through = Column(BigInteger, nullable=False, server_default=text('0'))
+    deactivated = Column(BigInteger, nullable=False, server_default=text('0'))
+    unchanged = Column(BigInteger, nullable=False, server_default=text('0'))
+    missing = Column(BigInteger, nullable=False, server_default=text('0'))
+    result = Column(JSONB)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
@@ -0,0 +1,186 @@
+"""
+Read replicas for the catalog read endpoints.
+
+DATABASE_REPLICA_URLS lists streaming replicas of DATABASE_URL (comma
+separated). Product reads are served round-robin from the replicas that
+are up and at most REPLICA_MAX_LAG_SECONDS behind the primary, so browsing
+doesn't compete with imports for the primary; with none available they
+fall back to the primary. Writes and every other endpoint use the primary.
+
+Each process checks its replicas lazily, at most every
+REPLICA_CHECK_INTERVAL seconds, and samples the primary's WAL position at
+each check. A replica's lag is the age of the newest sample it has
+replayed past, i.e. how old the catalog it serves is. This holds during a
+long import transaction too, when commit timestamps stop moving. A
+replica that fails a check is skipped for REPLICA_RETRY_SECONDS.
+
+Read-your-writes: writes set a cookie with the primary's WAL position after
+they commit. Reads carrying it only go to a replica known to have replayed
+that far, so a client never reads a catalog older than its own writes.
+"""
+import collections
+import itertools
+import os
+import threading
+import time
+from sqlalchemy import create_engine, text
+from app.database import engine, sqlalchemy_url, DB_POOL_SIZE, DB_MAX_OVERFLOW
+
+REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "1"))
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", "10"))
+REPLICA_CONNECT_TIMEOUT = int(os.getenv("REPLICA_CONNECT_TIMEOUT", "2"))
+# How long after a write a client's reads wait for the replicas to catch up with it
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "60"))
+
+WRITE_LSN_COOKIE = "catalog_lsn"
+
+
+def parse_lsn(value):
+    """'16/B374D848' -> an integer that orders like the WAL position; None if malformed."""
+    try:
+        high, low = value.split("/")
+        return (int(high, 16) << 32) + int(low, 16)
+    except (AttributeError, ValueError):
+        return None
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.engine = create_engine(
+            sqlalchemy_url(url),
+            pool_pre_ping=True,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            connect_args={"connect_timeout": REPLICA_CONNECT_TIMEOUT},
+        )
+        self.healthy = False
+        self.lag = None
+        self.replay_lsn = 0
+        self.error = None
+        self.next_check = 0.0
+
+    def check(self):
+        """Refresh the replay position; False if the replica didn't answer."""
+        try:
+            with self.engine.connect() as conn:
+                replay_lsn = conn.execute(text("""
+                    SELECT CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn()
+                                ELSE pg_current_wal_lsn() END::text
+                """)).scalar()
+        except Exception as e:
+            self.healthy, self.error = False, str(e)
+            self.next_check = time.monotonic() + REPLICA_RETRY_SECONDS
+            return False
+        self.replay_lsn = parse_lsn(replay_lsn) or 0
+        self.healthy, self.error = True, None
+        self.next_check = time.monotonic() + REPLICA_CHECK_INTERVAL
+        return True
+
+    def status(self):
+        return {
+            "url": self.engine.url.render_as_string(hide_password=True),
+            "healthy": self.healthy,
+            "lag_seconds": self.lag if self.lag != float("inf") else None,
+            "error": self.error,
+        }
+
+
+class ReplicaPool:
+    """The replicas of this process, and which of them may serve a read."""
+
+    def __init__(self, urls):
+        self.replicas = [Replica(url) for url in urls]
+        self._turn = itertools.count()
+        self._checking = threading.Lock()
+        # (monotonic time, primary WAL position) samples, newest last
+        self._positions = collections.deque()
+
+    def _lag(self, replay_lsn: int):
+        """Seconds since the primary was last seen at a position `replay_lsn` covers; inf if not in the samples."""
+        now = time.monotonic()
+        for at, lsn in reversed(self._positions):
+            if replay_lsn >= lsn:
+                return now - at
+        return float("inf")
+
+    def _refresh(self):
+        now = time.monotonic()
+        due = [r for r in self.replicas if now >= r.next_check]
+        # One request checks while the others use the last results
+        if not due or not self._checking.acquire(blocking=False):
+            return
+        try:
+            try:
+                with engine.connect() as conn:
+                    primary_lsn = parse_lsn(conn.execute(text("SELECT pg_current_wal_lsn()::text")).scalar())
+            except Exception:
+                # Replicas keep serving reads at their last known lag while the primary is unreachable
+                primary_lsn = None
+            if primary_lsn is not None:
+                self._positions.append((now, primary_lsn))
+                while now - self._positions[0][0] > REPLICA_MAX_LAG_SECONDS + REPLICA_CHECK_INTERVAL:
+                    self._positions.popleft()
+            for replica in due:
+                if replica.check() and primary_lsn is not None:
+                    replica.lag = self._lag(replica.replay_lsn)
+        finally:
+            self._checking.release()
+
+    def choose(self, min_lsn: int = 0):
+        """The engine for a read that must see WAL position `min_lsn`: a usable replica, else the primary."""
+        if not self.replicas:
+            return engine
+        self._refresh()
+        usable = [
+            r for r in self.replicas
+            if r.healthy and r.lag is not None and r.lag <= REPLICA_MAX_LAG_SECONDS and r.replay_lsn >= min_lsn
+        ]
+        if not usable:
+            return engine
+        return usable[next(self._turn) % len(usable)].engine
+
+    def mark_down(self, bind):
+        """Skip the replica behind `bind` until its next check, e.g. after a failed query."""
+        for replica in self.replicas:
+            if replica.engine is bind:
+                replica.healthy = False
+                replica.next_check = time.monotonic() + REPLICA_RETRY_SECONDS
+
+    def dispose(self, close: bool = True):
+        for replica in self.replicas:
+            replica.engine.dispose(close=close)
+
+    def status(self):
+        return [replica.status() for replica in self.replicas]
+
+
+replicas = ReplicaPool(REPLICA_URLS)
+
+
+def read_engine(request):
+    """Engine to serve a catalog read for `request` from."""
+    if not replicas.replicas:
+        return engine
+    return replicas.choose(parse_lsn(request.cookies.get(WRITE_LSN_COOKIE)) or 0)
+
+
+def mark_write(response, db=None):
+    """
+    Make the client's next reads wait for this write: set the read-your-writes
+    cookie on `response`. Call after committing, with the session (or
+    connection) that wrote, or None to ask the primary.
+    """
+    if not replicas.replicas:
+        return
+    try:
+        if db is None:
+            with engine.connect() as conn:
+                lsn = conn.execute(text("SELECT pg_current_wal_lsn()::text")).scalar()
+        else:
+            lsn = db.execute(text("SELECT pg_current_wal_lsn()::text")).scalar()
+    except Exception as e:
+        print(f"Warning: could not read the WAL position after a write: {e}")
+        return
+    response.set_cookie(WRITE_LSN_COOKIE, lsn, max_age=READ_YOUR_WRITES_SECONDS, httponly=True, samesite="lax")
@@ -0,0 +1,128 @@
+from fastapi import APIRouter, HTTPException, Query
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import text
+from typing import Optional
+import asyncio
+import os
+import time
+from app.database import SessionLocal
+from app.serialization import json_response
+from app.routers.products import PRODUCT_COLUMNS
+
+router = APIRouter(prefix="/changes", tags=["changes"])
+
+CHANGES_MAX_WAIT = 30
+CHANGES_POLL_INTERVAL = float(os.getenv('CHANGES_POLL_INTERVAL', '0.5'))
+
+# Changes whose transaction may still be running are held back (see alembic 0005)
+SETTLED = "c.txid < pg_snapshot_xmin(pg_current_snapshot())"
+
+CHANGE_SELECT = "c.id, c.txid::text AS txid, c.op, c.product_id, c.sku, c.changed_at, " + ", ".join(
+    f"p.{col}::float8 AS p_{col}" if col == "price" else f"p.{col} AS p_{col}"
+    for col in PRODUCT_COLUMNS
+)
+
+
+def _parse_cursor(cursor: Optional[str]):
+    """A cursor is '<txid>-<change id>'; no cursor starts from the oldest retained change."""
+    if not cursor:
+        return "0", 0
+    try:
+        txid, change_id = cursor.split("-")
+        return str(int(txid)), int(change_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _fetch_changes(txid: str, change_id: int, limit: int):
+    db = SessionLocal()
+    try:
+        horizon = db.execute(text("""
+            SELECT (CAST(:txid AS xid8), :change_id) < (txid, change_id)
+            FROM product_changes_horizon
+        """), {"txid": txid, "change_id": change_id}).scalar()
+        if horizon and (txid, change_id) != ("0", 0):
+            raise HTTPException(status_code=410, detail="Cursor is older than the retained change log; resync and restart from GET /changes/cursor")
+
+        rows = db.execute(text(f"""
+            SELECT {CHANGE_SELECT}
+            FROM product_changes c
+            LEFT JOIN products p ON p.id = c.product_id
+            WHERE (c.txid, c.id) > (CAST(:txid AS xid8), :change_id) AND {SETTLED}
+            ORDER BY c.txid, c.id
+            LIMIT :limit
+        """), {"txid": txid, "change_id": change_id, "limit": limit}).fetchall()
+    finally:
+        db.close()
+
+    changes = []
+    for row in rows:
+        data = row._mapping
+        changes.append({
+            "cursor": f"{data['txid']}-{data['id']}",
+            "op": data["op"],
+            "product_id": data["product_id"],
+            "sku": data["sku"],
+            "changed_at": data["changed_at"],
+            # Current state of the product, or None once it is gone
+            "product": {col: data[f"p_{col}"] for col in PRODUCT_COLUMNS} if data["p_id"] is not None else None,
+        })
+    return changes
+
+
+@router.get("/")
+async def list_changes(
+    since: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=5000),
+    wait: float = Query(0, ge=0, le=CHANGES_MAX_WAIT)
+):
+    """
+    Product changes after the `since` cursor, oldest first. With `wait`,
+    long-poll up to that many seconds for the first change to arrive.
+    Pass the returned `next` cursor as `since` on the following call.
+    """
+    try:
+        txid, change_id = _parse_cursor(since)
+        deadline = time.monotonic() + wait
+
+        while True:
+            # Each poll queries in the threadpool; only the sleep between polls stays on the event loop
+            changes = await run_in_threadpool(_fetch_changes, txid, change_id, limit)
+            if changes or time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(CHANGES_POLL_INTERVAL)
+
+        return json_response({
+            "changes": changes,
+            "next": changes[-1]["cursor"] if changes else (since or f"{txid}-{change_id}"),
+            "has_more": len(changes) == limit
+        })
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/cursor")
+def current_cursor():
+    """Cursor of the newest settled change; start tailing here after a full export."""
+    try:
+        db = SessionLocal()
+        row = db.execute(text(f"""
+            SELECT c.txid::text AS txid, c.id
+            FROM product_changes c
+            WHERE {SETTLED}
+            ORDER BY c.txid DESC, c.id DESC
+            LIMIT 1
+        """)).fetchone()
+        if not row:
+            row = db.execute(text(
+                "SELECT txid::text AS txid, change_id AS id FROM product_changes_horizon"
+            )).fetchone()
+        db.close()
+
+        return {"cursor": f"{row.txid}-{row.id}"}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,16 +1,82 @@
-from fastapi import APIRouter, HTTPException, Query
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
 from pydantic import BaseModel
 from typing import Optional, List
 import os
+import time
+from app.database import engine, SessionLocal
+from app.replicas import replicas, read_engine, mark_write
+from app.cache import TTLCache
+from app.serialization import json_response, etag_matches, not_modified, rows_to_dicts
+from tasks.webhooks import fire_event
 
 router = APIRouter(prefix="/products", tags=["products"])
+# Handlers are plain functions: FastAPI runs them in its threadpool, so their blocking
+# database calls don't stall the event loop (and /health) while they wait on Postgres
 
-# Database setup
-DATABASE_URL = os.getenv('DATABASE_URL')
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(bind=engine)
+LOOKUP_MAX_SKUS = int(os.getenv('PRODUCT_LOOKUP_MAX_SKUS', '5000'))
+INVENTORY_MAX_ITEMS = int(os.getenv('PRODUCT_INVENTORY_MAX_ITEMS', '5000'))
+# Hot-SKU cache in front of /products/lookup; off unless SKU_CACHE_SIZE is set
+sku_cache = TTLCache(
+    maxsize=int(os.getenv('SKU_CACHE_SIZE', '0')),
+    ttl=float(os.getenv('SKU_CACHE_TTL', '5')),
+)
+
+# How long a process trusts its last read of catalog_version before re-reading it
+CATALOG_VERSION_TTL = float(os.getenv('CATALOG_VERSION_TTL', '1'))
+# Per server (primary or replica) the version was read from
+_catalog_versions = {}
+
+# price comes back as float8 so rows serialize without Decimal handling
+PRODUCT_COLUMNS = ("id", "sku", "name", "description", "price", "image_url", "category",
+                   "stock_quantity", "active", "created_at", "updated_at")
+PRODUCT_SELECT = """
+    id, sku, name, description, price::float8 AS price, image_url, category,
+    stock_quantity, active, created_at, updated_at
+"""
+
+
+def _catalog_etag(bind):
+    """
+    ETag of the catalog version on the server `bind` connects to. Read it
+    from the server that serves the body, before querying it, so the tag can
+    only be older than the body (costing a later 200), never newer (which
+    would serve stale 304s).
+    """
+    now = time.monotonic()
+    cached = _catalog_versions.get(bind)
+    if cached is None or now >= cached["expires"]:
+        with bind.connect() as conn:
+            version = conn.execute(text("SELECT version FROM catalog_version")).scalar()
+        cached = _catalog_versions[bind] = {"etag": f'"catalog-{version}"', "expires": now + CATALOG_VERSION_TTL}
+    return cached["etag"]
+
+
+def _read_target(request: Request):
+    """
+    (engine, etag) to serve a catalog read from: a replica when one is caught
+    up enough for this client, else the primary. A replica that can't be
+    reached is skipped and the read falls back to the primary.
+    """
+    bind = read_engine(request)
+    try:
+        return bind, _catalog_etag(bind)
+    except OperationalError:
+        if bind is engine:
+            raise
+        replicas.mark_down(bind)
+        return engine, _catalog_etag(engine)
+
+
+def _catalog_changed(*skus):
+    """Drop this process's cached catalog state after a write; no SKUs clears the SKU cache."""
+    for cached in _catalog_versions.values():
+        cached["expires"] = 0.0
+    if skus:
+        sku_cache.discard(*(sku.strip().lower() for sku in skus))
+    else:
+        sku_cache.clear()
 
 
 class ProductCreate(BaseModel):
@@ -35,6 +101,20 @@ class ProductUpdate(BaseModel):
     active: Optional[bool] = None
 
 
+class ProductLookup(BaseModel):
+    skus: List[str]
+
+
+class InventoryItem(BaseModel):
+    sku: str
+    price: Optional[float] = None
+    stock_quantity: Optional[int] = None
+
+
+class InventoryUpdate(BaseModel):
+    items: List[InventoryItem]
+
+
 class ProductResponse(BaseModel):
     id: int
     sku: str
@@ -50,7 +130,8 @@ class ProductResponse(BaseModel):
 
 
 @router.get("/")
-async def list_products(
+def list_products(
+    request: Request,
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1, le=100),
     search: Optional[str] = None,
@@ -62,7 +143,11 @@ async def list_products(
     List products with pagination and filtering.
     """
     try:
-        db = SessionLocal()
+        bind, etag = _read_target(request)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        db = SessionLocal(bind=bind)
         offset = (page - 1) * limit
         
         # Build WHERE clause
@@ -93,39 +178,244 @@ async def list_products(
         
         # Get products
         query = f"""
-            SELECT id, sku, name, description, price, image_url, category, 
-                   stock_quantity, active, created_at, updated_at
+            SELECT {PRODUCT_SELECT}
             FROM products 
             WHERE {where_sql}
-            ORDER BY created_at DESC
+            ORDER BY created_at DESC, id DESC
             LIMIT :limit OFFSET :offset
         """
         params.update({'limit': limit, 'offset': offset})
         
         result = db.execute(text(query), params)
-        products = [dict(row._mapping) for row in result]
+        products = rows_to_dicts(PRODUCT_COLUMNS, result.all())
         
         db.close()
         
-        return {
+        return json_response({
             "products": products,
             "total": total,
             "page": page,
             "limit": limit,
             "pages": (total + limit - 1) // limit
-        }
+        }, etag=etag)
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _facet_counts(rows, category: Optional[str], active: Optional[bool]):
+    """
+    Fold (category, active, count) rows into facet counts. Each facet ignores
+    its own filter, so the UI can still show the other options' counts.
+    Categories are grouped case-insensitively, like the ?category= filter.
+    """
+    categories = {}
+    active_counts = {"true": 0, "false": 0}
+    total = 0
+    for row_category, row_active, count in rows:
+        if not count:
+            continue
+        key = row_category.lower()
+        if active is None or row_active == active:
+            entry = categories.setdefault(key, {"category": row_category or None, "count": 0})
+            entry["count"] += count
+        if not category or key == category.lower():
+            active_counts["true" if row_active else "false"] += count
+            if active is None or row_active == active:
+                total += count
+
+    return {
+        "categories": sorted(categories.values(), key=lambda c: (-c["count"], c["category"] or "")),
+        "active": active_counts,
+        "total": total,
+    }
+
+
+@router.get("/facets")
+def get_facets(
+    request: Request,
+    search: Optional[str] = None,
+    sku: Optional[str] = None,
+    category: Optional[str] = None,
+    active: Optional[bool] = None
+):
+    """
+    Product counts per category and active state for the current filters.
+    Served from the trigger-maintained product_facets table unless a
+    search or SKU filter forces a live count.
+    """
+    try:
+        bind, etag = _read_target(request)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        db = SessionLocal(bind=bind)
+
+        if search or sku:
+            where_clauses = []
+            params = {}
+            if search:
+                where_clauses.append("(LOWER(name) LIKE :search OR LOWER(description) LIKE :search OR LOWER(sku) LIKE :search)")
+                params['search'] = f"%{search.lower()}%"
+            if sku:
+                where_clauses.append("LOWER(sku) = :sku")
+                params['sku'] = sku.lower()
+            rows = db.execute(text(f"""
+                SELECT COALESCE(category, '') AS category, active, COUNT(*) AS count
+                FROM products
+                WHERE {" AND ".join(where_clauses)}
+                GROUP BY 1, 2
+            """), params).fetchall()
+            source = "live"
+        else:
+            rows = db.execute(text(
+                "SELECT category, active, count FROM product_facets WHERE count > 0"
+            )).fetchall()
+            source = "aggregate"
+
+        db.close()
+
+        facets = _facet_counts(rows, category, active)
+        facets["source"] = source
+        return json_response(facets, etag=etag)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/lookup")
+def lookup_products(request: Request, lookup: ProductLookup):
+    """
+    Resolve a list of SKUs case-insensitively in one indexed query.
+    Returns the products found, in request order, and the SKUs that were not.
+    """
+    try:
+        if len(lookup.skus) > LOOKUP_MAX_SKUS:
+            raise HTTPException(status_code=400, detail=f"At most {LOOKUP_MAX_SKUS} SKUs per lookup")
+
+        # Keep the first spelling of each SKU, in request order
+        requested = {}
+        for sku in lookup.skus:
+            key = sku.strip().lower()
+            if key and key not in requested:
+                requested[key] = sku
+
+        found = sku_cache.get_many(requested)
+        pending = [key for key in requested if key not in found]
+
+        if pending:
+            # Same replica choice and fallback as the GET endpoints; a POST has no ETag to send
+            bind, _ = _read_target(request)
+            db = SessionLocal(bind=bind)
+            result = db.execute(
+                text(f"""
+                    SELECT {PRODUCT_SELECT}
+                    FROM products
+                    WHERE LOWER(sku) = ANY(:skus)
+                """),
+                {"skus": pending}
+            )
+            fetched = {p["sku"].lower(): p for p in rows_to_dicts(PRODUCT_COLUMNS, result.all())}
+            db.close()
+
+            # Misses are cached too, so repeated unknown SKUs skip the query
+            sku_cache.set_many((key, fetched.get(key)) for key in pending)
+            found.update(fetched)
+
+        products = [found[key] for key in requested if found.get(key)]
+        missing = [sku for key, sku in requested.items() if not found.get(key)]
+
+        return json_response({
+            "products": products,
+            "missing": missing,
+            "requested": len(requested),
+            "found": len(products)
+        })
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.patch("/inventory")
+def update_inventory(update: InventoryUpdate, response: Response):
+    """
+    Set price and/or stock_quantity of existing products by SKU in one statement.
+    Null fields are left alone and products whose values already match are
+    not written. Neither column is indexed, so the updates can stay HOT.
+    """
+    try:
+        if len(update.items) > INVENTORY_MAX_ITEMS:
+            raise HTTPException(status_code=400, detail=f"At most {INVENTORY_MAX_ITEMS} items per update")
+
+        # Last entry per SKU wins, as in imports
+        items = {}
+        for item in update.items:
+            key = item.sku.strip().lower()
+            if key:
+                items[key] = item
+
+        db = SessionLocal()
+        result = db.execute(
+            text("""
+                WITH v AS (
+                    SELECT * FROM unnest(CAST(:skus AS text[]), CAST(:prices AS numeric[]), CAST(:stocks AS integer[]))
+                        AS v(sku, price, stock_quantity)
+                )
+                UPDATE products p
+                SET price = COALESCE(v.price, p.price),
+                    stock_quantity = COALESCE(v.stock_quantity, p.stock_quantity),
+                    updated_at = NOW()
+                FROM v
+                WHERE LOWER(p.sku) = v.sku
+                  AND (COALESCE(v.price, p.price), COALESCE(v.stock_quantity, p.stock_quantity))
+                      IS DISTINCT FROM (p.price, p.stock_quantity)
+                RETURNING p.id, p.sku, p.price::float8, p.stock_quantity
+            """),
+            {
+                "skus": list(items),
+                "prices": [item.price for item in items.values()],
+                "stocks": [item.stock_quantity for item in items.values()],
+            }
+        )
+        updated = rows_to_dicts(("id", "sku", "price", "stock_quantity"), result.all())
+        found = {row[0] for row in db.execute(
+            text("SELECT LOWER(sku) FROM products WHERE LOWER(sku) = ANY(:skus)"),
+            {"skus": list(items)}
+        )}
+        db.commit()
+        mark_write(response, db)
+        db.close()
+
+        if updated:
+            _catalog_changed(*(p["sku"] for p in updated))
+            # One event for the whole batch, like bulk delete
+            fire_event("product.updated", {"inventory": True, "count": len(updated), "products": updated})
+
+        return {
+            "updated": len(updated),
+            "unchanged": len(found) - len(updated),
+            "missing": [item.sku for key, item in items.items() if key not in found]
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/{product_id}")
-async def get_product(product_id: int):
+def get_product(request: Request, product_id: int):
     """Get a single product by ID."""
     try:
-        db = SessionLocal()
+        bind, etag = _read_target(request)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        db = SessionLocal(bind=bind)
         result = db.execute(
-            text("SELECT * FROM products WHERE id = :id"),
+            text(f"SELECT {PRODUCT_SELECT} FROM products WHERE id = :id"),
             {"id": product_id}
         ).fetchone()
         db.close()
@@ -133,7 +423,7 @@ async def get_product(product_id: int):
         if not result:
             raise HTTPException(status_code=404, detail="Product not found")
         
-        return dict(result._mapping)
+        return json_response(dict(zip(PRODUCT_COLUMNS, result)), etag=etag)
     
     except HTTPException:
         raise
@@ -142,7 +432,7 @@ async def get_product(product_id: int):
 
 
 @router.post("/")
-async def create_product(product: ProductCreate):
+def create_product(product: ProductCreate, response: Response):
     """Create a new product."""
     try:
         db = SessionLocal()
@@ -177,7 +467,10 @@ async def create_product(product: ProductCreate):
         db.commit()
         
         product_id = result.fetchone()[0]
+        mark_write(response, db)
         db.close()
+        _catalog_changed(product.sku)
+        fire_event("product.created", {"id": product_id, **product.dict()})
         
         return {"id": product_id, "message": "Product created successfully"}
     
@@ -188,14 +481,14 @@ async def create_product(product: ProductCreate):
 
 
 @router.put("/{product_id}")
-async def update_product(product_id: int, product: ProductUpdate):
+def update_product(product_id: int, product: ProductUpdate, response: Response):
     """Update an existing product."""
     try:
         db = SessionLocal()
         
         # Check if product exists
         existing = db.execute(
-            text("SELECT id FROM products WHERE id = :id"),
+            text("SELECT id, sku FROM products WHERE id = :id"),
             {"id": product_id}
         ).fetchone()
         
@@ -214,17 +507,24 @@ async def update_product(product_id: int, product: ProductUpdate):
         if not update_fields:
             raise HTTPException(status_code=400, detail="No fields to update")
         
+        fields = [field for field in params if field != "id"]
         update_fields.append("updated_at = NOW()")
         
+        # Values that already match write nothing: no new row version, event or cache flush
         query = f"""
             UPDATE products 
             SET {', '.join(update_fields)}
             WHERE id = :id
+              AND ({', '.join(fields)}) IS DISTINCT FROM ({', '.join(f':{field}' for field in fields)})
         """
         
-        db.execute(text(query), params)
+        changed = db.execute(text(query), params).rowcount
         db.commit()
+        mark_write(response, db)
         db.close()
+        if changed:
+            _catalog_changed(existing.sku, params.get("sku", existing.sku))
+            fire_event("product.updated", {"id": product_id, **{k: v for k, v in params.items() if k != "id"}})
         
         return {"message": "Product updated successfully"}
     
@@ -235,21 +535,25 @@ async def update_product(product_id: int, product: ProductUpdate):
 
 
 @router.delete("/{product_id}")
-async def delete_product(product_id: int):
+def delete_product(product_id: int, response: Response):
     """Delete a product."""
     try:
         db = SessionLocal()
         
         result = db.execute(
-            text("DELETE FROM products WHERE id = :id RETURNING id"),
+            text("DELETE FROM products WHERE id = :id RETURNING sku"),
             {"id": product_id}
         )
+        deleted = result.fetchone()
         
-        if not result.fetchone():
+        if not deleted:
             raise HTTPException(status_code=404, detail="Product not found")
         
         db.commit()
+        mark_write(response, db)
         db.close()
+        _catalog_changed(deleted.sku)
+        fire_event("product.deleted", {"id": product_id, "sku": deleted.sku})
         
         return {"message": "Product deleted successfully"}
     
@@ -260,7 +564,7 @@ async def delete_product(product_id: int):
 
 
 @router.delete("/")
-async def bulk_delete_products():
+def bulk_delete_products(response: Response):
     """Delete ALL products (with caution!)."""
     try:
         db = SessionLocal()
@@ -269,7 +573,11 @@ async def bulk_delete_products():
         count = len(result.fetchall())
         
         db.commit()
+        mark_write(response, db)
         db.close()
+        _catalog_changed()
+        # One event for the whole catalog rather than one per product
+        fire_event("product.deleted", {"all": True, "count": count})
         
         return {"message": f"Deleted {count} products", "count": count}
     
@@ -278,23 +586,29 @@ async def bulk_delete_products():
 
 
 @router.get("/stats/summary")
-async def get_stats():
+def get_stats(request: Request):
     """Get product statistics."""
     try:
-        db = SessionLocal()
+        bind, etag = _read_target(request)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        db = SessionLocal(bind=bind)
         
+        # product_facets holds one row per (category, active), so this never scans products
         stats = db.execute(text("""
-            SELECT 
-                COUNT(*) as total,
-                COUNT(*) FILTER (WHERE active = true) as active,
-                COUNT(*) FILTER (WHERE active = false) as inactive,
-                COUNT(DISTINCT category) as categories
-            FROM products
+            SELECT
+                COALESCE(SUM(count), 0)::bigint as total,
+                COALESCE(SUM(count) FILTER (WHERE active = true), 0)::bigint as active,
+                COALESCE(SUM(count) FILTER (WHERE active = false), 0)::bigint as inactive,
+                COUNT(DISTINCT category) FILTER (WHERE category <> '') as categories
+            FROM product_facets
+            WHERE count > 0
         """)).fetchone()
         
         db.close()
         
-        return dict(stats._mapping)
+        return json_response(dict(stats._mapping), etag=etag)
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -1,87 +1,142 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Response
 from fastapi.responses import JSONResponse, StreamingResponse
-from celery.result import AsyncResult
-import os
-import shutil
-from tasks.process_csv import process_csv_task
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import text
+import uuid
+from app.database import engine as db_engine
+from app.jobs import jobs, job_state
+from app.replicas import mark_write
+from tasks.celery_app import celery
+from tasks.names import PROCESS_CSV_TASK, ENGINES, MODES
+from tasks.progress import publish_state, QUEUED_STATE
+from tasks.queues import import_queue_for, admit_import, release_import, IMPORTS_PRIORITY_QUEUE
+from tasks.uploads import store_upload, release_upload, claim_inflight, clear_inflight, find_result
+from typing import Optional
 import json
-import asyncio
 
 router = APIRouter(tags=["upload"])
 
-UPLOAD_DIR = "/tmp/uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+def _catalog_version():
+    with db_engine.connect() as conn:
+        return conn.execute(text("SELECT version FROM catalog_version")).scalar()
 
 @router.post("/upload")
-async def upload_csv(file: UploadFile = File(...)):
+def upload_csv(
+    file: UploadFile = File(...),
+    engine: str = Query("python"),
+    mode: str = Query("upsert"),
+    preview: bool = Query(False),
+    sample: Optional[float] = Query(None, gt=0, le=1)
+):
     """
     Upload CSV file and queue it for processing.
+    engine: 'python' (de-duplicate in the worker) or 'postgres' (de-duplicate in the database).
+    mode: 'upsert', 'sync' (full snapshot, deactivates missing SKUs), 'delta' (per-row 'op' column)
+    'replace' (full snapshot swapped in as a new table; missing SKUs are removed)
+    or 'inventory' (price/stock feed; updates existing SKUs only).
+    preview: report what the import would do without writing; sample (0-1) previews that fraction of SKUs.
     Returns job_id for tracking.
+    A plain def: hashing and storing the file, Redis and the database all block,
+    so FastAPI runs it in the threadpool rather than on the event loop.
     """
     try:
         if not file.filename.endswith('.csv'):
             raise HTTPException(status_code=400, detail="Only CSV files are allowed")
         
-        # Save file
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
+        if engine not in ENGINES:
+            raise HTTPException(status_code=400, detail=f"engine must be one of: {', '.join(ENGINES)}")
+        
+        if mode not in MODES:
+            raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(MODES)}")
+        
+        if sample is not None and not preview:
+            raise HTTPException(status_code=400, detail="sample is only supported with preview=true")
+        
+        # Save file under its content hash
+        job_id = str(uuid.uuid4())
+        sha256, file_path, size = store_upload(file.file, job_id)
+        response = {
+            "status": "queued",
+            "filename": file.filename,
+            "sha256": sha256,
+            "engine": engine,
+            "mode": mode,
+            "preview": preview,
+            "sample": sample
+        }
+        
+        if not preview:
+            # Same file, same options and nothing written since: importing it again would change nothing
+            previous = find_result(sha256, engine, mode)
+            if previous and previous["catalog_version"] == _catalog_version():
+                release_upload(file_path, job_id)
+                reused = JSONResponse(status_code=200, content={
+                    **response, "job_id": previous["job_id"], "status": "completed",
+                    "reused": True, "result": previous["result"]
+                })
+                mark_write(reused)
+                return reused
+            # Same file already queued or running with these options: follow that job
+            running = claim_inflight(sha256, engine, mode, job_id)
+            if running:
+                release_upload(file_path, job_id)
+                return JSONResponse(status_code=200, content={**response, "job_id": running, "reused": True})
         
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Small files go to the priority queue; large ones are admitted against the queued-bytes budget
+        queue = import_queue_for(size)
+        
+        if preview:
+            # Previews write nothing; sampled ones finish in seconds, so they take the fast lane
+            if sample:
+                queue = IMPORTS_PRIORITY_QUEUE
+        elif not admit_import(job_id, size):
+            clear_inflight(file_path, engine, mode, job_id)
+            release_upload(file_path, job_id)
+            raise HTTPException(
+                status_code=503,
+                detail="Import queue is full, try again later",
+                headers={"Retry-After": "60"}
+            )
         
         # Queue the task
-        task = process_csv_task.delay(file_path)
+        try:
+            # Stored before the worker can publish anything newer, so status reads never fall back to Celery
+            publish_state(job_id, QUEUED_STATE)
+            task = celery.send_task(
+                PROCESS_CSV_TASK,
+                args=[file_path],
+                kwargs={"engine": engine, "mode": mode, "preview": preview, "sample": sample},
+                queue=queue,
+                task_id=job_id
+            )
+        except Exception:
+            if not preview:
+                release_import(job_id, size)
+                clear_inflight(file_path, engine, mode, job_id)
+            release_upload(file_path, job_id)
+            raise
         
-        return JSONResponse(
-            status_code=200,
-            content={
-                "job_id": task.id,
-                "status": "queued",
-                "filename": file.filename
-            }
-        )
+        return JSONResponse(status_code=200, content={**response, "job_id": task.id, "queue": queue})
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
 @router.get("/upload/status/{job_id}")
-async def get_upload_status(job_id: str):
+async def get_upload_status(job_id: str, response: Response):
     """
     Get the current status of an upload job.
     """
     try:
-        result = AsyncResult(job_id)
-        
-        if result.ready():
-            if result.successful():
-                return {
-                    "status": "completed",
-                    "progress": 100,
-                    "result": result.result
-                }
-            else:
-                return {
-                    "status": "failed",
-                    "progress": 0,
-                    "error": str(result.info)
-                }
-        else:
-            # Check for progress updates
-            info = result.info
-            if isinstance(info, dict):
-                return {
-                    "status": "processing",
-                    "progress": info.get("progress", 0),
-                    "current": info.get("current", 0),
-                    "total": info.get("total", 0),
-                    "message": info.get("message", "Processing...")
-                }
-            else:
-                return {
-                    "status": "processing",
-                    "progress": 0,
-                    "message": "Starting..."
-                }
+        state = await job_state(job_id)
+        if state["status"] == "completed":
+            # The import wrote on the primary; the client's next catalog reads should see it.
+            # mark_write may query the primary, so it runs in the threadpool
+            await run_in_threadpool(mark_write, response)
+        return state
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -91,46 +146,11 @@ async def get_upload_status(job_id: str):
 async def stream_upload_progress(job_id: str):
     """
     Server-Sent Events (SSE) endpoint for real-time progress updates.
+    Follows the job's published progress over the process's shared subscription.
     """
     async def event_generator():
-        result = AsyncResult(job_id)
-        
-        while not result.ready():
-            info = result.info
-            
-            if isinstance(info, dict):
-                data = {
-                    "status": "processing",
-                    "progress": info.get("progress", 0),
-                    "current": info.get("current", 0),
-                    "total": info.get("total", 0),
-                    "message": info.get("message", "Processing...")
-                }
-            else:
-                data = {
-                    "status": "processing",
-                    "progress": 0,
-                    "message": "Starting..."
-                }
-            
-            yield f"data: {json.dumps(data)}\n\n"
-            await asyncio.sleep(0.5)  # Poll every 500ms
-        
-        # Final result
-        if result.successful():
-            final_data = {
-                "status": "completed",
-                "progress": 100,
-                "result": result.result
-            }
-        else:
-            final_data = {
-                "status": "failed",
-                "progress": 0,
-                "error": str(result.info)
-            }
-        
-        yield f"data: {json.dumps(final_data)}\n\n"
+        async for state in jobs.stream(job_id, job_state):
+            yield f"data: {json.dumps(state)}\n\n"
     
     return StreamingResponse(
         event_generator(),
@@ -139,4 +159,4 @@ async def stream_upload_progress(job_id: str):
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
         }
-    )
\ No newline at end of file
+    )
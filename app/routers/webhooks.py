@@ -1,22 +1,20 @@
 from fastapi import APIRouter, HTTPException
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import text
 from pydantic import BaseModel, HttpUrl
 from typing import Optional, List
-import os
-from tasks.process_csv import trigger_webhook_test
+from app.database import SessionLocal
+from tasks.celery_app import celery
+from tasks.names import TRIGGER_WEBHOOK_TEST_TASK
+from tasks.webhooks import EVENT_TYPES, is_valid_pattern, bump_routing_version, get_health, reset_health
+import redis
 
 router = APIRouter(prefix="/webhooks", tags=["webhooks"])
 
-# Database setup
-DATABASE_URL = os.getenv('DATABASE_URL')
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(bind=engine)
-
 
 class WebhookCreate(BaseModel):
     url: str
-    event_type: str
+    event_type: Optional[str] = None
+    event_types: Optional[List[str]] = None
     description: Optional[str] = None
     is_active: bool = True
 
@@ -24,6 +22,7 @@ class WebhookCreate(BaseModel):
 class WebhookUpdate(BaseModel):
     url: Optional[str] = None
     event_type: Optional[str] = None
+    event_types: Optional[List[str]] = None
     description: Optional[str] = None
     is_active: Optional[bool] = None
 
@@ -32,8 +31,30 @@ class WebhookTest(BaseModel):
     test_data: dict = {"event": "test", "message": "This is a test webhook"}
 
 
+def _validate_event_types(event_types: List[str]):
+    """De-duplicate subscribed patterns, keeping order; 400 on unknown ones."""
+    patterns = list(dict.fromkeys(p.strip() for p in event_types if p.strip()))
+    if not patterns:
+        raise HTTPException(status_code=400, detail="At least one event type is required")
+    invalid = [p for p in patterns if not is_valid_pattern(p)]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Unknown event types: {', '.join(invalid)}")
+    return patterns
+
+
+def _with_health(webhooks: List[dict]):
+    """Attach each webhook's delivery health (None when Redis is unavailable)."""
+    try:
+        health = get_health([w["id"] for w in webhooks])
+    except redis.RedisError:
+        health = {}
+    for w in webhooks:
+        w["health"] = health.get(w["id"])
+    return webhooks
+
+
 @router.get("/")
-async def list_webhooks(active_only: bool = False):
+def list_webhooks(active_only: bool = False):
     """List all webhooks."""
     try:
         db = SessionLocal()
@@ -44,7 +65,7 @@ async def list_webhooks(active_only: bool = False):
         query += " ORDER BY created_at DESC"
         
         result = db.execute(text(query))
-        webhooks = [dict(row._mapping) for row in result]
+        webhooks = _with_health([dict(row._mapping) for row in result])
         
         db.close()
         return {"webhooks": webhooks, "total": len(webhooks)}
@@ -54,7 +75,7 @@ async def list_webhooks(active_only: bool = False):
 
 
 @router.get("/{webhook_id}")
-async def get_webhook(webhook_id: int):
+def get_webhook(webhook_id: int):
     """Get a single webhook by ID."""
     try:
         db = SessionLocal()
@@ -67,7 +88,7 @@ async def get_webhook(webhook_id: int):
         if not result:
             raise HTTPException(status_code=404, detail="Webhook not found")
         
-        return dict(result._mapping)
+        return _with_health([dict(result._mapping)])[0]
     
     except HTTPException:
         raise
@@ -76,20 +97,24 @@ async def get_webhook(webhook_id: int):
 
 
 @router.post("/")
-async def create_webhook(webhook: WebhookCreate):
+def create_webhook(webhook: WebhookCreate):
     """Create a new webhook."""
     try:
+        event_types = _validate_event_types(
+            webhook.event_types if webhook.event_types is not None else [webhook.event_type or ""]
+        )
         db = SessionLocal()
         
         result = db.execute(
             text("""
-                INSERT INTO webhooks (url, event_type, description, is_active)
-                VALUES (:url, :event_type, :description, :is_active)
+                INSERT INTO webhooks (url, event_type, event_types, description, is_active)
+                VALUES (:url, :event_type, :event_types, :description, :is_active)
                 RETURNING id
             """),
             {
                 "url": webhook.url,
-                "event_type": webhook.event_type,
+                "event_type": event_types[0],
+                "event_types": event_types,
                 "description": webhook.description,
                 "is_active": webhook.is_active
             }
@@ -98,33 +123,44 @@ async def create_webhook(webhook: WebhookCreate):
         
         webhook_id = result.fetchone()[0]
         db.close()
+        bump_routing_version()
         
         return {"id": webhook_id, "message": "Webhook created successfully"}
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.put("/{webhook_id}")
-async def update_webhook(webhook_id: int, webhook: WebhookUpdate):
+def update_webhook(webhook_id: int, webhook: WebhookUpdate):
     """Update an existing webhook."""
     try:
         db = SessionLocal()
         
         # Check if webhook exists
         existing = db.execute(
-            text("SELECT id FROM webhooks WHERE id = :id"),
+            text("SELECT id, event_type FROM webhooks WHERE id = :id"),
             {"id": webhook_id}
         ).fetchone()
         
         if not existing:
             raise HTTPException(status_code=404, detail="Webhook not found")
         
+        changes = webhook.dict(exclude_unset=True)
+        if changes.get("event_types") is not None:
+            changes["event_types"] = _validate_event_types(changes["event_types"])
+            changes["event_type"] = changes["event_types"][0]
+        elif changes.get("event_type") is not None and changes["event_type"] != existing.event_type:
+            # Single-type clients replace the whole subscription
+            changes["event_types"] = _validate_event_types([changes["event_type"]])
+        
         # Build update query
         update_fields = []
         params = {"id": webhook_id}
         
-        for field, value in webhook.dict(exclude_unset=True).items():
+        for field, value in changes.items():
             if value is not None:
                 update_fields.append(f"{field} = :{field}")
                 params[field] = value
@@ -143,6 +179,7 @@ async def update_webhook(webhook_id: int, webhook: WebhookUpdate):
         db.execute(text(query), params)
         db.commit()
         db.close()
+        bump_routing_version()
         
         return {"message": "Webhook updated successfully"}
     
@@ -153,7 +190,7 @@ async def update_webhook(webhook_id: int, webhook: WebhookUpdate):
 
 
 @router.delete("/{webhook_id}")
-async def delete_webhook(webhook_id: int):
+def delete_webhook(webhook_id: int):
     """Delete a webhook."""
     try:
         db = SessionLocal()
@@ -168,6 +205,11 @@ async def delete_webhook(webhook_id: int):
         
         db.commit()
         db.close()
+        bump_routing_version()
+        try:
+            reset_health(webhook_id)
+        except redis.RedisError:
+            pass
         
         return {"message": "Webhook deleted successfully"}
     
@@ -178,7 +220,7 @@ async def delete_webhook(webhook_id: int):
 
 
 @router.post("/{webhook_id}/test")
-async def test_webhook(webhook_id: int, test_data: WebhookTest):
+def test_webhook(webhook_id: int, test_data: WebhookTest):
     """Test a webhook by sending a test request."""
     try:
         db = SessionLocal()
@@ -196,7 +238,7 @@ async def test_webhook(webhook_id: int, test_data: WebhookTest):
         db.close()
         
         # Trigger webhook test asynchronously
-        task = trigger_webhook_test.delay(webhook['url'], test_data.test_data)
+        task = celery.send_task(TRIGGER_WEBHOOK_TEST_TASK, args=[webhook['url'], test_data.test_data])
         
         return {
             "message": "Webhook test queued",
@@ -210,8 +252,31 @@ async def test_webhook(webhook_id: int, test_data: WebhookTest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/{webhook_id}/health/reset")
+def reset_webhook_health(webhook_id: int):
+    """Clear a webhook's delivery health and close its circuit breaker."""
+    try:
+        db = SessionLocal()
+        exists = db.execute(
+            text("SELECT 1 FROM webhooks WHERE id = :id"),
+            {"id": webhook_id}
+        ).fetchone()
+        db.close()
+        
+        if not exists:
+            raise HTTPException(status_code=404, detail="Webhook not found")
+        
+        reset_health(webhook_id)
+        return {"message": "Webhook health reset"}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/{webhook_id}/toggle")
-async def toggle_webhook(webhook_id: int):
+def toggle_webhook(webhook_id: int):
     """Toggle webhook active status."""
     try:
         db = SessionLocal()
@@ -232,6 +297,7 @@ async def toggle_webhook(webhook_id: int):
         
         db.commit()
         db.close()
+        bump_routing_version()
         
         return {"message": "Webhook toggled", "is_active": row[0]}
     
@@ -243,14 +309,9 @@ async def toggle_webhook(webhook_id: int):
 
 @router.get("/events/types")
 async def get_event_types():
-    """Get list of available event types."""
+    """Get list of available event types, and the wildcard patterns that can be subscribed to."""
+    prefixes = dict.fromkeys(event.split(".")[0] + ".*" for event in EVENT_TYPES)
     return {
-        "event_types": [
-            "product.created",
-            "product.updated",
-            "product.deleted",
-            "import.started",
-            "import.completed",
-            "import.failed"
-        ]
+        "event_types": list(EVENT_TYPES),
+        "patterns": list(prefixes) + ["*"]
     }
\ No newline at end of file
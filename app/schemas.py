@@ -3,9 +3,12 @@ from typing import Optional
 
 class ProductBase(BaseModel):
     sku: str
-    name: Optional[str] = None
+    name: str
     description: Optional[str] = None
     price: Optional[float] = None
+    image_url: Optional[str] = None
+    category: Optional[str] = None
+    stock_quantity: Optional[int] = 0
     active: Optional[bool] = True
 
 class ProductCreate(ProductBase):
@@ -22,8 +25,9 @@ class ProductOut(ProductBase):
 
 class WebhookBase(BaseModel):
     url: AnyHttpUrl
-    event_types: Optional[str] = "import_complete"
-    enabled: Optional[bool] = True
+    event_type: str
+    description: Optional[str] = None
+    is_active: Optional[bool] = True
 
 class WebhookOut(WebhookBase):
     id: int
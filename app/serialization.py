@@ -0,0 +1,48 @@
+"""
+Fast JSON responses for the product read endpoints.
+
+Rows are serialized with orjson straight to bytes, skipping FastAPI's
+jsonable_encoder walk over every field. Queries should return price as
+float8 so the rows contain only types orjson handles natively.
+"""
+from decimal import Decimal
+
+import orjson
+from fastapi import Request, Response
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def rows_to_dicts(columns, rows):
+    """Zip plain result tuples with their column names."""
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def json_response(content, etag: str = None, status_code: int = 200):
+    headers = {"ETag": etag} if etag else None
+    return Response(
+        content=orjson.dumps(content, default=_default),
+        status_code=status_code,
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+def etag_matches(request: Request, etag: str):
+    """True when the request's If-None-Match already names `etag`."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def not_modified(etag: str):
+    return Response(status_code=304, headers={"ETag": etag})
@@ -0,0 +1,117 @@
+"""
+API load test for the product read endpoints.
+
+Usage:
+    python -m benchmarks.bench_api --base-url http://localhost:8000 --concurrency 16 --requests 2000
+    python -m benchmarks.bench_api --scenarios list_deep_page,search --concurrency 64
+
+Each scenario is run separately at the given concurrency so results
+are comparable run over run.
+"""
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.common import latency_summary, write_result
+from benchmarks.generate_catalog import CATEGORIES, NOUNS
+
+
+def _scenarios(total_products: int, limit: int):
+    last_page = max(1, (total_products + limit - 1) // limit)
+    return {
+        "list_first_page": lambda rnd: ("/products/", {"page": 1, "limit": limit}),
+        "list_deep_page": lambda rnd: ("/products/", {"page": rnd.randint(max(1, last_page - 100), last_page), "limit": limit}),
+        "search": lambda rnd: ("/products/", {"search": rnd.choice(NOUNS).lower(), "limit": limit}),
+        "filter_category": lambda rnd: ("/products/", {"category": rnd.choice(CATEGORIES), "limit": limit}),
+        "filter_active": lambda rnd: ("/products/", {"active": rnd.choice(["true", "false"]), "limit": limit}),
+        "sku_lookup": lambda rnd: ("/products/", {"sku": f"SKU-{rnd.randrange(max(1, total_products)):09d}"}),
+        "stats_summary": lambda rnd: ("/products/stats/summary", {}),
+    }
+
+
+def run_scenario(base_url: str, build_request, concurrency: int, total_requests: int, seed: int = 42):
+    """Fire `total_requests` requests from `concurrency` threads and summarize latencies."""
+    latencies = []
+    errors = {}
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(i):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        path, params = build_request(random.Random(seed + i))
+        started = time.perf_counter()
+        try:
+            response = session.get(base_url + path, params=params, timeout=60)
+            ok = response.status_code == 200
+            key = str(response.status_code)
+        except requests.RequestException as e:
+            ok = False
+            key = type(e).__name__
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with lock:
+            if ok:
+                latencies.append(elapsed_ms)
+            else:
+                errors[key] = errors.get(key, 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total_requests)))
+    wall = time.perf_counter() - started
+
+    summary = latency_summary(latencies)
+    summary.update({
+        "requests": total_requests,
+        "errors": sum(errors.values()),
+        "error_breakdown": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(total_requests / wall, 1) if wall else None,
+    })
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test list_products and /products/stats/summary")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per scenario")
+    parser.add_argument("--limit", type=int, default=50, help="Page size for list scenarios")
+    parser.add_argument("--scenarios", help="Comma-separated subset of scenarios (default: all)")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests per scenario")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Result JSON path (default: benchmarks/results/)")
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip("/")
+    stats = requests.get(f"{base_url}/products/stats/summary", timeout=60).json()
+    total_products = stats.get("total", 0)
+
+    scenarios = _scenarios(total_products, args.limit)
+    selected = args.scenarios.split(",") if args.scenarios else list(scenarios)
+    unknown = [name for name in selected if name not in scenarios]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+
+    metrics = {}
+    for name in selected:
+        if args.warmup:
+            run_scenario(base_url, scenarios[name], args.concurrency, args.warmup, seed=args.seed)
+        metrics[name] = run_scenario(base_url, scenarios[name], args.concurrency, args.requests, seed=args.seed)
+        m = metrics[name]
+        print(f"{name:16s} p50={m.get('p50_ms')}ms p99={m.get('p99_ms')}ms "
+              f"rps={m['throughput_rps']} errors={m['errors']}")
+
+    params = vars(args).copy()
+    params["catalog_size"] = total_products
+    path = write_result("api", params, metrics, args.output)
+    print(f"Result written to {path}")
+
+
+if __name__ == "__main__":
+    main()
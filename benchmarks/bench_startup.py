@@ -0,0 +1,137 @@
+"""
+API cold-start and memory benchmark.
+
+Usage:
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --runs 3 --serve "gunicorn -c gunicorn.conf.py app.main:app" --port 8000
+
+Import mode starts a fresh interpreter per run, imports app.main and
+reports import time, peak RSS and whether worker-only modules were loaded.
+With --serve, it also starts the given server command, measures the time
+until GET /health answers, and sums the RSS and PSS of the whole process
+tree. PSS splits pages shared between processes (e.g. copy-on-write after a
+preloading fork) among them, so it is the better measure of total memory.
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import requests
+
+from benchmarks.common import latency_summary, write_result
+
+# Modules only the Celery worker needs; the API should not load them
+WORKER_MODULES = ("tasks.process_csv", "tasks.dedupe", "tasks.delivery", "requests")
+
+IMPORT_PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    "import_ms": elapsed * 1000,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "modules": len(sys.modules),
+    "worker_modules": [m for m in %r if m in sys.modules],
+}))
+"""
+
+
+def measure_import():
+    out = subprocess.check_output(
+        [sys.executable, "-c", IMPORT_PROBE % (WORKER_MODULES,)],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def _tree_memory_mb(pid: int):
+    """Sum RSS and PSS of `pid` and its descendants (Linux /proc)."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+                children.setdefault(ppid, []).append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    rss_kb, pss_kb, stack, processes = 0, 0, [pid], 0
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f"/proc/{current}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Rss:"):
+                        rss_kb += int(line.split()[1])
+                    elif line.startswith("Pss:"):
+                        pss_kb += int(line.split()[1])
+            processes += 1
+        except OSError:
+            continue
+        stack.extend(children.get(current, []))
+    return rss_kb / 1024, pss_kb / 1024, processes
+
+
+def measure_serve(command: str, port: int, timeout: float):
+    started = time.perf_counter()
+    proc = subprocess.Popen(command, shell=True, start_new_session=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            time.sleep(0.05)
+        else:
+            raise RuntimeError(f"Server did not answer /health within {timeout}s")
+        ready_ms = (time.perf_counter() - started) * 1000
+        # Let the remaining workers finish booting before sampling memory
+        time.sleep(2)
+        rss_mb, pss_mb, processes = _tree_memory_mb(proc.pid)
+        return {"ready_ms": ready_ms, "rss_mb": rss_mb, "pss_mb": pss_mb, "processes": processes}
+    finally:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--serve", help="Server command to time until /health answers")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.runs)]
+    metrics = {
+        "import": latency_summary([r["import_ms"] for r in imports]),
+        "import_rss_mb": round(max(r["rss_mb"] for r in imports), 1),
+        "modules_loaded": imports[-1]["modules"],
+        "worker_modules_loaded": imports[-1]["worker_modules"],
+    }
+    print(f"import: mean {metrics['import']['mean_ms']:.0f} ms, RSS {metrics['import_rss_mb']} MB, "
+          f"{metrics['modules_loaded']} modules, worker modules: {metrics['worker_modules_loaded'] or 'none'}")
+
+    if args.serve:
+        serves = [measure_serve(args.serve, args.port, args.timeout) for _ in range(args.runs)]
+        metrics["serve_ready"] = latency_summary([r["ready_ms"] for r in serves])
+        metrics["serve_rss_mb"] = round(max(r["rss_mb"] for r in serves), 1)
+        metrics["serve_pss_mb"] = round(max(r["pss_mb"] for r in serves), 1)
+        metrics["serve_processes"] = serves[-1]["processes"]
+        print(f"serve: ready in {metrics['serve_ready']['mean_ms']:.0f} ms, RSS {metrics['serve_rss_mb']} MB, "
+              f"PSS {metrics['serve_pss_mb']} MB across {metrics['serve_processes']} processes")
+
+    path = write_result("startup", vars(args), metrics, args.output)
+    print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
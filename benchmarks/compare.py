@@ -0,0 +1,99 @@
+"""
+Compare two benchmark result files and flag regressions.
+
+Usage:
+    python -m benchmarks.compare baseline.json candidate.json --threshold 0.10
+
+Exits with status 1 when any tracked metric regressed by more than the threshold.
+"""
+import argparse
+import json
+import sys
+
+# Metric name suffixes and whether a higher value is better
+HIGHER_IS_BETTER = ("rows_per_second", "mb_per_second", "throughput_rps")
+LOWER_IS_BETTER = ("_ms", "seconds", "peak_rss_mb", "errors")
+SKIP_KEYS = {"runs", "task_result", "error_breakdown", "count", "requests", "input_rows", "file_bytes"}
+
+
+def _flatten(metrics: dict, prefix: str = ""):
+    flat = {}
+    for key, value in metrics.items():
+        if key in SKIP_KEYS:
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def _direction(name: str):
+    leaf = name.rsplit(".", 1)[-1]
+    if leaf.endswith(HIGHER_IS_BETTER):
+        return 1
+    if leaf.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0
+
+
+def compare(baseline: dict, candidate: dict, threshold: float = 0.10):
+    """Return a list of per-metric comparisons between two results."""
+    base = _flatten(baseline.get("metrics", {}))
+    cand = _flatten(candidate.get("metrics", {}))
+    rows = []
+
+    for name in sorted(set(base) & set(cand)):
+        direction = _direction(name)
+        if direction == 0:
+            continue
+        old, new = base[name], cand[name]
+        if old == 0:
+            change = 0.0 if new == 0 else float("inf")
+        else:
+            change = (new - old) / abs(old)
+        regressed = (change * direction) < -threshold
+        rows.append({
+            "metric": name,
+            "baseline": old,
+            "candidate": new,
+            "change": round(change, 4),
+            "regressed": regressed,
+        })
+
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result JSON files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative change counted as a regression (default 0.10 = 10%%)")
+    parser.add_argument("--json", action="store_true", help="Print the comparison as JSON")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    if baseline.get("benchmark") != candidate.get("benchmark"):
+        parser.error("Results are from different benchmarks")
+
+    rows = compare(baseline, candidate, args.threshold)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        for row in rows:
+            flag = "REGRESSION" if row["regressed"] else ""
+            print(f"{row['metric']:40s} {row['baseline']:>12} -> {row['candidate']:>12} "
+                  f"({row['change']:+.1%}) {flag}")
+
+    sys.exit(1 if any(row["regressed"] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Synthetic product catalog generator.
+
+Usage:
+    python -m benchmarks.generate_catalog --rows 500000 --output /tmp/products.csv
+    python -m benchmarks.generate_catalog --rows 1000000 --duplicate-ratio 0.2 --dirty-ratio 0.05
+"""
+import argparse
+import csv
+import random
+
+ALL_COLUMNS = ["sku", "name", "description", "price", "category", "stock_quantity", "image_url", "active"]
+DEFAULT_COLUMNS = ["name", "sku", "description", "price", "category", "stock_quantity"]
+
+CATEGORIES = [
+    "Electronics", "Office", "Home", "Garden", "Toys", "Sports",
+    "Books", "Grocery", "Beauty", "Automotive", "Clothing", "Tools",
+]
+ADJECTIVES = ["Compact", "Deluxe", "Classic", "Smart", "Portable", "Heavy-Duty", "Eco", "Premium"]
+NOUNS = ["Lamp", "Chair", "Speaker", "Backpack", "Kettle", "Drill", "Notebook", "Monitor", "Bottle"]
+WORDS = [
+    "durable", "lightweight", "stylish", "reliable", "ergonomic", "versatile",
+    "affordable", "powerful", "quiet", "modern", "rechargeable", "waterproof",
+]
+
+
+def _value(column: str, sku: str, rnd: random.Random):
+    if column == "sku":
+        return sku
+    if column == "name":
+        return f"{rnd.choice(ADJECTIVES)} {rnd.choice(NOUNS)} {sku[-6:]}"
+    if column == "description":
+        return " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(8, 40)))
+    if column == "price":
+        return f"{rnd.uniform(1, 2000):.2f}"
+    if column == "category":
+        return rnd.choice(CATEGORIES)
+    if column == "stock_quantity":
+        return str(rnd.randint(0, 5000))
+    if column == "image_url":
+        return f"https://cdn.example.com/img/{sku.lower()}.jpg"
+    if column == "active":
+        return "true" if rnd.random() > 0.1 else "false"
+    return ""
+
+
+def _dirty(row: dict, columns, rnd: random.Random):
+    """
+    Apply one kind of data the importer has to tolerate:
+    blank SKU, whitespace padding, empty optional fields,
+    or quotes/commas/newlines embedded in free text.
+    """
+    kind = rnd.randrange(4)
+    if kind == 0:
+        row["sku"] = rnd.choice(["", "   "])
+    elif kind == 1:
+        for col in columns:
+            row[col] = f"  {row[col]}  "
+    elif kind == 2:
+        for col in columns:
+            if col not in ("sku", "name"):
+                row[col] = ""
+    elif kind == 3 and "description" in row:
+        row["description"] = f'He said "it\'s great", really,\nsecond line: {row["description"]}'
+    return row
+
+
+def generate(output: str, rows: int, duplicate_ratio: float = 0.0, dirty_ratio: float = 0.0,
+             columns=None, seed: int = 42):
+    """
+    Write a synthetic catalog CSV and return a summary of what it contains.
+
+    duplicate_ratio: fraction of rows that repeat an earlier SKU (with randomized case).
+    dirty_ratio: fraction of rows with dirty data (see _dirty).
+    """
+    columns = list(columns or DEFAULT_COLUMNS)
+    if "sku" not in columns:
+        raise ValueError("columns must include 'sku'")
+    unknown = [col for col in columns if col not in ALL_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+
+    rnd = random.Random(seed)
+    unique = 0
+    duplicates = 0
+    dirty = 0
+
+    with open(output, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(columns)
+
+        for _ in range(rows):
+            if unique and rnd.random() < duplicate_ratio:
+                sku = f"SKU-{rnd.randrange(unique):09d}"
+                sku = sku.lower() if rnd.random() < 0.5 else sku
+                duplicates += 1
+            else:
+                sku = f"SKU-{unique:09d}"
+                unique += 1
+
+            row = {col: _value(col, sku, rnd) for col in columns}
+            if rnd.random() < dirty_ratio:
+                row = _dirty(row, columns, rnd)
+                dirty += 1
+
+            writer.writerow([row[col] for col in columns])
+
+    return {
+        "output": output,
+        "rows": rows,
+        "unique_skus": unique,
+        "duplicate_rows": duplicates,
+        "dirty_rows": dirty,
+        "columns": columns,
+        "seed": seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic product catalog CSV")
+    parser.add_argument("--output", default="products.csv")
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.1)
+    parser.add_argument("--dirty-ratio", type=float, default=0.01)
+    parser.add_argument("--columns", default=",".join(DEFAULT_COLUMNS),
+                        help=f"Comma-separated subset of: {','.join(ALL_COLUMNS)}")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    summary = generate(
+        args.output,
+        args.rows,
+        duplicate_ratio=args.duplicate_ratio,
+        dirty_ratio=args.dirty_ratio,
+        columns=[col.strip() for col in args.columns.split(",") if col.strip()],
+        seed=args.seed,
+    )
+    print(summary)
+
+
+if __name__ == "__main__":
+    main()
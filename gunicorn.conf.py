@@ -0,0 +1,45 @@
+"""
+Production serving: gunicorn preforks uvicorn workers.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+The app is imported once in the master (preload_app) and workers are forked
+from it, so they share its code pages copy-on-write and start without
+re-importing anything. Each worker then opens its own database connections.
+"""
+import os
+
+
+def available_cpus():
+    """CPUs this process may use: affinity mask, capped by a cgroup v2 CPU quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+# WEB_CONCURRENCY overrides; otherwise 2 x CPUs + 1, since requests mostly wait on Postgres and Redis
+workers = int(os.getenv("WEB_CONCURRENCY", str(available_cpus() * 2 + 1)))
+preload_app = True
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
+
+
+def post_fork(server, worker):
+    # Connections the master opened while importing must not be shared with the workers
+    from app.database import engine
+    from app.replicas import replicas
+    engine.dispose(close=False)
+    replicas.dispose(close=False)
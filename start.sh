@@ -1,15 +1,27 @@
 ﻿#!/bin/bash
 
-# 1. Start Celery in the background
-# We use '&' to put it in the background so the script continues to the next line.
-echo "Starting Celery worker..."
-celery -A tasks.celery_app.celery worker --loglevel=info &
+# ROLE picks what this container runs:
+#   web    - the API under gunicorn (gunicorn.conf.py)
+#   worker - the Celery worker with embedded beat
+#   all    - both (default; single-container deploys)
+ROLE=${ROLE:-all}
 
-# 2. Wait a moment for Celery to initialize (optional but helpful)
-sleep 5
+if [ "$ROLE" = "worker" ]; then
+  exec celery -A tasks.celery_app.celery worker --loglevel=info -Q imports,imports_priority,webhooks,webhooks_slow -B
+fi
+
+if [ "$ROLE" = "all" ]; then
+  # 1. Start Celery in the background
+  # We use '&' to put it in the background so the script continues to the next line.
+  echo "Starting Celery worker..."
+  celery -A tasks.celery_app.celery worker --loglevel=info -Q imports,imports_priority,webhooks,webhooks_slow -B &
+
+  # 2. Wait a moment for Celery to initialize (optional but helpful)
+  sleep 5
+fi
 
 # 3. Start FastAPI
-# We use 'exec' so that uvicorn becomes the main process (PID 1).
+# We use 'exec' so that gunicorn becomes the main process (PID 1).
 # This allows it to receive shutdown signals correctly.
 echo "Starting FastAPI..."
-exec uvicorn app.main:app --host 0.0.0.0 --port ${PORT:-8000}
\ No newline at end of file
+exec gunicorn -c gunicorn.conf.py app.main:app
\ No newline at end of file
@@ -1,5 +1,9 @@
 from celery import Celery
 import os
+from tasks.names import (
+    PROCESS_CSV_TASK, TRIGGER_WEBHOOK_TEST_TASK, DELIVER_WEBHOOK_TASK, COMPACT_PRODUCT_CHANGES_TASK, GC_UPLOADS_TASK,
+)
+from tasks.queues import IMPORTS_QUEUE, WEBHOOKS_QUEUE
 
 broker = os.getenv('CELERY_BROKER_URL', 'redis://redis:6379/1')
 backend = os.getenv('CELERY_RESULT_BACKEND', 'redis://redis:6379/2')
@@ -8,13 +12,46 @@ celery = Celery(
     'tasks',
     broker=broker,
     backend=backend,
-    include=['tasks.process_csv']   # <-- IMPORTANT
+    include=['tasks.process_csv', 'tasks.changes', 'tasks.delivery', 'tasks.uploads']   # <-- IMPORTANT
 )
 
 # OR autodiscover:
 celery.autodiscover_tasks(['tasks'])
+# shared_task proxies resolve the current app per thread; make this one the
+# default everywhere, including threadpool-run request handlers
+celery.set_default()
 
 celery.conf.task_serializer = 'json'
 celery.conf.result_serializer = 'json'
 celery.conf.accept_content = ['json']
 celery.conf.worker_max_tasks_per_child = 100
+
+# Imports and webhook deliveries run on separate queues (see tasks/queues.py);
+# workers must be started with -Q for the queues they should consume.
+celery.conf.task_routes = {
+    PROCESS_CSV_TASK: {'queue': IMPORTS_QUEUE},
+    TRIGGER_WEBHOOK_TEST_TASK: {'queue': WEBHOOKS_QUEUE},
+    DELIVER_WEBHOOK_TASK: {'queue': WEBHOOKS_QUEUE},
+}
+celery.conf.task_default_queue = IMPORTS_QUEUE
+# Reserve one task at a time so a worker busy with a huge file doesn't hold back queued jobs
+celery.conf.worker_prefetch_multiplier = 1
+
+# Imports are acked only when they finish (acks_late) and resume from checkpoints when
+# redelivered. An unacked message is redelivered after the visibility timeout, so it must
+# exceed the longest import.
+celery.conf.broker_transport_options = {
+    'visibility_timeout': int(os.getenv('CELERY_VISIBILITY_TIMEOUT', str(12 * 3600))),
+}
+
+# Periodic maintenance; run `celery -A tasks.celery_app.celery beat` once per deployment
+celery.conf.beat_schedule = {
+    'compact-product-changes': {
+        'task': COMPACT_PRODUCT_CHANGES_TASK,
+        'schedule': float(os.getenv('CHANGES_COMPACT_INTERVAL', '3600')),
+    },
+    'gc-uploads': {
+        'task': GC_UPLOADS_TASK,
+        'schedule': float(os.getenv('UPLOAD_GC_INTERVAL', '3600')),
+    },
+}
@@ -0,0 +1,80 @@
+from celery import shared_task
+import psycopg2
+import os
+
+# Superseded changes (the product has a newer one) are dropped after this long
+CHANGES_COMPACT_AFTER_SECONDS = int(os.getenv('CHANGES_COMPACT_AFTER_SECONDS', '3600'))
+# Every change is dropped after this long; consumers further behind must resync
+CHANGES_RETENTION_DAYS = int(os.getenv('CHANGES_RETENTION_DAYS', '7'))
+CHANGES_COMPACT_BATCH_SIZE = int(os.getenv('CHANGES_COMPACT_BATCH_SIZE', '10000'))
+
+
+def _delete_in_batches(conn, sql, params):
+    """
+    Repeat a batched DELETE (a statement returning the number of rows it
+    removed) until it removes less than a full batch, committing each batch.
+    """
+    total = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            removed = cur.fetchone()[0]
+        conn.commit()
+        total += removed
+        if removed < CHANGES_COMPACT_BATCH_SIZE:
+            return total
+
+
+@shared_task
+def compact_product_changes():
+    """
+    Shrink the product change feed. Consumers read the current product
+    state alongside each change, so only the newest change per product has
+    to survive compaction. Retention removes everything older and advances
+    product_changes_horizon past it.
+    """
+    conn = psycopg2.connect(os.getenv('DATABASE_URL'))
+    try:
+        superseded = _delete_in_batches(conn, """
+            WITH removed AS (
+                DELETE FROM product_changes
+                WHERE id IN (
+                    SELECT c.id
+                    FROM product_changes c
+                    WHERE c.changed_at < NOW() - make_interval(secs => %(after)s)
+                      AND EXISTS (
+                          SELECT 1 FROM product_changes newer
+                          WHERE newer.product_id = c.product_id
+                            AND (newer.txid, newer.id) > (c.txid, c.id)
+                      )
+                    LIMIT %(batch)s
+                )
+                RETURNING 1
+            )
+            SELECT COUNT(*) FROM removed
+        """, {"after": CHANGES_COMPACT_AFTER_SECONDS, "batch": CHANGES_COMPACT_BATCH_SIZE})
+
+        expired = _delete_in_batches(conn, """
+            WITH purged AS (
+                DELETE FROM product_changes
+                WHERE id IN (
+                    SELECT id FROM product_changes
+                    WHERE changed_at < NOW() - make_interval(days => %(days)s)
+                    ORDER BY txid, id
+                    LIMIT %(batch)s
+                )
+                RETURNING txid, id
+            ), newest AS (
+                SELECT txid, id FROM purged ORDER BY txid DESC, id DESC LIMIT 1
+            ), horizon AS (
+                UPDATE product_changes_horizon h
+                SET txid = newest.txid, change_id = newest.id
+                FROM newest
+                WHERE (newest.txid, newest.id) > (h.txid, h.change_id)
+            )
+            SELECT COUNT(*) FROM purged
+        """, {"days": CHANGES_RETENTION_DAYS, "batch": CHANGES_COMPACT_BATCH_SIZE})
+
+        return {"superseded": superseded, "expired": expired}
+    finally:
+        conn.close()
@@ -0,0 +1,136 @@
+"""
+Memory-compact, last-row-wins SKU de-duplication.
+
+Instead of keeping every unique row in memory, the first pass stores only
+a 64-bit hash of each lower-cased SKU and the number of the last row that
+used it, in two flat arrays (open addressing, linear probing). The second
+pass streams the file again and emits only the winning rows.
+
+Memory bound: the table is sized to the next power of two >= 2x the row
+count, at 16 bytes per slot, i.e. at most 64 bytes per input row, plus a
+1-byte-per-row winner map built after the first pass.
+That is <= 65 MB per million rows regardless of row width
+(the previous dict-of-lists approach used roughly 10x the CSV size).
+
+SKUs are compared by their 64-bit hash. Two different SKUs colliding
+has a probability of about n^2 / 2^65 (~3e-6 for 10M unique SKUs).
+"""
+import csv
+from array import array
+
+_MASK = (1 << 64) - 1
+_MIN_CAPACITY = 1024
+
+
+def _capacity_for(expected: int):
+    capacity = _MIN_CAPACITY
+    while capacity < expected * 2:
+        capacity <<= 1
+    return capacity
+
+
+class SkuIndex:
+    """Open-addressing hash table: hashed SKU -> last row number (1-based)."""
+
+    def __init__(self, expected: int = 0):
+        self._capacity = _capacity_for(expected)
+        self._keys = array('Q', bytes(8 * self._capacity))
+        self._rows = array('Q', bytes(8 * self._capacity))
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        return (len(self._keys) + len(self._rows)) * 8
+
+    def add(self, sku_lower: str, row_no: int):
+        """Record `row_no` as the latest row for `sku_lower`."""
+        # 0 marks an empty slot
+        h = (hash(sku_lower) & _MASK) or 1
+        keys = self._keys
+        mask = self._capacity - 1
+        i = h & mask
+        while True:
+            k = keys[i]
+            if k == h:
+                self._rows[i] = row_no
+                return
+            if k == 0:
+                keys[i] = h
+                self._rows[i] = row_no
+                self._size += 1
+                if self._size * 2 > self._capacity:
+                    self._grow()
+                return
+            i = (i + 1) & mask
+
+    def _grow(self):
+        old_keys, old_rows = self._keys, self._rows
+        self._capacity <<= 1
+        self._keys = array('Q', bytes(8 * self._capacity))
+        self._rows = array('Q', bytes(8 * self._capacity))
+        mask = self._capacity - 1
+        for k, row_no in zip(old_keys, old_rows):
+            if k:
+                i = k & mask
+                while self._keys[i]:
+                    i = (i + 1) & mask
+                self._keys[i] = k
+                self._rows[i] = row_no
+
+    def winners(self, total_rows: int):
+        """Return a bytearray where winners[row_no] == 1 for every winning row."""
+        marks = bytearray(total_rows + 1)
+        for row_no in self._rows:
+            if row_no:
+                marks[row_no] = 1
+        return marks
+
+
+def build_index(file_path: str, expected_rows: int = 0, on_progress=None, progress_every: int = 10000):
+    """
+    First pass: index the last row number of every non-empty SKU.
+    Returns (index, rows_read).
+    """
+    index = SkuIndex(expected_rows)
+    row_num = 0
+
+    with open(file_path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None) or []
+        if 'sku' not in header:
+            return index, 0
+        sku_pos = header.index('sku')
+
+        for row in reader:
+            row_num += 1
+            if sku_pos < len(row):
+                sku = row[sku_pos].strip()
+                if sku:
+                    index.add(sku.lower(), row_num)
+
+            if on_progress and row_num % progress_every == 0:
+                on_progress(row_num)
+
+    return index, row_num
+
+
+def iter_winning_rows(file_path: str, winners: bytearray, columns, with_row_no: bool = False):
+    """
+    Second pass: yield the values of `columns` for every winning row, in file order.
+    With with_row_no=True each row is prefixed with its 1-based row number.
+    """
+    with open(file_path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None) or []
+        positions = [header.index(col) for col in columns]
+        width = len(header)
+
+        for row_num, row in enumerate(reader, start=1):
+            if row_num < len(winners) and winners[row_num]:
+                if len(row) < width:
+                    row.extend([''] * (width - len(row)))
+                values = [row[pos] for pos in positions]
+                yield [row_num] + values if with_row_no else values
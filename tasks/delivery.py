@@ -0,0 +1,173 @@
+"""
+Webhook delivery through per-endpoint circuit breakers.
+
+After WEBHOOK_BREAKER_FAILURES consecutive failures an endpoint's breaker
+opens and its deliveries wait on the webhooks_slow queue. When the cooldown
+ends, one probe delivery is let through (half-open): success closes the
+breaker, failure reopens it with double the cooldown.
+"""
+from celery import shared_task
+from datetime import datetime, timezone
+import time
+import redis
+import requests
+from requests.adapters import HTTPAdapter
+from tasks.names import DELIVER_WEBHOOK_TASK
+from tasks.queues import _client, WEBHOOKS_SLOW_QUEUE
+from tasks.webhooks import (
+    get_health, HEALTH_KEY, PROBE_KEY, HEALTH_TTL, EWMA_ALPHA,
+    WEBHOOK_CONNECT_TIMEOUT, WEBHOOK_READ_TIMEOUT, WEBHOOK_MAX_RETRIES, WEBHOOK_MAX_AGE,
+    BREAKER_FAILURES, BREAKER_COOLDOWN, BREAKER_MAX_COOLDOWN,
+)
+
+_session = None
+
+
+def http_session():
+    """One pooled session per process, so deliveries reuse connections."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+
+def _breaker_wait(webhook_id: int, health: dict):
+    """Seconds to wait before delivering to this webhook; 0 means deliver now."""
+    if health['state'] == 'closed':
+        return 0
+    remaining = health['open_until'] - time.time()
+    if remaining > 0:
+        return remaining
+    # Cooldown is over: let exactly one probe through
+    probe_ttl = int(WEBHOOK_CONNECT_TIMEOUT + WEBHOOK_READ_TIMEOUT) + 1
+    if _client().set(PROBE_KEY.format(webhook_id), 1, nx=True, ex=probe_ttl):
+        _client().hset(HEALTH_KEY.format(webhook_id), 'state', 'half_open')
+        health['state'] = 'half_open'
+        return 0
+    return probe_ttl
+
+
+def _record_attempt(webhook_id: int, health: dict, ok: bool, elapsed_ms: float, status, error):
+    ewma = elapsed_ms if health['ewma_ms'] is None else EWMA_ALPHA * elapsed_ms + (1 - EWMA_ALPHA) * health['ewma_ms']
+    failure_rate = EWMA_ALPHA * (0 if ok else 1) + (1 - EWMA_ALPHA) * health['failure_rate']
+    fields = {
+        'ewma_ms': round(ewma, 1),
+        'failure_rate': round(failure_rate, 4),
+        'last_status': status or '',
+        'last_error': error or '',
+        'last_attempt_at': datetime.now(timezone.utc).isoformat(),
+    }
+    key = HEALTH_KEY.format(webhook_id)
+    pipe = _client().pipeline()
+    pipe.hincrby(key, 'deliveries', 1)
+    if ok:
+        fields.update(state='closed', consecutive_failures=0, cooldown=BREAKER_COOLDOWN, open_until=0)
+        pipe.delete(PROBE_KEY.format(webhook_id))
+    else:
+        pipe.hincrby(key, 'failures', 1)
+        consecutive = health['consecutive_failures'] + 1
+        fields['consecutive_failures'] = consecutive
+        if health['state'] == 'half_open':
+            # The probe failed: back off further
+            cooldown = min(health['cooldown'] * 2, BREAKER_MAX_COOLDOWN)
+            fields.update(state='open', cooldown=cooldown, open_until=time.time() + cooldown)
+        elif consecutive >= BREAKER_FAILURES and health['state'] == 'closed':
+            fields.update(state='open', cooldown=BREAKER_COOLDOWN, open_until=time.time() + BREAKER_COOLDOWN)
+        pipe.delete(PROBE_KEY.format(webhook_id))
+    pipe.hset(key, mapping=fields)
+    pipe.expire(key, HEALTH_TTL)
+    pipe.execute()
+
+
+def _expired(webhook_id: int, webhook_url: str, event: str, queued_at: float):
+    age = time.time() - queued_at
+    print(f"Warning: dropping {event} delivery to webhook {webhook_id}, still pending after {age:.0f}s")
+    return {
+        'status': 'error',
+        'error': f'Expired after {age:.0f}s',
+        'webhook_url': webhook_url,
+        'event': event
+    }
+
+
+# Named after its original module so queued deliveries keep resolving.
+# Retries are counted in `attempt`, not request.retries: waiting out an open
+# breaker is not an attempt and must not use up the retry budget. What bounds
+# those waits is `queued_at`: past WEBHOOK_MAX_AGE the delivery is dropped.
+@shared_task(bind=True, name=DELIVER_WEBHOOK_TASK, max_retries=None)
+def deliver_webhook(self, webhook_id: int, webhook_url: str, event: str, data: dict, attempt: int = 0,
+                    queued_at: float = None):
+    """POST one event to one webhook, through its circuit breaker."""
+    args = [webhook_id, webhook_url, event, data]
+    if queued_at is None:
+        queued_at = time.time()
+    try:
+        health = get_health([webhook_id])[webhook_id]
+        wait = _breaker_wait(webhook_id, health)
+    except redis.RedisError:
+        # Health tracking is best effort; deliver without it
+        health, wait = None, 0
+
+    if wait:
+        if time.time() + wait - queued_at > WEBHOOK_MAX_AGE:
+            return _expired(webhook_id, webhook_url, event, queued_at)
+        raise self.retry(args=args, kwargs={'attempt': attempt, 'queued_at': queued_at},
+                         countdown=wait, queue=WEBHOOKS_SLOW_QUEUE)
+
+    payload = {
+        'event': event,
+        'webhook_id': webhook_id,
+        'sent_at': datetime.now(timezone.utc).isoformat(),
+        'data': data,
+    }
+    status, error = None, None
+    started = time.monotonic()
+    try:
+        response = http_session().post(
+            webhook_url,
+            json=payload,
+            headers={
+                'Content-Type': 'application/json',
+                'X-Webhook-Event': event,
+                # Same on every retry, so receivers can drop duplicates
+                'X-Webhook-Delivery': self.request.id or '',
+            },
+            timeout=(WEBHOOK_CONNECT_TIMEOUT, WEBHOOK_READ_TIMEOUT)
+        )
+        status = response.status_code
+    except requests.exceptions.RequestException as e:
+        error = str(e)
+    elapsed_ms = (time.monotonic() - started) * 1000
+    # 4xx other than 429 means the endpoint is up and rejected this payload; retrying won't help
+    ok = status is not None and status < 500 and status != 429
+
+    if health is not None:
+        try:
+            _record_attempt(webhook_id, health, ok, elapsed_ms, status, error)
+        except redis.RedisError:
+            pass
+
+    if not ok:
+        if attempt >= WEBHOOK_MAX_RETRIES:
+            return {
+                'status': 'error',
+                'error': f'Gave up after {attempt} retries',
+                'webhook_url': webhook_url,
+                'event': event
+            }
+        countdown = min(2 ** attempt * 5, BREAKER_MAX_COOLDOWN)
+        if time.time() + countdown - queued_at > WEBHOOK_MAX_AGE:
+            return _expired(webhook_id, webhook_url, event, queued_at)
+        raise self.retry(args=args, kwargs={'attempt': attempt + 1, 'queued_at': queued_at},
+                         countdown=countdown, queue=WEBHOOKS_SLOW_QUEUE)
+
+    return {
+        'status': 'success',
+        'status_code': status,
+        'elapsed_ms': round(elapsed_ms, 1),
+        'webhook_url': webhook_url,
+        'event': event
+    }
@@ -0,0 +1,20 @@
+"""
+Task names and argument values shared with the API.
+
+The API dispatches tasks by name (celery.send_task) so it never imports
+worker modules and their dependencies. Keep this module import-light.
+"""
+
+PROCESS_CSV_TASK = 'tasks.process_csv.process_csv_task'
+TRIGGER_WEBHOOK_TEST_TASK = 'tasks.process_csv.trigger_webhook_test'
+DELIVER_WEBHOOK_TASK = 'tasks.webhooks.deliver_webhook'
+COMPACT_PRODUCT_CHANGES_TASK = 'tasks.changes.compact_product_changes'
+GC_UPLOADS_TASK = 'tasks.uploads.gc_uploads'
+
+# process_csv_task options
+ENGINES = ('python', 'postgres')
+# upsert: insert/update only; sync: full snapshot, deactivate SKUs missing from the file;
+# delta: per-row 'op' column ('upsert' or 'delete'); replace: swap in the file as the whole catalog;
+# inventory: price/stock feed, updates existing SKUs only
+MODES = ('upsert', 'sync', 'delta', 'replace', 'inventory')
+DELTA_OPS = ('upsert', 'delete')
@@ -1,209 +1,1300 @@
 from celery import shared_task
+from celery.signals import task_success, task_failure
 import psycopg2
+from psycopg2.extras import Json
 import os
+import io
 import csv
-from io import StringIO
+import hashlib
+import tempfile
+import uuid
+import time
 import requests
+import redis
+from decimal import Decimal
+from tasks.dedupe import build_index, iter_winning_rows
+from tasks.queues import release_import
+from tasks.progress import publish_state, progress_state, completed_state, failed_state
+from tasks.uploads import touch_upload, release_upload, clear_inflight, record_result
+from tasks.delivery import http_session
+from tasks.names import ENGINES, MODES, DELTA_OPS
+from tasks.webhooks import fire_event, WEBHOOK_CONNECT_TIMEOUT, WEBHOOK_READ_TIMEOUT
 
-@shared_task(bind=True)
-def process_csv_task(self, file_path: str):
+# De-duplicated rows are buffered in memory up to this size, then spilled to disk
+SPOOL_MAX_BYTES = 64 * 1024 * 1024
+
+# Rows of products checked per deactivation batch in sync mode
+DEACTIVATE_BATCH_SIZE = int(os.getenv('IMPORT_DEACTIVATE_BATCH_SIZE', '10000'))
+# Staged rows (by row number) merged into products per committed batch
+MERGE_BATCH_ROWS = int(os.getenv('IMPORT_MERGE_BATCH_ROWS', '50000'))
+# Bytes of the raw file COPYed per committed chunk by the postgres engine
+STAGE_CHUNK_BYTES = int(os.getenv('IMPORT_STAGE_CHUNK_BYTES', str(32 * 1024 * 1024)))
+
+# Finished checkpoints are kept this long so late redeliveries still find their result
+CHECKPOINT_RETENTION_DAYS = int(os.getenv('IMPORT_CHECKPOINT_RETENTION_DAYS', '7'))
+
+# Imports into the same catalog take this advisory lock for each write batch,
+# so concurrent upserts of the same SKUs can't deadlock on the LOWER(sku) index
+# while imports still interleave at batch boundaries.
+CATALOG = 'products'
+
+COPY_OPTIONS = "FORMAT CSV, QUOTE '\"', ESCAPE '\"'"
+
+# The only columns an inventory (price/stock feed) import reads; other columns are ignored
+INVENTORY_COLUMNS = ('sku', 'price', 'stock_quantity')
+
+
+def _quote_ident(name: str):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _cast_expr(col: str, data_type: str):
+    """Trimmed text value cast to the products column type ('' becomes NULL)."""
+    if col == 'sku':
+        # Stored trimmed so the conflict key matches the de-duplication key
+        return "TRIM(sku)"
+    if col == 'name':
+        return col
+    if data_type in ('text', 'character varying'):
+        return f"NULLIF(TRIM({col}), '')"
+    return f"NULLIF(TRIM({col}), '')::{data_type}"
+
+
+def _release_file(file_path, engine, mode, job_id):
+    """Let go of the job's upload; never raises, so it can't hide the job's own outcome."""
+    try:
+        clear_inflight(file_path, engine, mode, job_id)
+        release_upload(file_path, job_id)
+    except (OSError, redis.RedisError) as e:
+        print(f"Warning: could not release upload {file_path} for {job_id}: {e}")
+
+
+def _report(self, progress, current, total, message):
+    self.update_state(
+        state='PROGRESS',
+        meta={'progress': progress, 'current': current, 'total': total, 'message': message}
+    )
+    if self.request.id:
+        publish_state(self.request.id, progress_state(progress, current, total, message))
+
+
+# --- Checkpoints ---------------------------------------------------------------
+#
+# Every import records durable progress in import_checkpoints, keyed by the
+# Celery task id. Each unit of work (a staged chunk, a merge batch, a
+# deactivation batch) commits together with its checkpoint update, so a task
+# redelivered after a worker crash (acks_late) resumes where it stopped.
+#
+# Phases: staging -> staged -> merged -> done (or failed)
+
+def _ensure_checkpoints(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS import_checkpoints (
+            job_id TEXT PRIMARY KEY,
+            file_path TEXT NOT NULL,
+            engine TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            stage_table TEXT NOT NULL,
+            phase TEXT NOT NULL DEFAULT 'staging',
+            byte_offset BIGINT NOT NULL DEFAULT 0,
+            rows_read BIGINT NOT NULL DEFAULT 0,
+            unique_count BIGINT,
+            merged_through BIGINT NOT NULL DEFAULT 0,
+            rows_processed BIGINT NOT NULL DEFAULT 0,
+            deleted BIGINT NOT NULL DEFAULT 0,
+            deactivated_through BIGINT NOT NULL DEFAULT 0,
+            deactivated BIGINT NOT NULL DEFAULT 0,
+            unchanged BIGINT NOT NULL DEFAULT 0,
+            missing BIGINT NOT NULL DEFAULT 0,
+            result JSONB,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+
+
+def _prune_checkpoints(cur):
+    cur.execute("""
+        DELETE FROM import_checkpoints
+        WHERE phase IN ('done', 'failed')
+          AND updated_at < NOW() - make_interval(days => %s)
+    """, (CHECKPOINT_RETENTION_DAYS,))
+
+
+def _load_checkpoint(cur, job_id):
+    cur.execute("SELECT * FROM import_checkpoints WHERE job_id = %s", (job_id,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    return dict(zip([col.name for col in cur.description], row))
+
+
+def _save_checkpoint(cur, job_id, **fields):
+    """Update checkpoint fields; commit together with the work they describe."""
+    assignments = ', '.join([f"{field} = %({field})s" for field in fields])
+    cur.execute(
+        f"UPDATE import_checkpoints SET {assignments}, updated_at = NOW() WHERE job_id = %(job_id)s",
+        {**fields, 'job_id': job_id}
+    )
+
+
+def _start_checkpoint(cur, job_id, file_path, engine, mode):
+    stage_table = f"import_stage_{job_id.replace('-', '')}"
+    cur.execute("""
+        INSERT INTO import_checkpoints (job_id, file_path, engine, mode, stage_table)
+        VALUES (%s, %s, %s, %s, %s)
+    """, (job_id, file_path, engine, mode, stage_table))
+    return _load_checkpoint(cur, job_id)
+
+
+def _stage_is_intact(cur, ckpt):
     """
-    Process CSV file with progress reporting.
+    Staging tables are UNLOGGED: they survive worker crashes but are emptied
+    if Postgres itself crashes. Only trust the checkpoint if the rows are still there.
     """
-    conn = None
+    if ckpt['phase'] == 'staging' and ckpt['byte_offset'] == 0:
+        # Nothing durable yet; staging starts over either way
+        return True
+    cur.execute("SELECT to_regclass(%s)", (ckpt['stage_table'],))
+    if cur.fetchone()[0] is None:
+        return False
+    cur.execute(f"SELECT EXISTS (SELECT 1 FROM {ckpt['stage_table']})")
+    return cur.fetchone()[0] or ckpt['rows_read'] == 0
+
+
+# --- Staging -------------------------------------------------------------------
+
+def _stage_python(self, conn, cur, ckpt, file_path, stage_columns):
+    """
+    De-duplicate in Python and COPY the winning rows, with their row numbers,
+    into the staging table. Staging is one transaction: a crash before it
+    commits restarts the (memory-bound, two-pass) de-duplication.
+    """
+    stage_table = ckpt['stage_table']
+
+    # Count total rows for progress
+    with open(file_path, 'r', encoding='utf-8') as f:
+        total_rows = sum(1 for _ in f) - 1  # Exclude header
+
+    _report(self, 5, 0, total_rows, f'Reading {total_rows:,} rows...')
+
+    # De-duplicate by SKU (case-insensitive, last occurrence wins).
+    # Pass 1 keeps only a compact SKU-hash -> last-row index,
+    # pass 2 streams the winning rows; see tasks/dedupe.py for the memory bound.
+    def report_dedupe(row_num):
+        progress = 10 + int((row_num / max(total_rows, 1)) * 40)  # 10-50%
+        _report(self, progress, row_num, total_rows, f'De-duplicating row {row_num:,} of {total_rows:,}...')
+
+    index, row_num = build_index(file_path, expected_rows=total_rows, on_progress=report_dedupe)
+    unique_count = len(index)
+    winners = index.winners(row_num)
+    del index
+
+    _report(self, 55, unique_count, total_rows,
+            f'Removed {row_num - unique_count:,} duplicates. Processing {unique_count:,} unique products...')
+
+    # Write de-duplicated data to output (spills to disk for large files)
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, mode='w+', newline='', encoding='utf-8')
+    writer = csv.writer(output, quoting=csv.QUOTE_MINIMAL)
+    writer.writerows(iter_winning_rows(file_path, winners, stage_columns, with_row_no=True))
+    del winners
+    output.seek(0)
+
+    _report(self, 58, row_num, total_rows, 'Copying to staging table...')
+
+    cur.execute(f"DROP TABLE IF EXISTS {stage_table}")
+    stage_cols = ', '.join([f"{col} TEXT" for col in stage_columns])
+    cur.execute(f"CREATE UNLOGGED TABLE {stage_table} (row_no BIGINT NOT NULL, {stage_cols})")
+    cur.copy_expert(sql=f"COPY {stage_table} FROM STDIN WITH ({COPY_OPTIONS})", file=output)
+    output.close()
+
+    _save_checkpoint(cur, ckpt['job_id'], phase='staged', rows_read=row_num, unique_count=unique_count)
+    conn.commit()
+
+
+def _record_end(data: bytes):
+    """
+    Offset just past the last complete CSV record in `data`, or None.
+    A newline ends a record only if it is outside quotes, i.e. preceded by an
+    even number of quote characters ("" escapes keep the parity).
+    """
+    quotes = data.count(b'"')
+    pos = data.rfind(b'\n')
+    while pos != -1:
+        if (quotes - data.count(b'"', pos)) % 2 == 0:
+            return pos + 1
+        pos = data.rfind(b'\n', 0, pos)
+    return None
+
+
+def _iter_record_chunks(f, chunk_bytes):
+    """Yield (data, end_offset) blocks of whole CSV records from binary file `f`."""
+    carry = b''
+    while True:
+        block = f.read(chunk_bytes)
+        if not block:
+            if carry:
+                yield carry, f.tell()
+            return
+        data = carry + block
+        end = _record_end(data)
+        if end is None:
+            carry = data
+            continue
+        yield data[:end], f.tell() - (len(data) - end)
+        carry = data[end:]
+
+
+def _skip_header(f):
+    """
+    Read past the header record of binary file `f` and return the offset of the
+    first data row. A header without a trailing newline is the whole file (no
+    data rows); one whose quotes never close is an error.
+    """
+    header = f.readline()
+    while header and _record_end(header) is None:
+        line = f.readline()
+        if not line:
+            if header.count(b'"') % 2:
+                raise ValueError("CSV header has an unterminated quoted field")
+            break
+        header += line
+    return f.tell()
+
+
+def _stage_postgres(self, conn, cur, ckpt, file_path, csv_headers):
+    """
+    COPY the raw file into an UNLOGGED staging table numbered by file order;
+    "last SKU wins" is resolved later with DISTINCT ON. No Python row loop;
+    every CSV row must have the header's column count.
+    The file is copied in chunks that end on record boundaries, and each chunk
+    commits with its byte offset, so a resumed job continues from the last chunk.
+    """
+    stage_table = ckpt['stage_table']
+    quoted_headers = [_quote_ident(col) for col in csv_headers]
+    file_size = os.path.getsize(file_path)
+
+    byte_offset = ckpt['byte_offset']
+    rows_read = ckpt['rows_read']
+
+    with open(file_path, 'rb') as f:
+        if byte_offset == 0:
+            byte_offset = _skip_header(f)
+
+            stage_cols = ', '.join([f"{col} TEXT" for col in quoted_headers])
+            cur.execute(f"DROP TABLE IF EXISTS {stage_table}")
+            cur.execute(f"""
+                CREATE UNLOGGED TABLE {stage_table} (
+                    row_no BIGINT GENERATED ALWAYS AS IDENTITY,
+                    {stage_cols}
+                )
+            """)
+            _save_checkpoint(cur, ckpt['job_id'], byte_offset=byte_offset)
+            conn.commit()
+
+        f.seek(byte_offset)
+        for data, end_offset in _iter_record_chunks(f, STAGE_CHUNK_BYTES):
+            cur.copy_expert(
+                sql=f"COPY {stage_table} ({', '.join(quoted_headers)}) FROM STDIN WITH ({COPY_OPTIONS})",
+                file=io.BytesIO(data)
+            )
+            rows_read += cur.rowcount
+            _save_checkpoint(cur, ckpt['job_id'], byte_offset=end_offset, rows_read=rows_read)
+            conn.commit()
+
+            progress = 10 + int((end_offset / max(file_size, 1)) * 50)  # 10-60%
+            _report(self, progress, rows_read, 0, f'Staged {rows_read:,} rows ({end_offset * 100 // max(file_size, 1)}% of file)...')
+
+    _save_checkpoint(cur, ckpt['job_id'], phase='staged', byte_offset=file_size, rows_read=rows_read)
+    conn.commit()
+
+
+# --- Merge ---------------------------------------------------------------------
+
+def _lock_catalog(self, conn, cur, catalog):
+    """
+    Take the session-level advisory lock for `catalog`, reporting while waiting.
+    Held until _unlock_catalog or the connection closes.
+    """
+    conn.commit()
+    waiting_since = time.monotonic()
+    while True:
+        cur.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (f'import:{catalog}',))
+        acquired = cur.fetchone()[0]
+        # Don't sit idle in a transaction while waiting
+        conn.commit()
+        if acquired:
+            return
+        waited = int(time.monotonic() - waiting_since)
+        _report(self, 60, 0, 0, f'Waiting for another import into {catalog} ({waited}s)...')
+        time.sleep(1)
+
+
+def _unlock_catalog(cur, catalog):
+    cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (f'import:{catalog}',))
+
+
+def _lock_catalog_batch(cur, catalog):
+    """
+    Take the advisory lock for `catalog` until the current transaction ends.
+    Conflicts with the session-level lock of _lock_catalog, so no batch runs
+    during a replace.
+    """
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f'import:{catalog}',))
+
+
+def _catalog_version(cur):
+    cur.execute("SELECT version FROM catalog_version")
+    return cur.fetchone()[0]
+
+
+def _check_delta_ops(cur, stage_table):
+    """Reject delta files with unknown op values before anything is written."""
+    cur.execute(f"""
+        SELECT DISTINCT op FROM {stage_table}
+        WHERE COALESCE(LOWER(TRIM(op)), '') NOT IN ('', {', '.join(f"'{op}'" for op in DELTA_OPS)})
+        LIMIT 5
+    """)
+    invalid = [row[0] for row in cur.fetchall()]
+    if invalid:
+        raise ValueError(f"Invalid op values {invalid}, expected one of: {', '.join(DELTA_OPS)}")
+
+
+def _merge_batches(self, conn, cur, ckpt, usable_columns, db_types, mode):
+    """
+    Upsert staged rows into products in row-number batches, each committed
+    with its checkpoint. DISTINCT ON picks the last row per SKU within a batch;
+    applying batches in file order keeps "last SKU wins" across batches, and
+    re-applying a batch after a crash writes the same values again.
+    Rows whose values already match are left alone, so re-importing an
+    unchanged catalog writes (and bloats) nothing.
+    """
+    job_id = ckpt['job_id']
+    stage_table = ckpt['stage_table']
+
+    insert_columns = list(usable_columns)
+    select_exprs = [_cast_expr(col, db_types[col]) for col in usable_columns]
+    if mode == 'sync' and 'active' not in usable_columns and 'active' in db_types:
+        # Products present in the snapshot are active unless the file says otherwise
+        insert_columns.append('active')
+        select_exprs.append('TRUE')
+    columns_str = ', '.join(insert_columns)
+    select_str = ', '.join(select_exprs)
+
+    # Check if SKU unique constraint exists
+    cur.execute("""
+        SELECT 1 FROM pg_indexes
+        WHERE indexname = 'products_sku_lower_unique'
+    """)
+    has_sku_unique = cur.fetchone() is not None
+
+    upsert_filter = "TRUE"
+    if mode == 'delta':
+        upsert_filter = "COALESCE(LOWER(TRIM(op)), '') != 'delete'"
+
+    if mode == 'inventory':
+        # Existing SKUs only; a blank value leaves the field as it is
+        value_cols = [col for col in usable_columns if col != 'sku']
+        typed = ', '.join(f"{_cast_expr(col, db_types[col])} AS {col}" for col in usable_columns)
+        new_values = [f"COALESCE(v.{col}, p.{col})" for col in value_cols]
+        write_sql = f"""
+            UPDATE products p
+            SET {', '.join(f'{col} = {value}' for col, value in zip(value_cols, new_values))}, updated_at = NOW()
+            FROM (SELECT {typed} FROM source) AS v
+            WHERE LOWER(p.sku) = LOWER(v.sku)
+              AND ({', '.join(new_values)}) IS DISTINCT FROM ({', '.join(f'p.{col}' for col in value_cols)})
+            RETURNING 1
+        """
+        missing_sql = """(
+            SELECT COUNT(*) FROM source s
+            WHERE NOT EXISTS (SELECT 1 FROM products p WHERE LOWER(p.sku) = LOWER(TRIM(s.sku)))
+        )"""
+    else:
+        if has_sku_unique and 'sku' in usable_columns:
+            # Upsert on SKU
+            update_cols = [col for col in insert_columns if col not in ['sku', 'id']]
+            if update_cols:
+                update_str = ', '.join([f"{col} = EXCLUDED.{col}" for col in update_cols] + ['updated_at = NOW()'])
+                changed = (f"({', '.join(f'products.{col}' for col in update_cols)}) IS DISTINCT FROM "
+                           f"({', '.join(f'EXCLUDED.{col}' for col in update_cols)})")
+                conflict_sql = f"ON CONFLICT (LOWER(sku)) DO UPDATE SET {update_str} WHERE {changed}"
+            else:
+                conflict_sql = "ON CONFLICT (LOWER(sku)) DO NOTHING"
+        else:
+            # Simple insert
+            conflict_sql = ""
+        write_sql = f"INSERT INTO products ({columns_str}) SELECT {select_str} FROM source {conflict_sql} RETURNING 1"
+        missing_sql = "0"
+
+    cur.execute(f"SELECT COALESCE(MAX(row_no), 0) FROM {stage_table}")
+    last_row = cur.fetchone()[0]
+    merged_through = ckpt['merged_through']
+    rows_processed = ckpt['rows_processed']
+    deleted = ckpt['deleted']
+    unchanged = ckpt['unchanged']
+    missing = ckpt['missing']
+
+    while merged_through < last_row:
+        _lock_catalog_batch(cur, CATALOG)
+        batch_end = merged_through + MERGE_BATCH_ROWS
+        source_sql = f"""(
+            SELECT DISTINCT ON (LOWER(TRIM(sku))) *
+            FROM {stage_table}
+            WHERE row_no > {merged_through} AND row_no <= {batch_end}
+              AND sku IS NOT NULL AND TRIM(sku) != ''
+            ORDER BY LOWER(TRIM(sku)), row_no DESC
+        ) AS staged"""
+
+        if mode == 'delta':
+            cur.execute(f"""
+                DELETE FROM products p
+                USING {source_sql}
+                WHERE LOWER(p.sku) = LOWER(TRIM(staged.sku))
+                  AND LOWER(TRIM(staged.op)) = 'delete'
+            """)
+            deleted += cur.rowcount
+
+        cur.execute(f"""
+            WITH source AS MATERIALIZED (
+                SELECT * FROM {source_sql} WHERE {upsert_filter}
+            ), written AS ({write_sql})
+            SELECT (SELECT COUNT(*) FROM source), (SELECT COUNT(*) FROM written), {missing_sql}
+        """)
+        batch_rows, batch_written, batch_missing = cur.fetchone()
+        rows_processed += batch_written
+        unchanged += batch_rows - batch_written - batch_missing
+        missing += batch_missing
+        merged_through = min(batch_end, last_row)
+
+        _save_checkpoint(cur, job_id, merged_through=merged_through, rows_processed=rows_processed,
+                         deleted=deleted, unchanged=unchanged, missing=missing)
+        # Read under the batch lock: the catalog as this import left it
+        ckpt['catalog_version'] = _catalog_version(cur)
+        conn.commit()
+
+        progress = 60 + int((merged_through / max(last_row, 1)) * 35)  # 60-95%
+        _report(self, progress, rows_processed, ckpt['rows_read'], f'Saved {rows_processed:,} products ({unchanged:,} unchanged)...')
+
+    _save_checkpoint(cur, job_id, phase='merged')
+    conn.commit()
+    ckpt.update(merged_through=merged_through, rows_processed=rows_processed, deleted=deleted,
+                unchanged=unchanged, missing=missing)
+
+
+def _deactivate_missing(self, conn, cur, ckpt):
+    """
+    Set active = false on every product whose SKU is not in the staging table.
+    Runs as set-based updates over primary-key ranges, committing each batch
+    with its checkpoint, so a full-catalog sync never holds row locks on the
+    whole table at once and resumes mid-way after a crash.
+    """
+    stage_table = ckpt['stage_table']
+    cur.execute(f"CREATE INDEX IF NOT EXISTS {stage_table}_sku ON {stage_table} (LOWER(TRIM(sku)))")
+    cur.execute(f"ANALYZE {stage_table}")
+    cur.execute("SELECT MIN(id), MAX(id) FROM products WHERE id > %s", (ckpt['deactivated_through'],))
+    min_id, max_id = cur.fetchone()
+    conn.commit()
+
+    deactivated = ckpt['deactivated']
+    if min_id is None:
+        return deactivated
+
+    for batch_start in range(min_id, max_id + 1, DEACTIVATE_BATCH_SIZE):
+        batch_end = batch_start + DEACTIVATE_BATCH_SIZE
+        _lock_catalog_batch(cur, CATALOG)
+        cur.execute(f"""
+            UPDATE products p
+            SET active = false, updated_at = NOW()
+            WHERE p.id >= %(start)s AND p.id < %(end)s
+              AND p.active
+              AND NOT EXISTS (
+                  SELECT 1 FROM {stage_table} s WHERE LOWER(TRIM(s.sku)) = LOWER(p.sku)
+              )
+        """, {'start': batch_start, 'end': batch_end})
+        deactivated += cur.rowcount
+        _save_checkpoint(cur, ckpt['job_id'], deactivated_through=batch_end - 1, deactivated=deactivated)
+        ckpt['catalog_version'] = _catalog_version(cur)
+        conn.commit()
+
+        progress = 95 + int(((batch_start - min_id) / max(max_id - min_id + 1, 1)) * 5)
+        _report(self, progress, deactivated, 0, f'Deactivated {deactivated:,} missing products...')
+
+    return deactivated
+
+
+# --- Replace -------------------------------------------------------------------
+#
+# mode='replace' loads the file into a shadow copy of products and swaps it
+# in, instead of merging into the live table. Everything runs in one
+# transaction holding a SHARE lock on products: readers keep reading the old
+# catalog, writers wait, so the shadow can be compared with a catalog that
+# doesn't move. The shadow gets its indexes after the load, the change feed
+# and facets are written from a diff against the live table, and only the
+# final rename takes an ACCESS EXCLUSIVE lock. A crash before the commit
+# leaves the live catalog untouched and the job resumes from its staged rows.
+
+SHADOW_TABLE = 'products_replace'
+# Each attempt at the swap lock waits at most this long, so readers queued behind it aren't held up
+REPLACE_LOCK_TIMEOUT_MS = int(os.getenv('IMPORT_REPLACE_LOCK_TIMEOUT_MS', '1000'))
+REPLACE_LOCK_ATTEMPTS = int(os.getenv('IMPORT_REPLACE_LOCK_ATTEMPTS', '30'))
+# Memory for building the shadow table's indexes
+REPLACE_MAINTENANCE_WORK_MEM = os.getenv('IMPORT_REPLACE_MAINTENANCE_WORK_MEM', '256MB')
+# Refuse replacements that would shrink the catalog below this fraction of its size (0 disables)
+REPLACE_MIN_RATIO = float(os.getenv('IMPORT_REPLACE_MIN_RATIO', '0'))
+
+
+def _table_exists(cur, name):
+    cur.execute("SELECT to_regclass(%s)", (name,))
+    return cur.fetchone()[0] is not None
+
+
+def _products_ddl(cur):
+    """Indexes, triggers, storage options and id sequence of products, to rebuild them on the shadow."""
+    cur.execute("""
+        SELECT conrelid::regclass::text FROM pg_constraint
+        WHERE confrelid = 'products'::regclass AND contype = 'f'
+    """)
+    referencing = [row[0] for row in cur.fetchall()]
+    if referencing:
+        raise ValueError(f"Replace imports can't swap products while {', '.join(referencing)} reference it")
+    cur.execute("""
+        SELECT con.conname, con.contype FROM pg_constraint con
+        WHERE con.conrelid = 'products'::regclass AND con.contype NOT IN ('p', 'u', 'c', 'n')
+    """)
+    unsupported = [row[0] for row in cur.fetchall()]
+    if unsupported:
+        raise ValueError(f"Replace imports don't support the constraints {', '.join(unsupported)} on products")
+
+    cur.execute("""
+        SELECT c.relname, i.indisunique, pg_get_indexdef(i.indexrelid), con.contype
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        LEFT JOIN pg_constraint con ON con.conindid = i.indexrelid AND con.conrelid = i.indrelid
+        WHERE i.indrelid = 'products'::regclass
+        ORDER BY c.relname
+    """)
+    indexes = [
+        {'name': name, 'unique': unique, 'using': indexdef[indexdef.index(' USING '):], 'constraint': contype}
+        for name, unique, indexdef, contype in cur.fetchall()
+    ]
+    cur.execute("""
+        SELECT pg_get_triggerdef(oid) FROM pg_trigger
+        WHERE tgrelid = 'products'::regclass AND NOT tgisinternal
+        ORDER BY tgname
+    """)
+    triggers = [row[0] for row in cur.fetchall()]
+    cur.execute("SELECT reloptions FROM pg_class WHERE oid = 'products'::regclass")
+    reloptions = cur.fetchone()[0] or []
+    cur.execute("SELECT pg_get_serial_sequence('products', 'id')")
+    sequence = cur.fetchone()[0]
+    return {'indexes': indexes, 'triggers': triggers, 'reloptions': reloptions, 'sequence': sequence}
+
+
+def _lock_for_swap(self, cur):
+    """
+    Upgrade to ACCESS EXCLUSIVE on products for the rename. Each attempt
+    gives up after REPLACE_LOCK_TIMEOUT_MS (keeping the SHARE lock), so a
+    long-running reader delays the swap rather than every reader queued behind it.
+    """
+    for attempt in range(1, REPLACE_LOCK_ATTEMPTS + 1):
+        cur.execute("SAVEPOINT swap_lock")
+        try:
+            cur.execute(f"SET LOCAL lock_timeout = {REPLACE_LOCK_TIMEOUT_MS}")
+            cur.execute("LOCK TABLE products IN ACCESS EXCLUSIVE MODE")
+        except psycopg2.errors.LockNotAvailable:
+            cur.execute("ROLLBACK TO SAVEPOINT swap_lock")
+            _report(self, 95, 0, 0, f'Waiting for readers to swap in the new catalog (attempt {attempt})...')
+            time.sleep(0.2)
+            continue
+        cur.execute("SET LOCAL lock_timeout TO DEFAULT")
+        cur.execute("RELEASE SAVEPOINT swap_lock")
+        return
+    raise RuntimeError(f"Could not lock products for the swap after {REPLACE_LOCK_ATTEMPTS} attempts")
+
+
+def _replace_catalog(self, conn, cur, ckpt, usable_columns, db_types):
+    """
+    Build the shadow catalog from the staged rows and swap it in; commits
+    with the checkpoint. Products keep their id and created_at by SKU, so
+    the change feed and clients see updates, not delete + insert. Columns
+    missing from the file keep their current values, like the merge.
+    """
+    job_id = ckpt['job_id']
+    stage_table = ckpt['stage_table']
+
+    cur.execute("LOCK TABLE products IN SHARE MODE")
+    ddl = _products_ddl(cur)
+    cur.execute("""
+        SELECT column_name, column_default
+        FROM information_schema.columns
+        WHERE table_name = 'products'
+        ORDER BY ordinal_position
+    """)
+    defaults = dict(cur.fetchall())
+
+    _report(self, 60, 0, ckpt['rows_read'], 'Loading the replacement catalog...')
+    cur.execute(f"DROP TABLE IF EXISTS {SHADOW_TABLE}")
+    cur.execute(f"CREATE TABLE {SHADOW_TABLE} (LIKE products INCLUDING ALL EXCLUDING INDEXES)")
+    if ddl['reloptions']:
+        cur.execute(f"ALTER TABLE {SHADOW_TABLE} SET ({', '.join(ddl['reloptions'])})")
+
+    # Values the file sets; products in the snapshot are active unless it says otherwise
+    file_values = {col: f"w.{col}" for col in usable_columns}
+    if 'active' not in usable_columns and 'active' in db_types:
+        file_values['active'] = 'TRUE'
+    changed = (f"({', '.join(file_values.values())}) IS DISTINCT FROM "
+               f"({', '.join(f'p.{col}' for col in file_values)})")
+    select_exprs = []
+    for col in defaults:
+        if col in file_values:
+            select_exprs.append(file_values[col])
+        elif col == 'updated_at':
+            select_exprs.append(f"CASE WHEN p.id IS NULL OR {changed} THEN NOW() ELSE p.updated_at END")
+        else:
+            select_exprs.append(f"CASE WHEN p.id IS NULL THEN {defaults[col] or 'NULL'} ELSE p.{col} END")
+    typed_exprs = [f"{_cast_expr(col, db_types[col])} AS {col}" for col in usable_columns]
+
+    cur.execute("SET LOCAL maintenance_work_mem = %s", (REPLACE_MAINTENANCE_WORK_MEM,))
+    cur.execute(f"""
+        INSERT INTO {SHADOW_TABLE} ({', '.join(defaults)})
+        SELECT {', '.join(select_exprs)}
+        FROM (
+            SELECT {', '.join(typed_exprs)}
+            FROM (
+                SELECT DISTINCT ON (LOWER(TRIM(sku))) *
+                FROM {stage_table}
+                WHERE sku IS NOT NULL AND TRIM(sku) != ''
+                ORDER BY LOWER(TRIM(sku)), row_no DESC
+            ) AS staged
+        ) AS w
+        LEFT JOIN products p ON LOWER(p.sku) = LOWER(w.sku)
+    """)
+    loaded = cur.rowcount
+
+    # Validate before anything is built on top of the load
+    cur.execute(f"SELECT COUNT(DISTINCT LOWER(TRIM(sku))) FROM {stage_table} WHERE TRIM(sku) != ''")
+    expected = cur.fetchone()[0]
+    if loaded != expected:
+        raise RuntimeError(f"Replacement catalog has {loaded:,} products, expected {expected:,} unique SKUs")
+    cur.execute("SELECT COUNT(*) FROM products")
+    current = cur.fetchone()[0]
+    if REPLACE_MIN_RATIO and loaded < current * REPLACE_MIN_RATIO:
+        raise ValueError(f"Refusing to replace {current:,} products with {loaded:,} "
+                         f"(IMPORT_REPLACE_MIN_RATIO is {REPLACE_MIN_RATIO})")
+
+    _report(self, 75, loaded, ckpt['rows_read'], f'Indexing {loaded:,} products...')
+    for n, index in enumerate(ddl['indexes']):
+        index['building'] = f"{SHADOW_TABLE}_idx{n}"
+        unique = 'UNIQUE ' if index['unique'] else ''
+        cur.execute(f"CREATE {unique}INDEX {index['building']} ON {SHADOW_TABLE}{index['using']}")
+    cur.execute(f"ANALYZE {SHADOW_TABLE}")
+
+    _report(self, 85, loaded, ckpt['rows_read'], 'Recording changes...')
+    removed = 0
+    written = loaded
+    if _table_exists(cur, 'product_changes'):
+        fields = list(db_types)
+        new_fields = ', '.join(f"s.{col}" for col in fields)
+        old_fields = ', '.join(f"p.{col}" for col in fields)
+        cur.execute(f"""
+            INSERT INTO product_changes (op, product_id, sku)
+            SELECT 'delete', p.id, p.sku FROM products p
+            WHERE NOT EXISTS (SELECT 1 FROM {SHADOW_TABLE} s WHERE s.id = p.id)
+            ORDER BY p.id
+        """)
+        removed = cur.rowcount
+        cur.execute(f"""
+            INSERT INTO product_changes (op, product_id, sku)
+            SELECT CASE WHEN p.id IS NULL THEN 'insert' ELSE 'update' END, s.id, s.sku
+            FROM {SHADOW_TABLE} s LEFT JOIN products p ON p.id = s.id
+            WHERE p.id IS NULL OR ({new_fields}) IS DISTINCT FROM ({old_fields})
+            ORDER BY s.id
+        """)
+        written = cur.rowcount
+    else:
+        cur.execute(f"""
+            SELECT COUNT(*) FROM products p
+            WHERE NOT EXISTS (SELECT 1 FROM {SHADOW_TABLE} s WHERE s.id = p.id)
+        """)
+        removed = cur.fetchone()[0]
+    if _table_exists(cur, 'product_facets'):
+        cur.execute("DELETE FROM product_facets")
+        cur.execute(f"""
+            INSERT INTO product_facets (category, active, count)
+            SELECT COALESCE(category, ''), active, COUNT(*)
+            FROM {SHADOW_TABLE} GROUP BY 1, 2 ORDER BY 1, 2
+        """)
+    if _table_exists(cur, 'catalog_version'):
+        cur.execute("UPDATE catalog_version SET version = version + 1, updated_at = NOW()")
+
+    _report(self, 95, loaded, ckpt['rows_read'], 'Swapping in the new catalog...')
+    _lock_for_swap(self, cur)
+    if ddl['sequence']:
+        cur.execute(f"ALTER SEQUENCE {ddl['sequence']} OWNED BY {SHADOW_TABLE}.id")
+    cur.execute("DROP TABLE products")
+    cur.execute(f"ALTER TABLE {SHADOW_TABLE} RENAME TO products")
+    for index in ddl['indexes']:
+        name = _quote_ident(index['name'])
+        if index['constraint'] == 'p':
+            cur.execute(f"ALTER TABLE products ADD CONSTRAINT {name} PRIMARY KEY USING INDEX {index['building']}")
+        elif index['constraint'] == 'u':
+            cur.execute(f"ALTER TABLE products ADD CONSTRAINT {name} UNIQUE USING INDEX {index['building']}")
+        else:
+            cur.execute(f"ALTER INDEX {index['building']} RENAME TO {name}")
+    # The definitions name products, which is now the new table
+    for trigger in ddl['triggers']:
+        cur.execute(trigger)
+
+    _save_checkpoint(cur, job_id, phase='merged', rows_processed=written, deleted=removed, unchanged=loaded - written)
+    ckpt['catalog_version'] = _catalog_version(cur)
+    conn.commit()
+    ckpt.update(rows_processed=written, deleted=removed, unchanged=loaded - written)
+
+
+# --- Preview -------------------------------------------------------------------
+#
+# A preview reads the file once and writes nothing to products. Values the
+# import's casts would reject are flagged per row in Python; the rows are
+# COPYed into a temporary table, reduced to the last row per SKU like the
+# import does, and compared with products through the LOWER(sku) index.
+# The transaction is rolled back at the end.
+#
+# With `sample`, only SKUs whose hash falls in that fraction of the hash
+# range are read. Every row of a sampled SKU is kept, so the duplicate ratio
+# is not skewed, and Postgres computes the same hash to pick the matching
+# slice of products when estimating sync deactivations.
+
+PREVIEW_EXAMPLES = 5
+# Rows between progress reports
+PREVIEW_REPORT_EVERY = 100000
+
+_INT_LIMITS = {'smallint': 2 ** 15, 'integer': 2 ** 31, 'bigint': 2 ** 63}
+_BOOL_LITERALS = {'t', 'true', 'y', 'yes', 'on', '1', 'f', 'false', 'n', 'no', 'off', '0'}
+_SKU_BUCKETS = 2 ** 32
+
+
+def _sku_bucket(sku_lower: str):
+    """First 32 bits of md5(sku); matches _sku_bucket_sql."""
+    return int.from_bytes(hashlib.md5(sku_lower.encode('utf-8')).digest()[:4], 'big')
+
+
+def _sku_bucket_sql(expr: str):
+    return f"('x' || LEFT(md5(LOWER({expr})), 8))::bit(32)::bigint"
+
+
+def _rejects(value: str, column: dict):
+    """True if the import's cast would fail on `value` ('' becomes NULL and always casts)."""
+    value = value.strip()
+    if not value:
+        return False
+    data_type = column['data_type']
+    try:
+        if data_type in _INT_LIMITS:
+            limit = _INT_LIMITS[data_type]
+            return not -limit <= int(value) < limit
+        if data_type == 'numeric':
+            number = Decimal(value)
+            if column['precision'] is not None and number.is_finite():
+                return abs(number) >= 10 ** (column['precision'] - column['scale'])
+            return False
+        if data_type in ('real', 'double precision'):
+            float(value)
+            return False
+        if data_type == 'boolean':
+            return value.lower() not in _BOOL_LITERALS
+    except (ValueError, ArithmeticError):
+        return True
+    return False
+
+
+def _preview_stage(self, cur, file_path, csv_headers, stage_columns, columns, mode, sample):
+    """
+    Stream the file once into preview_stage (row_no, invalid, *stage_columns),
+    one COPY per STAGE_CHUNK_BYTES of rows. Returns the row counters.
+    """
+    positions = [csv_headers.index(col) for col in stage_columns]
+    # Only typed columns can fail their cast
+    checked = [
+        (i, col, columns[col]) for i, col in enumerate(stage_columns)
+        if col in columns and columns[col]['data_type'] not in ('text', 'character varying')
+    ]
+    op_pos = stage_columns.index('op') if mode == 'delta' else None
+    width = len(csv_headers)
+    sku_pos = csv_headers.index('sku')
+    bucket_limit = int(sample * _SKU_BUCKETS) if sample else None
+    file_size = os.path.getsize(file_path)
+    counts = {'rows_read': 0, 'rows_sampled': 0, 'rows_without_sku': 0, 'malformed_rows': 0}
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_MINIMAL)
+
+    def flush():
+        buffer.seek(0)
+        cur.copy_expert(sql=f"COPY preview_stage FROM STDIN WITH ({COPY_OPTIONS})", file=buffer)
+        buffer.seek(0)
+        buffer.truncate()
+
+    with open(file_path, 'rb') as raw:
+        reader = csv.reader(io.TextIOWrapper(raw, encoding='utf-8', newline=''))
+        next(reader, None)
+        for row_num, row in enumerate(reader, start=1):
+            if row_num % PREVIEW_REPORT_EVERY == 0:
+                progress = 5 + int((raw.tell() / max(file_size, 1)) * 75)  # 5-80%
+                _report(self, progress, row_num, 0, f'Previewed {row_num:,} rows...')
+            counts['rows_read'] = row_num
+
+            sku = row[sku_pos].strip() if sku_pos < len(row) else ''
+            if bucket_limit is not None and (not sku or _sku_bucket(sku.lower()) >= bucket_limit):
+                continue
+            counts['rows_sampled'] += 1
+            if len(row) != width:
+                # The python engine pads or truncates these; the postgres engine's COPY rejects them
+                counts['malformed_rows'] += 1
+                row = (row + [''] * width)[:width]
+            if not sku:
+                counts['rows_without_sku'] += 1
+                continue
+
+            values = [row[pos] for pos in positions]
+            invalid = [col for i, col, column in checked if _rejects(values[i], column)]
+            if op_pos is not None and values[op_pos].strip().lower() not in ('',) + DELTA_OPS:
+                invalid.append('op')
+            # An empty field is NULL after COPY, so valid rows have invalid IS NULL
+            writer.writerow([row_num, ','.join(invalid)] + values)
+            # Checked per row, so the buffer stays bounded however wide the rows are
+            if buffer.tell() >= STAGE_CHUNK_BYTES:
+                flush()
+
+    flush()
+    return counts
+
+
+def _preview_import(self, file_path, engine, mode, sample):
+    """
+    What process_csv_task would do with this file, without writing anything:
+    column mapping, duplicates, values that would fail their cast, and the
+    insert/update/unchanged (plus delete or deactivate) counts with examples.
+    """
+    _report(self, 0, 0, 0, 'Starting preview...')
+
+    conn = psycopg2.connect(os.getenv('DATABASE_URL'))
     try:
-        # Report initial progress
-        self.update_state(
-            state='PROGRESS',
-            meta={'progress': 0, 'current': 0, 'total': 0, 'message': 'Starting import...'}
-        )
-        
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(os.getenv('DATABASE_URL'))
         cur = conn.cursor()
-        
-        # Get database columns
         cur.execute("""
-            SELECT column_name 
-            FROM information_schema.columns 
+            SELECT column_name, data_type, numeric_precision, numeric_scale
+            FROM information_schema.columns
             WHERE table_name = 'products'
             ORDER BY ordinal_position
         """)
-        db_columns = [row[0] for row in cur.fetchall() if row[0] not in ['id', 'created_at', 'updated_at']]
-        
-        # Count total rows for progress
-        with open(file_path, 'r', encoding='utf-8') as f:
-            total_rows = sum(1 for _ in f) - 1  # Exclude header
-        
-        self.update_state(
-            state='PROGRESS',
-            meta={'progress': 5, 'current': 0, 'total': total_rows, 'message': f'Reading {total_rows:,} rows...'}
-        )
-        
-        # Read CSV
-        with open(file_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            csv_headers = reader.fieldnames
-        
-        # Determine usable columns
-        usable_columns = [col for col in csv_headers if col in db_columns]
-        
+        columns = {
+            row[0]: {'data_type': row[1], 'precision': row[2], 'scale': row[3]}
+            for row in cur.fetchall() if row[0] not in ['id', 'created_at', 'updated_at']
+        }
+
+        with open(file_path, 'r', encoding='utf-8', newline='') as f:
+            csv_headers = next(csv.reader(f), [])
+
+        usable_columns = [col for col in csv_headers if col in columns]
+        if mode == 'inventory':
+            usable_columns = [col for col in usable_columns if col in INVENTORY_COLUMNS]
         if not usable_columns:
             raise ValueError(f"No matching columns between CSV and database")
-        
-        self.update_state(
-            state='PROGRESS',
-            meta={'progress': 10, 'current': 0, 'total': total_rows, 'message': f'Validating data...'}
-        )
-        
-        # Process CSV and de-duplicate by SKU (case-insensitive)
-        with open(file_path, 'r', encoding='utf-8') as input_file:
-            reader = csv.DictReader(input_file)
-            
-            # De-duplicate: keep last occurrence of each SKU
-            seen_skus = {}
-            row_num = 0
-            
-            for row in reader:
-                row_num += 1
-                try:
-                    sku = row.get('sku', '').strip()
-                    if sku:
-                        sku_lower = sku.lower()
-                        # Store row data with lowercase SKU as key (last one wins)
-                        seen_skus[sku_lower] = [row.get(col, '') for col in usable_columns]
-                    
-                    # Update progress every 10,000 rows
-                    if row_num % 10000 == 0:
-                        progress = 10 + int((row_num / total_rows) * 50)  # 10-60%
-                        self.update_state(
-                            state='PROGRESS',
-                            meta={
-                                'progress': progress,
-                                'current': row_num,
-                                'total': total_rows,
-                                'message': f'De-duplicating row {row_num:,} of {total_rows:,}...'
-                            }
-                        )
-                except Exception as e:
-                    print(f"Warning: Skipping row {row_num}: {e}")
-                    continue
-        
-        # Write de-duplicated data to output
-        output = StringIO()
-        writer = csv.writer(output, quoting=csv.QUOTE_MINIMAL)
-        writer.writerow(usable_columns)
-        
-        for values in seen_skus.values():
-            writer.writerow(values)
-        
-        unique_count = len(seen_skus)
-        duplicates_removed = row_num - unique_count
-        
-        self.update_state(
-            state='PROGRESS',
-            meta={
-                'progress': 65,
-                'current': unique_count,
-                'total': total_rows,
-                'message': f'Removed {duplicates_removed:,} duplicates. Processing {unique_count:,} unique products...'
-            }
-        )
-        
-        output.seek(0)
-        
-        self.update_state(
-            state='PROGRESS',
-            meta={'progress': 80, 'current': row_num, 'total': total_rows, 'message': 'Importing to database...'}
-        )
-        
-        # Create temp table
-        temp_cols = ', '.join([f"{col} TEXT" for col in usable_columns])
+        if 'sku' not in usable_columns:
+            raise ValueError("Previews need a 'sku' column")
+        if mode == 'delta' and 'op' not in csv_headers:
+            raise ValueError("Delta imports need an 'op' column (upsert or delete)")
+        stage_columns = usable_columns + (['op'] if mode == 'delta' else [])
+
+        stage_cols = ', '.join([f"{col} TEXT" for col in stage_columns])
+        cur.execute(f"CREATE TEMP TABLE preview_stage (row_no BIGINT NOT NULL, invalid TEXT, {stage_cols}) ON COMMIT DROP")
+        counts = _preview_stage(self, cur, file_path, csv_headers, stage_columns, columns, mode, sample)
+
+        _report(self, 80, counts['rows_read'], counts['rows_read'], 'Comparing with the catalog...')
+
+        # Last row per SKU wins, as in the import
+        cur.execute("""
+            CREATE TEMP TABLE preview_winners ON COMMIT DROP AS
+            SELECT DISTINCT ON (LOWER(TRIM(sku))) * FROM preview_stage
+            ORDER BY LOWER(TRIM(sku)), row_no DESC
+        """)
+
+        # Typed values the merge would write; invalid rows never reach the casts
+        compared = [col for col in usable_columns if col != 'sku']
+        cast_types = {
+            col: f"numeric({columns[col]['precision']}, {columns[col]['scale']})"
+            if columns[col]['data_type'] == 'numeric' and columns[col]['precision'] is not None
+            else columns[col]['data_type']
+            for col in compared
+        }
+        typed_exprs = [f"{_cast_expr(col, cast_types[col])} AS {col}" for col in compared]
+        if mode in ('sync', 'replace') and 'active' not in usable_columns and 'active' in columns:
+            compared.append('active')
+            typed_exprs.append('TRUE AS active')
+        typed_exprs.append("COALESCE(LOWER(TRIM(op)) = 'delete', FALSE) AS is_delete" if mode == 'delta' else "FALSE AS is_delete")
+        typed = f"""(
+            SELECT row_no, TRIM(sku) AS sku, {', '.join(typed_exprs)}
+            FROM preview_winners WHERE invalid IS NULL
+        ) AS w"""
+        # Inventory imports leave a field alone when its value is blank
+        new_value = (lambda c: f"COALESCE(w.{c}, p.{c})") if mode == 'inventory' else (lambda c: f"w.{c}")
+        if compared:
+            changed = f"({', '.join(new_value(c) for c in compared)}) IS DISTINCT FROM ({', '.join(f'p.{c}' for c in compared)})"
+        else:
+            changed = "FALSE"
+
+        # One outcome per valid winning row, from a single pass over the LOWER(sku) join
         cur.execute(f"""
-            CREATE TEMP TABLE tmp_products ({temp_cols}) ON COMMIT DROP
+            CREATE TEMP TABLE preview_outcomes ON COMMIT DROP AS
+            SELECT w.row_no, CASE
+                WHEN w.is_delete AND p.id IS NULL THEN 'deletes_missing'
+                WHEN w.is_delete THEN 'deletes'
+                WHEN p.id IS NULL THEN '{'missing' if mode == 'inventory' else 'inserts'}'
+                WHEN {changed} THEN 'updates'
+                ELSE 'unchanged'
+            END AS outcome
+            FROM {typed}
+            LEFT JOIN products p ON LOWER(p.sku) = LOWER(w.sku)
         """)
-        
-        # Copy data
-        cur.copy_expert(
-            sql="COPY tmp_products FROM STDIN WITH (FORMAT CSV, HEADER true, QUOTE '\"', ESCAPE '\"')",
-            file=output
-        )
-        
-        self.update_state(
-            state='PROGRESS',
-            meta={'progress': 90, 'current': row_num, 'total': total_rows, 'message': 'Saving to database...'}
-        )
-        
-        # Build INSERT with upsert on SKU
-        columns_str = ', '.join(usable_columns)
-        select_str = ', '.join([f"NULLIF(TRIM({col}), '')" if col not in ['sku', 'name'] else col for col in usable_columns])
-        
-        # Check if SKU unique constraint exists
+        outcome = dict.fromkeys(('inserts', 'updates', 'unchanged', 'deletes', 'deletes_missing', 'missing'), 0)
+        cur.execute("SELECT outcome, COUNT(*) FROM preview_outcomes GROUP BY outcome")
+        outcome.update(cur.fetchall())
+        cur.execute("SELECT COUNT(*), COUNT(invalid) FROM preview_winners")
+        outcome['unique_skus'], outcome['invalid_rows'] = cur.fetchone()
+
         cur.execute("""
-            SELECT 1 FROM pg_indexes 
-            WHERE indexname = 'products_sku_lower_unique'
+            SELECT col, COUNT(*) FROM preview_winners, unnest(string_to_array(invalid, ',')) AS col
+            WHERE invalid IS NOT NULL
+            GROUP BY col ORDER BY col
         """)
-        has_sku_unique = cur.fetchone() is not None
-        
-        if has_sku_unique and 'sku' in usable_columns:
-            # Upsert on SKU
-            update_cols = [col for col in usable_columns if col not in ['sku', 'id']]
-            update_str = ', '.join([f"{col} = EXCLUDED.{col}" for col in update_cols])
-            
+        invalid_by_column = dict(cur.fetchall())
+
+        deactivations = 0
+        if mode == 'sync':
+            in_sample = f"AND {_sku_bucket_sql('p.sku')} < {int(sample * _SKU_BUCKETS)}" if sample else ""
             cur.execute(f"""
-                INSERT INTO products ({columns_str})
-                SELECT {select_str}
-                FROM tmp_products
-                WHERE sku IS NOT NULL AND TRIM(sku) != ''
-                ON CONFLICT (LOWER(sku)) DO UPDATE SET
-                    {update_str},
-                    updated_at = NOW()
+                SELECT COUNT(*) FROM products p
+                WHERE p.active {in_sample}
+                  AND NOT EXISTS (SELECT 1 FROM preview_stage s WHERE LOWER(TRIM(s.sku)) = LOWER(p.sku))
             """)
-        else:
-            # Simple insert
+            deactivations = cur.fetchone()[0]
+
+        removals = 0
+        if mode == 'replace':
+            in_sample = f"AND {_sku_bucket_sql('p.sku')} < {int(sample * _SKU_BUCKETS)}" if sample else ""
             cur.execute(f"""
-                INSERT INTO products ({columns_str})
-                SELECT {select_str}
-                FROM tmp_products
-                WHERE sku IS NOT NULL AND TRIM(sku) != ''
+                SELECT COUNT(*) FROM products p
+                WHERE NOT EXISTS (SELECT 1 FROM preview_stage s WHERE LOWER(TRIM(s.sku)) = LOWER(p.sku)) {in_sample}
             """)
-        
-        rows_inserted = cur.rowcount
-        conn.commit()
-        
+            removals = cur.fetchone()[0]
+
+        def first_rows(kind):
+            return f"""(
+                SELECT row_no FROM preview_outcomes WHERE outcome = '{kind}'
+                ORDER BY row_no LIMIT {PREVIEW_EXAMPLES}
+            ) AS o"""
+
+        examples = {}
+        values = ', '.join(f"'{c}', w.{c}" for c in compared)
+        cur.execute(f"""
+            SELECT w.row_no, w.sku, jsonb_build_object({values})
+            FROM {typed} JOIN {first_rows('inserts')} USING (row_no)
+            ORDER BY w.row_no
+        """)
+        examples['insert'] = [{'row': r[0], 'sku': r[1], 'values': r[2]} for r in cur.fetchall()]
+
+        diffs = ', '.join(
+            f"'{c}', CASE WHEN {new_value(c)} IS DISTINCT FROM p.{c} THEN jsonb_build_object('old', p.{c}, 'new', {new_value(c)}) END"
+            for c in compared
+        )
+        cur.execute(f"""
+            SELECT w.row_no, p.sku, jsonb_strip_nulls(jsonb_build_object({diffs}))
+            FROM {typed} JOIN {first_rows('updates')} USING (row_no)
+            JOIN products p ON LOWER(p.sku) = LOWER(w.sku)
+            ORDER BY w.row_no
+        """)
+        examples['update'] = [{'row': r[0], 'sku': r[1], 'changes': r[2]} for r in cur.fetchall()]
+
+        cur.execute(f"""
+            SELECT row_no, TRIM(sku), invalid, {', '.join(stage_columns)}
+            FROM preview_winners WHERE invalid IS NOT NULL
+            ORDER BY row_no LIMIT {PREVIEW_EXAMPLES}
+        """)
+        examples['invalid'] = []
+        for row in cur.fetchall():
+            raw_values = dict(zip(stage_columns, row[3:]))
+            examples['invalid'].append({
+                'row': row[0], 'sku': row[1],
+                'values': {col: raw_values[col] for col in row[2].split(',')}
+            })
+
+        conn.rollback()
         cur.close()
+    finally:
         conn.close()
-        
-        # Delete file
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        
-        return {
+
+    duplicates = counts['rows_sampled'] - counts['rows_without_sku'] - outcome['unique_skus']
+    stats = {
+        **outcome,
+        'duplicates': duplicates,
+        'deactivations': deactivations,
+        'removals': removals,
+    }
+    # The real import would fail on these (casts fail in the merge batch that reaches them)
+    would_fail = (
+        outcome['invalid_rows'] > 0
+        or (engine == 'postgres' and counts['malformed_rows'] > 0)
+        or (mode in ('sync', 'replace') and counts['rows_read'] == 0)
+    )
+
+    result = {
+        'status': 'preview',
+        'engine': engine,
+        'mode': mode,
+        'sample': sample,
+        'file': file_path,
+        'columns': {
+            'used': usable_columns,
+            'ignored': [col for col in csv_headers if col not in columns and col not in stage_columns],
+            'missing': [col for col in columns if col not in csv_headers],
+        },
+        **counts,
+        **stats,
+        'duplicate_ratio': round(duplicates / max(counts['rows_sampled'] - counts['rows_without_sku'], 1), 4),
+        'invalid_by_column': invalid_by_column,
+        'would_fail': would_fail,
+        'examples': examples,
+    }
+    if sample:
+        # Scale the sampled counts up to the whole file
+        result['estimated'] = {key: round(value / sample) for key, value in stats.items()}
+
+    _report(self, 100, counts['rows_read'], counts['rows_read'], 'Preview complete')
+    return result
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def process_csv_task(self, file_path: str, engine: str = 'python', mode: str = 'upsert',
+                     preview: bool = False, sample: float = None):
+    """
+    Process CSV file with progress reporting.
+
+    engine='python' de-duplicates in the worker before COPY;
+    engine='postgres' COPYs the raw file and de-duplicates in the database.
+    mode='upsert' inserts/updates; mode='sync' treats the file as the full catalog
+    and deactivates SKUs missing from it; mode='delta' applies a per-row 'op' column;
+    mode='replace' swaps in a new catalog built from the file (see _replace_catalog);
+    mode='inventory' only updates price and stock_quantity of existing SKUs.
+    preview=True only reports what the import would do (see _preview_import);
+    `sample` (0-1) limits a preview to that fraction of SKUs.
+
+    Progress is checkpointed in import_checkpoints; the message is only acked
+    once the task finishes, so a job interrupted by a worker crash or restart
+    is redelivered and resumes from its last checkpoint.
+    """
+    conn = None
+    ckpt = None
+    job_id = self.request.id or str(uuid.uuid4())
+    try:
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}', expected one of: {', '.join(ENGINES)}")
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode '{mode}', expected one of: {', '.join(MODES)}")
+        if preview:
+            result = _preview_import(self, file_path, engine, mode, sample)
+            _release_file(file_path, engine, mode, job_id)
+            return result
+
+        # Connect to PostgreSQL
+        conn = psycopg2.connect(os.getenv('DATABASE_URL'))
+        cur = conn.cursor()
+
+        _ensure_checkpoints(cur)
+        _prune_checkpoints(cur)
+        ckpt = _load_checkpoint(cur, job_id)
+        if ckpt and ckpt['phase'] == 'done':
+            # Redelivered after it finished but before the ack
+            conn.commit()
+            conn.close()
+            _release_file(file_path, engine, mode, job_id)
+            return ckpt['result']
+        if ckpt and ckpt['phase'] != 'failed' and not _stage_is_intact(cur, ckpt):
+            print(f"Staging data for {job_id} was lost, restarting import from the beginning")
+            cur.execute("DELETE FROM import_checkpoints WHERE job_id = %s", (job_id,))
+            ckpt = None
+        if ckpt and ckpt['phase'] == 'failed':
+            cur.execute("DELETE FROM import_checkpoints WHERE job_id = %s", (job_id,))
+            ckpt = None
+
+        resumed = ckpt is not None
+        if not resumed:
+            # The job has left the queue; stop counting it against the queued-bytes budget
+            try:
+                release_import(job_id, os.path.getsize(file_path))
+            except (OSError, redis.RedisError) as e:
+                print(f"Warning: could not release queued bytes for {job_id}: {e}")
+            ckpt = _start_checkpoint(cur, job_id, file_path, engine, mode)
+        conn.commit()
+        try:
+            touch_upload(file_path)
+        except redis.RedisError as e:
+            print(f"Warning: could not refresh upload references for {job_id}: {e}")
+        if not resumed:
+            fire_event('import.started', {'job_id': job_id, 'engine': engine, 'mode': mode,
+                                          'file': os.path.basename(file_path)})
+
+        # Report initial progress
+        _report(self, 0, 0, 0, f"Resuming import from phase '{ckpt['phase']}'..." if resumed else 'Starting import...')
+
+        # Get database columns and their types
+        cur.execute("""
+            SELECT column_name, data_type
+            FROM information_schema.columns
+            WHERE table_name = 'products'
+            ORDER BY ordinal_position
+        """)
+        db_types = {row[0]: row[1] for row in cur.fetchall() if row[0] not in ['id', 'created_at', 'updated_at']}
+
+        # Read CSV header
+        with open(file_path, 'r', encoding='utf-8', newline='') as f:
+            csv_headers = next(csv.reader(f), [])
+
+        # Determine usable columns
+        usable_columns = [col for col in csv_headers if col in db_types]
+        if mode == 'inventory':
+            usable_columns = [col for col in usable_columns if col in INVENTORY_COLUMNS]
+            if 'sku' not in usable_columns or len(usable_columns) < 2:
+                raise ValueError("Inventory imports need a 'sku' column and 'price' and/or 'stock_quantity'")
+
+        if not usable_columns:
+            raise ValueError(f"No matching columns between CSV and database")
+        if mode == 'delta' and 'op' not in csv_headers:
+            raise ValueError("Delta imports need an 'op' column (upsert or delete)")
+        if mode == 'replace' and 'sku' not in usable_columns:
+            raise ValueError("Replace imports need a 'sku' column")
+
+        # The staging table carries the op column through de-duplication in delta mode
+        stage_columns = usable_columns + (['op'] if mode == 'delta' else [])
+
+        if ckpt['phase'] == 'staging':
+            _report(self, 10, 0, 0, 'Copying file into staging table...')
+            if engine == 'postgres':
+                _stage_postgres(self, conn, cur, ckpt, file_path, csv_headers)
+            else:
+                _stage_python(self, conn, cur, ckpt, file_path, stage_columns)
+            ckpt = _load_checkpoint(cur, job_id)
+
+        if mode == 'sync' and ckpt['rows_read'] == 0:
+            raise ValueError("Refusing to sync an empty snapshot: it would deactivate every product")
+        if mode == 'replace' and ckpt['rows_read'] == 0:
+            raise ValueError("Refusing to replace the catalog with an empty file")
+        if mode == 'delta':
+            _check_delta_ops(cur, ckpt['stage_table'])
+
+        # Staging runs concurrently with other jobs; writes to the catalog are serialized
+        # per batch (see _merge_batches), except a replace, which has it to itself
+        if ckpt['phase'] == 'staged' and mode == 'replace':
+            _lock_catalog(self, conn, cur, CATALOG)
+            _replace_catalog(self, conn, cur, ckpt, usable_columns, db_types)
+            _unlock_catalog(cur, CATALOG)
+            conn.commit()
+        elif ckpt['phase'] == 'staged':
+            _report(self, 60, ckpt['merged_through'], ckpt['rows_read'], 'Saving to database...')
+            _merge_batches(self, conn, cur, ckpt, usable_columns, db_types, mode)
+
+        deactivated = 0
+        if mode == 'sync':
+            deactivated = _deactivate_missing(self, conn, cur, ckpt)
+
+        rows_read = ckpt['rows_read']
+        unique_count = ckpt['unique_count']
+        if unique_count is None:
+            unique_count = min(rows_read, ckpt['rows_processed'] + ckpt['deleted'] + ckpt['unchanged'] + ckpt['missing'])
+
+        result = {
             'status': 'success',
-            'rows_processed': rows_inserted,
+            'engine': engine,
+            'mode': mode,
+            'rows_read': rows_read,
+            'duplicates_removed': rows_read - unique_count,
+            'rows_processed': ckpt['rows_processed'],
+            'unchanged': ckpt['unchanged'],
+            'deleted': ckpt['deleted'],
+            'deactivated': deactivated,
+            'resumed': resumed,
             'file': file_path,
             'columns_used': usable_columns
         }
-        
+        if mode == 'inventory':
+            # SKUs in the feed that aren't in the catalog; inventory imports never create products
+            result['missing'] = ckpt['missing']
+
+        cur.execute(f"DROP TABLE IF EXISTS {ckpt['stage_table']}")
+        _save_checkpoint(cur, job_id, phase='done', result=Json(result))
+        # The version our last batch left behind; a resumed job that wrote nothing reads it now
+        catalog_version = ckpt.get('catalog_version')
+        if catalog_version is None:
+            _lock_catalog_batch(cur, CATALOG)
+            catalog_version = _catalog_version(cur)
+        conn.commit()
+
+        cur.close()
+        conn.close()
+
+        try:
+            # Identical uploads get this result back while the catalog stays at this version
+            record_result(file_path, engine, mode, job_id, catalog_version, result)
+        except redis.RedisError as e:
+            print(f"Warning: could not record the result of {job_id}: {e}")
+        _release_file(file_path, engine, mode, job_id)
+
+        fire_event('import.completed', {'job_id': job_id, **result})
+        return result
+
     except Exception as e:
         if conn:
             conn.rollback()
+            # Batches commit as they go, so clean up the staging table explicitly
+            if ckpt:
+                try:
+                    cur.execute(f"DROP TABLE IF EXISTS {ckpt['stage_table']}")
+                    _save_checkpoint(cur, job_id, phase='failed', result=Json({'error': str(e)}))
+                    conn.commit()
+                except psycopg2.Error:
+                    pass
             conn.close()
-        
+
+        # Nothing resumes a failed job, so its file can go
+        _release_file(file_path, engine, mode, job_id)
+
         error_msg = f"Error processing CSV: {str(e)}"
         print(error_msg)
+        if not preview:
+            fire_event('import.failed', {'job_id': job_id, 'file': os.path.basename(file_path), 'error': str(e)})
         raise Exception(error_msg)
 
 
+# The final state goes out once Celery has the outcome, so streams end with the stored result
+@task_success.connect(sender=process_csv_task)
+def _publish_completed(sender=None, result=None, **kwargs):
+    if sender.request.id:
+        publish_state(sender.request.id, completed_state(result))
+
+
+@task_failure.connect(sender=process_csv_task)
+def _publish_failed(sender=None, task_id=None, exception=None, **kwargs):
+    if task_id:
+        publish_state(task_id, failed_state(exception))
+
+
 @shared_task
 def trigger_webhook_test(webhook_url: str, data: dict):
     """Test webhook endpoint."""
     try:
-        response = requests.post(
+        response = http_session().post(
             webhook_url,
             json=data,
             headers={'Content-Type': 'application/json'},
-            timeout=10
+            timeout=(WEBHOOK_CONNECT_TIMEOUT, WEBHOOK_READ_TIMEOUT)
         )
         return {
             'status': 'success',
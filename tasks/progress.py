@@ -0,0 +1,49 @@
+"""
+Job progress in Redis.
+
+Import jobs publish every progress update, and their final result or
+error, as JSON on the channel job:<job_id>. The latest state is also kept
+under job:<job_id>:state for JOB_STATE_TTL seconds, so the API answers
+status requests and starts progress streams with a single GET, without the
+Celery result backend. States have the shape of GET /upload/status.
+
+Kept free of worker dependencies (psycopg2, requests) so the API can import it.
+"""
+import json
+import os
+import redis
+from tasks.queues import _client
+
+JOB_CHANNEL = 'job:{}'
+JOB_CHANNEL_PATTERN = 'job:*'
+JOB_STATE_KEY = 'job:{}:state'
+# Matches Celery's result_expires, so status outlives neither side
+JOB_STATE_TTL = int(os.getenv('JOB_STATE_TTL', str(24 * 3600)))
+
+FINAL_STATUSES = ('completed', 'failed')
+
+QUEUED_STATE = {'status': 'processing', 'progress': 0, 'message': 'Starting...'}
+
+
+def progress_state(progress, current, total, message):
+    return {'status': 'processing', 'progress': progress, 'current': current, 'total': total, 'message': message}
+
+
+def completed_state(result):
+    return {'status': 'completed', 'progress': 100, 'result': result}
+
+
+def failed_state(error):
+    return {'status': 'failed', 'progress': 0, 'error': str(error)}
+
+
+def publish_state(job_id: str, state: dict):
+    """Store `state` as the job's latest and publish it; never raises, progress is best effort."""
+    payload = json.dumps(state, default=str)
+    try:
+        pipe = _client().pipeline(transaction=False)
+        pipe.set(JOB_STATE_KEY.format(job_id), payload, ex=JOB_STATE_TTL)
+        pipe.publish(JOB_CHANNEL.format(job_id), payload)
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"Warning: could not publish progress of job {job_id}: {e}")
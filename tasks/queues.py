@@ -0,0 +1,67 @@
+"""
+Queue routing and admission control for import jobs.
+
+Kept free of worker dependencies (psycopg2, requests) so the API can import it.
+"""
+import os
+import time
+import redis
+
+# Large imports, small "fast lane" imports and webhook deliveries use separate queues
+# so one huge upload can't hold every worker slot.
+IMPORTS_QUEUE = 'imports'
+IMPORTS_PRIORITY_QUEUE = 'imports_priority'
+WEBHOOKS_QUEUE = 'webhooks'
+# Deliveries to slow or failing webhook endpoints (see tasks/webhooks.py)
+WEBHOOKS_SLOW_QUEUE = 'webhooks_slow'
+
+# Files up to this size go to the priority queue
+SMALL_IMPORT_BYTES = int(os.getenv('SMALL_IMPORT_BYTES', str(5 * 1024 * 1024)))
+# Upper bound on bytes waiting in the bulk import queue (soft limit)
+MAX_QUEUED_IMPORT_BYTES = int(os.getenv('MAX_QUEUED_IMPORT_BYTES', str(2 * 1024 * 1024 * 1024)))
+# Queued entries older than this are assumed lost (e.g. purged queue) and stop counting
+QUEUED_ENTRY_TTL = int(os.getenv('QUEUED_ENTRY_TTL', str(6 * 3600)))
+
+QUEUED_BYTES_KEY = 'imports:queued'
+
+_redis = None
+
+
+def _client():
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(os.getenv('REDIS_URL', 'redis://redis:6379/0'))
+    return _redis
+
+
+def import_queue_for(size_bytes: int):
+    """Pick the import queue for a file of `size_bytes`."""
+    return IMPORTS_PRIORITY_QUEUE if size_bytes <= SMALL_IMPORT_BYTES else IMPORTS_QUEUE
+
+
+def queued_import_bytes():
+    """Bytes of bulk imports that are queued but not yet started."""
+    client = _client()
+    client.zremrangebyscore(QUEUED_BYTES_KEY, '-inf', time.time() - QUEUED_ENTRY_TTL)
+    members = client.zrange(QUEUED_BYTES_KEY, 0, -1)
+    return sum(int(member.rsplit(b':', 1)[1]) for member in members)
+
+
+def admit_import(job_id: str, size_bytes: int):
+    """
+    Record a bulk import as queued if it fits within MAX_QUEUED_IMPORT_BYTES.
+    Returns False when the queue is full. Priority-lane files are always admitted.
+    """
+    if import_queue_for(size_bytes) == IMPORTS_PRIORITY_QUEUE:
+        return True
+    queued = queued_import_bytes()
+    # A single file larger than the budget is still admitted into an empty queue
+    if queued and queued + size_bytes > MAX_QUEUED_IMPORT_BYTES:
+        return False
+    _client().zadd(QUEUED_BYTES_KEY, {f'{job_id}:{size_bytes}': time.time()})
+    return True
+
+
+def release_import(job_id: str, size_bytes: int):
+    """Stop counting a job against the queued-bytes budget. Safe to call more than once."""
+    _client().zrem(QUEUED_BYTES_KEY, f'{job_id}:{size_bytes}')
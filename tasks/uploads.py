@@ -0,0 +1,180 @@
+"""
+Content-addressed upload store.
+
+Uploads are saved as UPLOAD_DIR/<sha256>.csv, so the same file uploaded
+twice is stored once. Each queued job holds a reference on its file in
+Redis; the job drops it when it finishes (or fails) and the file is
+removed with the last reference. References expire after
+UPLOAD_RETENTION_HOURS unless a running job refreshes them, and
+gc_uploads (celery beat) removes files nobody references after that, so
+files of lost jobs don't pile up.
+
+Finished imports record their result per (file, engine, mode) together
+with the catalog version they left behind. While the catalog version is
+unchanged, uploading the same file again would change nothing, so the
+API returns the recorded result instead of queueing a job.
+
+Kept free of worker dependencies (psycopg2, requests) so the API can import it.
+"""
+from celery import shared_task
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from tasks.queues import _client
+
+UPLOAD_DIR = os.getenv('UPLOAD_DIR', '/tmp/uploads')
+# Unreferenced files (and abandoned partial writes) older than this are removed by gc_uploads
+UPLOAD_RETENTION_HOURS = float(os.getenv('UPLOAD_RETENTION_HOURS', '24'))
+# Results of finished imports are reused for identical uploads this long; the default
+# matches Celery's result_expires, so GET /upload/status still knows the returned job
+UPLOAD_RESULT_TTL = int(os.getenv('UPLOAD_RESULT_TTL', str(24 * 3600)))
+
+REFS_KEY = 'uploads:refs:{}'
+LOCK_KEY = 'uploads:lock:{}'
+INFLIGHT_KEY = 'uploads:inflight:{}:{}:{}'
+RESULT_KEY = 'uploads:result:{}:{}:{}'
+
+_STORED_NAME = re.compile(r'^([0-9a-f]{64})\.csv$')
+_PARTIAL_SUFFIX = '.part'
+_COPY_CHUNK = 1024 * 1024
+
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+
+def upload_path(sha256: str):
+    return os.path.join(UPLOAD_DIR, f'{sha256}.csv')
+
+
+def upload_sha(file_path: str):
+    """The content hash of a stored upload, or None for files outside the store."""
+    match = _STORED_NAME.match(os.path.basename(file_path))
+    if not match or os.path.dirname(os.path.abspath(file_path)) != os.path.abspath(UPLOAD_DIR):
+        return None
+    return match.group(1)
+
+
+def _refs_ttl():
+    return int(UPLOAD_RETENTION_HOURS * 3600)
+
+
+def store_upload(source, job_id: str):
+    """
+    Copy the file-like `source` into the store and reference it for `job_id`.
+    Returns (sha256, path, size).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, suffix=_PARTIAL_SUFFIX, delete=False) as out:
+        try:
+            while True:
+                chunk = source.read(_COPY_CHUNK)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        except BaseException:
+            os.remove(out.name)
+            raise
+
+    sha256 = digest.hexdigest()
+    path = upload_path(sha256)
+    # Under the lock, so a finishing job can't remove the file between the rename and the reference
+    with _client().lock(LOCK_KEY.format(sha256), timeout=60, blocking_timeout=60):
+        os.replace(out.name, path)
+        pipe = _client().pipeline()
+        pipe.sadd(REFS_KEY.format(sha256), job_id)
+        pipe.expire(REFS_KEY.format(sha256), _refs_ttl())
+        pipe.execute()
+    return sha256, path, size
+
+
+def touch_upload(file_path: str):
+    """Keep a file's references (and the file) alive while a job works on it."""
+    sha256 = upload_sha(file_path)
+    if sha256 is not None:
+        _client().expire(REFS_KEY.format(sha256), _refs_ttl())
+
+
+def release_upload(file_path: str, job_id: str):
+    """Drop `job_id`'s reference on its file; the last reference removes the file."""
+    sha256 = upload_sha(file_path)
+    if sha256 is None:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        return
+    with _client().lock(LOCK_KEY.format(sha256), timeout=60, blocking_timeout=60):
+        _client().srem(REFS_KEY.format(sha256), job_id)
+        if not _client().scard(REFS_KEY.format(sha256)) and os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def claim_inflight(sha256: str, engine: str, mode: str, job_id: str):
+    """
+    Register `job_id` as the job importing this file with these options.
+    Returns the job_id of an identical job that is already queued or running, or None.
+    """
+    key = INFLIGHT_KEY.format(sha256, engine, mode)
+    if _client().set(key, job_id, nx=True, ex=_refs_ttl()):
+        return None
+    existing = _client().get(key)
+    return existing.decode() if existing else None
+
+
+def clear_inflight(file_path: str, engine: str, mode: str, job_id: str):
+    sha256 = upload_sha(file_path)
+    if sha256 is None:
+        return
+    key = INFLIGHT_KEY.format(sha256, engine, mode)
+    # Only the claiming job clears it
+    if _client().get(key) == job_id.encode():
+        _client().delete(key)
+
+
+def record_result(file_path: str, engine: str, mode: str, job_id: str, catalog_version: int, result: dict):
+    sha256 = upload_sha(file_path)
+    if sha256 is None:
+        return
+    _client().set(
+        RESULT_KEY.format(sha256, engine, mode),
+        json.dumps({'job_id': job_id, 'catalog_version': catalog_version, 'result': result}),
+        ex=UPLOAD_RESULT_TTL,
+    )
+
+
+def find_result(sha256: str, engine: str, mode: str):
+    """{'job_id', 'catalog_version', 'result'} of the last finished import of this file, or None."""
+    raw = _client().get(RESULT_KEY.format(sha256, engine, mode))
+    return json.loads(raw) if raw else None
+
+
+@shared_task
+def gc_uploads():
+    """
+    Remove files older than the retention that no job references: stored
+    uploads, abandoned partial writes and files saved under their original
+    names by older versions.
+    """
+    cutoff = time.time() - UPLOAD_RETENTION_HOURS * 3600
+    removed = 0
+    for name in os.listdir(UPLOAD_DIR):
+        path = os.path.join(UPLOAD_DIR, name)
+        try:
+            if os.path.getmtime(path) >= cutoff:
+                continue
+            match = _STORED_NAME.match(name)
+            if match:
+                sha256 = match.group(1)
+                with _client().lock(LOCK_KEY.format(sha256), timeout=60, blocking_timeout=60):
+                    if _client().scard(REFS_KEY.format(sha256)):
+                        continue
+                    os.remove(path)
+            else:
+                os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            continue
+    return {'removed': removed}
@@ -0,0 +1,207 @@
+"""
+Webhook event routing and endpoint health.
+
+Every process that fires events keeps an in-memory index of the active
+webhooks by event pattern, and memoizes the subscribers of each event it
+has resolved, so routing an event is a dict lookup. Webhook CRUD bumps a
+version counter in Redis; each process compares it with the version of
+its index at most every WEBHOOK_ROUTING_CHECK_INTERVAL seconds and
+reloads from the database when it changed.
+
+Per-webhook health (latency and failure-rate EWMAs, circuit breaker
+state) lives in Redis and is written by tasks/delivery.py. Endpoints that
+are slow or have an open breaker get their deliveries on webhooks_slow,
+so they can't take worker slots from healthy ones.
+
+The API imports this module, so it dispatches deliveries by task name
+and stays free of worker-only dependencies.
+"""
+import os
+import time
+import psycopg2
+import redis
+from tasks.celery_app import celery
+from tasks.names import DELIVER_WEBHOOK_TASK
+from tasks.queues import _client, WEBHOOKS_QUEUE, WEBHOOKS_SLOW_QUEUE
+
+EVENT_TYPES = (
+    "product.created",
+    "product.updated",
+    "product.deleted",
+    "import.started",
+    "import.completed",
+    "import.failed",
+)
+
+ROUTING_VERSION_KEY = 'webhooks:routing_version'
+ROUTING_CHECK_INTERVAL = float(os.getenv('WEBHOOK_ROUTING_CHECK_INTERVAL', '1'))
+
+WEBHOOK_CONNECT_TIMEOUT = float(os.getenv('WEBHOOK_CONNECT_TIMEOUT', '3'))
+WEBHOOK_READ_TIMEOUT = float(os.getenv('WEBHOOK_READ_TIMEOUT', '5'))
+# Endpoints whose latency EWMA exceeds this are delivered on the slow queue
+WEBHOOK_SLOW_MS = float(os.getenv('WEBHOOK_SLOW_MS', '1000'))
+WEBHOOK_MAX_RETRIES = int(os.getenv('WEBHOOK_MAX_RETRIES', '8'))
+BREAKER_FAILURES = int(os.getenv('WEBHOOK_BREAKER_FAILURES', '5'))
+BREAKER_COOLDOWN = float(os.getenv('WEBHOOK_BREAKER_COOLDOWN', '30'))
+BREAKER_MAX_COOLDOWN = float(os.getenv('WEBHOOK_BREAKER_MAX_COOLDOWN', '900'))
+# Deliveries still pending this long after being queued are dropped. Defaults to
+# the full retry backoff plus one longest breaker cooldown.
+WEBHOOK_MAX_AGE = float(os.getenv('WEBHOOK_MAX_AGE', str(
+    sum(min(2 ** attempt * 5, BREAKER_MAX_COOLDOWN) for attempt in range(WEBHOOK_MAX_RETRIES)) + BREAKER_MAX_COOLDOWN
+)))
+EWMA_ALPHA = 0.2
+
+HEALTH_KEY = 'webhooks:health:{}'
+PROBE_KEY = 'webhooks:probe:{}'
+# Health of webhooks that stop receiving events expires after a week
+HEALTH_TTL = 7 * 24 * 3600
+
+
+def is_valid_pattern(pattern: str):
+    """An event type, '<prefix>.*' matching at least one event type, or '*'."""
+    if pattern == '*' or pattern in EVENT_TYPES:
+        return True
+    return pattern.endswith('.*') and any(e.startswith(pattern[:-1]) for e in EVENT_TYPES)
+
+
+def _patterns_for(event: str):
+    """Patterns that match `event`: itself, each 'prefix.*' above it, and '*'."""
+    parts = event.split('.')
+    return [event] + ['.'.join(parts[:i]) + '.*' for i in range(len(parts) - 1, 0, -1)] + ['*']
+
+
+class RoutingIndex:
+    """Event pattern -> active webhooks, reloaded when the routing version changes."""
+
+    def __init__(self):
+        # (pattern -> webhooks, event -> resolved subscribers), replaced as one
+        # pair so a lookup never caches results into a newer load's memo
+        self._routing = ({}, {})
+        self._version = None
+        self._loaded = False
+        self._checked_at = 0.0
+
+    def invalidate(self):
+        self._loaded = False
+
+    def _load(self):
+        conn = psycopg2.connect(os.getenv('DATABASE_URL'))
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT id, url, event_types FROM webhooks WHERE is_active ORDER BY id")
+                rows = cur.fetchall()
+        finally:
+            conn.close()
+
+        by_pattern = {}
+        for webhook_id, url, event_types in rows:
+            for pattern in set(event_types):
+                by_pattern.setdefault(pattern, []).append((webhook_id, url))
+        self._routing = (by_pattern, {})
+        self._loaded = True
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._loaded and now - self._checked_at < ROUTING_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        try:
+            version = _client().get(ROUTING_VERSION_KEY)
+            if version is None:
+                # Fresh or flushed Redis: start the counter, so the next check has a version to compare
+                _client().set(ROUTING_VERSION_KEY, 0, nx=True)
+                version = _client().get(ROUTING_VERSION_KEY)
+        except redis.RedisError:
+            # Can't tell whether anything changed; reload on every check until Redis is back
+            version = None
+        if self._loaded and version is not None and version == self._version:
+            return
+        self._load()
+        self._version = version
+
+    def subscribers(self, event: str):
+        """(webhook_id, url) of every active webhook subscribed to `event`."""
+        self._refresh()
+        by_pattern, resolved = self._routing
+        hooks = resolved.get(event)
+        if hooks is None:
+            seen = {}
+            for pattern in _patterns_for(event):
+                for webhook_id, url in by_pattern.get(pattern, ()):
+                    seen.setdefault(webhook_id, url)
+            hooks = resolved[event] = tuple(seen.items())
+        return hooks
+
+
+routing = RoutingIndex()
+
+
+def bump_routing_version():
+    """Tell every process to reload its routing index; call after changing webhooks."""
+    routing.invalidate()
+    try:
+        _client().incr(ROUTING_VERSION_KEY)
+    except redis.RedisError as e:
+        print(f"Warning: could not bump webhook routing version: {e}")
+
+
+def _parse_health(raw: dict):
+    raw = {k.decode(): v.decode() for k, v in raw.items()}
+    return {
+        'state': raw.get('state', 'closed'),
+        'ewma_ms': float(raw['ewma_ms']) if 'ewma_ms' in raw else None,
+        'failure_rate': float(raw.get('failure_rate', 0)),
+        'consecutive_failures': int(raw.get('consecutive_failures', 0)),
+        'deliveries': int(raw.get('deliveries', 0)),
+        'failures': int(raw.get('failures', 0)),
+        'cooldown': float(raw.get('cooldown', BREAKER_COOLDOWN)),
+        'open_until': float(raw.get('open_until', 0)),
+        'last_status': int(raw['last_status']) if raw.get('last_status') else None,
+        'last_error': raw.get('last_error') or None,
+        'last_attempt_at': raw.get('last_attempt_at'),
+    }
+
+
+def get_health(webhook_ids):
+    """{webhook_id: health} for each id; webhooks never delivered to get the defaults."""
+    pipe = _client().pipeline()
+    for webhook_id in webhook_ids:
+        pipe.hgetall(HEALTH_KEY.format(webhook_id))
+    return {webhook_id: _parse_health(raw) for webhook_id, raw in zip(webhook_ids, pipe.execute())}
+
+
+def reset_health(webhook_id: int):
+    """Forget an endpoint's health and close its breaker."""
+    _client().delete(HEALTH_KEY.format(webhook_id), PROBE_KEY.format(webhook_id))
+
+
+def _is_degraded(health: dict):
+    return health['state'] != 'closed' or (health['ewma_ms'] or 0) > WEBHOOK_SLOW_MS
+
+
+def fire_event(event: str, data: dict):
+    """
+    Queue a delivery of `event` to each subscribed webhook. Never raises, so
+    the write that triggered the event isn't failed by a webhook problem.
+    Returns the number of deliveries queued.
+    """
+    try:
+        subscribers = routing.subscribers(event)
+        if not subscribers:
+            return 0
+        try:
+            health = get_health([webhook_id for webhook_id, _ in subscribers])
+        except redis.RedisError:
+            health = {}
+        for webhook_id, url in subscribers:
+            degraded = webhook_id in health and _is_degraded(health[webhook_id])
+            celery.send_task(
+                DELIVER_WEBHOOK_TASK,
+                args=[webhook_id, url, event, data],
+                kwargs={'queued_at': time.time()},
+                queue=WEBHOOKS_SLOW_QUEUE if degraded else WEBHOOKS_QUEUE,
+            )
+        return len(subscribers)
+    except Exception as e:
+        print(f"Warning: could not fire {event}: {e}")
+        return 0
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import pytest
+from app import admission
+from app.admission import AdmissionMiddleware, RouteClass, classify
+
+
+@pytest.mark.parametrize('method, path, query, expected', [
+    ('GET', '/health', b'', None),
+    ('GET', '/', b'', None),
+    ('GET', '/products/42', b'', 'light'),
+    ('GET', '/upload/status/abc', b'', 'light'),
+    ('GET', '/changes/cursor', b'', 'light'),
+    ('GET', '/products/', b'', 'read'),
+    ('GET', '/products', b'sku=ABC', 'read'),
+    ('GET', '/products/facets', b'category=x', 'read'),
+    ('GET', '/products/', b'search=shoe', 'heavy'),
+    ('GET', '/products/facets', b'search=shoe', 'heavy'),
+    ('GET', '/products/', b'search=', 'read'),
+    ('DELETE', '/products/', b'', 'heavy'),
+    ('POST', '/upload/', b'', 'heavy'),
+    ('PATCH', '/products/inventory', b'', 'heavy'),
+    ('GET', '/upload/progress/abc', b'', 'stream'),
+    ('GET', '/changes', b'wait=10', 'stream'),
+    ('GET', '/changes', b'wait=0', 'read'),
+    ('GET', '/changes', b'wait=soon', 'read'),
+])
+def test_classify(method, path, query, expected):
+    assert classify(method, path, query) == expected
+
+
+def _route_class(monkeypatch, limit, queue, wait_ms):
+    route_class = RouteClass('test', limit=limit, queue=queue, wait_ms=wait_ms)
+    monkeypatch.setitem(admission.ROUTE_CLASSES, 'read', route_class)
+    monkeypatch.setattr(admission, 'ADMISSION_CONTROL', True)
+    return route_class
+
+
+async def _send_requests(count):
+    """Send `count` concurrent requests through the middleware; (status, headers, body) of each."""
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        await release.wait()
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'ok'})
+
+    async def request():
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': '/products/', 'query_string': b''}
+        await AdmissionMiddleware(app)(scope, None, send)
+        start, body = messages
+        return start['status'], dict(start['headers']), body['body']
+
+    tasks = [asyncio.create_task(request()) for _ in range(count)]
+    await asyncio.sleep(0.05)
+    release.set()
+    return await asyncio.gather(*tasks)
+
+
+def test_requests_over_the_queue_get_429(monkeypatch):
+    route_class = _route_class(monkeypatch, limit=1, queue=1, wait_ms=1000)
+    results = asyncio.run(_send_requests(3))
+    assert [status for status, _, _ in results] == [200, 200, 429]
+    status, headers, body = results[2]
+    assert headers[b'retry-after'] == b'1'
+    assert json.loads(body) == {'detail': 'Too many requests, try again later', 'route_class': 'test'}
+    assert b'x-queue-time-ms' in results[1][1]
+    assert route_class.status() == {'limit': 1, 'active': 0, 'queued': 0, 'rejected': 1, 'timed_out': 0}
+
+
+def test_requests_waiting_past_the_budget_get_503(monkeypatch):
+    route_class = _route_class(monkeypatch, limit=1, queue=5, wait_ms=10)
+    results = asyncio.run(_send_requests(2))
+    assert [status for status, _, _ in results] == [200, 503]
+    assert json.loads(results[1][2])['detail'] == 'Server busy, try again later'
+    assert route_class.status()['timed_out'] == 1
+    assert route_class.active == 0
+
+
+def test_slots_go_to_waiters_in_arrival_order():
+    async def main():
+        route_class = RouteClass('test', limit=1, queue=5, wait_ms=1000)
+        order = []
+
+        async def worker(n):
+            assert await route_class.acquire() is None
+            order.append(n)
+            await asyncio.sleep(0)
+            route_class.release()
+
+        await asyncio.gather(*(worker(n) for n in range(4)))
+        return order, route_class.active
+
+    assert asyncio.run(main()) == ([0, 1, 2, 3], 0)
+
+
+def test_cancelled_waiter_passes_its_slot_on():
+    async def main():
+        route_class = RouteClass('test', limit=1, queue=5, wait_ms=1000)
+        assert await route_class.acquire() is None
+        waiter = asyncio.create_task(route_class.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        route_class.release()
+        return route_class.status()
+
+    status = asyncio.run(main())
+    assert (status['active'], status['queued']) == (0, 0)
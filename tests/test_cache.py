@@ -0,0 +1,55 @@
+from app import cache
+from app.cache import TTLCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _cache(monkeypatch, maxsize=3, ttl=10):
+    clock = _Clock()
+    monkeypatch.setattr(cache.time, 'monotonic', clock)
+    return TTLCache(maxsize, ttl), clock
+
+
+def test_get_many_returns_only_cached_keys(monkeypatch):
+    ttl_cache, _ = _cache(monkeypatch)
+    ttl_cache.set_many([('a', 1), ('b', 2)])
+    assert ttl_cache.get_many(['a', 'b', 'c']) == {'a': 1, 'b': 2}
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    ttl_cache, clock = _cache(monkeypatch)
+    ttl_cache.set_many([('a', 1)])
+    clock.now += 10
+    assert ttl_cache.get_many(['a']) == {'a': 1}
+    clock.now += 1
+    assert ttl_cache.get_many(['a']) == {}
+    assert len(ttl_cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted(monkeypatch):
+    ttl_cache, _ = _cache(monkeypatch)
+    ttl_cache.set_many([('a', 1), ('b', 2), ('c', 3)])
+    ttl_cache.get_many(['a'])
+    ttl_cache.set_many([('d', 4)])
+    assert ttl_cache.get_many(['a', 'b', 'c', 'd']) == {'a': 1, 'c': 3, 'd': 4}
+
+
+def test_discard_and_clear(monkeypatch):
+    ttl_cache, _ = _cache(monkeypatch)
+    ttl_cache.set_many([('a', 1), ('b', 2)])
+    ttl_cache.discard('a', 'missing')
+    assert ttl_cache.get_many(['a', 'b']) == {'b': 2}
+    ttl_cache.clear()
+    assert len(ttl_cache) == 0
+
+
+def test_zero_maxsize_disables_caching(monkeypatch):
+    ttl_cache, _ = _cache(monkeypatch, maxsize=0)
+    ttl_cache.set_many([('a', 1)])
+    assert ttl_cache.get_many(['a']) == {}
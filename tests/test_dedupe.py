@@ -0,0 +1,52 @@
+from tasks.dedupe import SkuIndex, build_index, iter_winning_rows
+
+
+def _write(tmp_path, text):
+    path = tmp_path / 'products.csv'
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_sku_index_keeps_last_row():
+    index = SkuIndex()
+    index.add('a', 1)
+    index.add('b', 2)
+    index.add('a', 3)
+    assert len(index) == 2
+    assert list(index.winners(3)) == [0, 0, 1, 1]
+
+
+def test_sku_index_grows_without_losing_entries():
+    index = SkuIndex()
+    capacity = index.nbytes
+    for row_no in range(1, 5001):
+        index.add(f'sku-{row_no % 3000}', row_no)
+    assert len(index) == 3000
+    assert index.nbytes > capacity
+    winners = index.winners(5000)
+    assert sum(winners) == 3000
+    # The later occurrence of each repeated SKU wins
+    assert winners[5000] and not winners[2000]
+    assert winners[2001] and not winners[1]
+
+
+def test_build_index_compares_trimmed_lowercase_skus(tmp_path):
+    path = _write(tmp_path, 'sku,name\nA1,first\n a1 ,second\nB2,other\n,no sku\n')
+    index, rows = build_index(path)
+    assert rows == 4
+    assert len(index) == 2
+    assert list(index.winners(rows)) == [0, 0, 1, 1, 0]
+
+
+def test_build_index_without_sku_column(tmp_path):
+    path = _write(tmp_path, 'name\nx\n')
+    index, rows = build_index(path)
+    assert (len(index), rows) == (0, 0)
+
+
+def test_iter_winning_rows_last_row_wins_in_file_order(tmp_path):
+    path = _write(tmp_path, 'sku,name,price\nA,old,1\nB,b,2\na,new\n')
+    index, rows = build_index(path)
+    winners = index.winners(rows)
+    assert list(iter_winning_rows(path, winners, ['sku', 'price'])) == [['B', '2'], ['a', '']]
+    assert list(iter_winning_rows(path, winners, ['name'], with_row_no=True)) == [[2, 'b'], [3, 'new']]
@@ -0,0 +1,61 @@
+import io
+import pytest
+from tasks.process_csv import _record_end, _iter_record_chunks, _skip_header
+
+
+def test_skip_header_returns_first_data_row():
+    f = io.BytesIO(b'sku,name\nA,a\n')
+    assert _skip_header(f) == len(b'sku,name\n')
+
+
+def test_skip_header_spans_quoted_newlines():
+    data = b'sku,"long\nname"\nA,a\n'
+    assert _skip_header(io.BytesIO(data)) == data.index(b'A')
+
+
+def test_skip_header_only_file_without_newline():
+    data = b'sku,name,price'
+    assert _skip_header(io.BytesIO(data)) == len(data)
+
+
+def test_skip_header_unterminated_quote():
+    with pytest.raises(ValueError):
+        _skip_header(io.BytesIO(b'sku,"name\nA,a'))
+
+
+def test_record_end_ignores_newlines_inside_quotes():
+    assert _record_end(b'A,"x\ny"\nB,"z\n') == len(b'A,"x\ny"\n')
+
+
+def test_record_end_without_complete_record():
+    assert _record_end(b'A,"x\ny') is None
+    assert _record_end(b'A,b') is None
+
+
+def test_record_end_escaped_quotes_keep_parity():
+    data = b'A,"say ""hi""\n"\nB,b'
+    assert _record_end(data) == data.index(b'B')
+
+
+def test_iter_record_chunks_splits_on_record_boundaries():
+    data = b''.join(b'%d,"line\nbreak ""%d""",x\n' % (i, i) for i in range(50))
+    f = io.BytesIO(data)
+    chunks = list(_iter_record_chunks(f, 7))
+    assert b''.join(chunk for chunk, _ in chunks) == data
+    for chunk, end in chunks:
+        assert _record_end(chunk) == len(chunk)
+        assert data[:end].endswith(chunk)
+
+
+def test_iter_record_chunks_yields_unterminated_last_record():
+    data = b'A,a\nB,"b\nc"'
+    chunks = list(_iter_record_chunks(io.BytesIO(data), 4))
+    assert [chunk for chunk, _ in chunks] == [b'A,a\n', b'B,"b\nc"']
+    assert chunks[-1][1] == len(data)
+
+
+def test_iter_record_chunks_resumes_from_offset():
+    data = b'A,a\nB,b\nC,c\n'
+    f = io.BytesIO(data)
+    f.seek(4)
+    assert list(_iter_record_chunks(f, 100)) == [(b'B,b\nC,c\n', len(data))]
@@ -0,0 +1,27 @@
+import pytest
+from starlette.requests import Request
+from app.serialization import etag_matches
+
+
+def _request(if_none_match=None):
+    headers = [(b'if-none-match', if_none_match.encode())] if if_none_match is not None else []
+    return Request({'type': 'http', 'method': 'GET', 'path': '/products/', 'headers': headers})
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, False),
+    ('', False),
+    ('"v7"', True),
+    ('"v6"', False),
+    ('W/"v7"', True),
+    ('"v1", W/"v7" ,"v9"', True),
+    ('"v1", "v9"', False),
+    ('*', True),
+    (' * ', True),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(_request(header), '"v7"') is expected
+
+
+def test_etag_matches_weak_etag():
+    assert etag_matches(_request('"v7"'), 'W/"v7"')
@@ -0,0 +1,73 @@
+import pytest
+from tasks import webhooks
+from tasks.webhooks import RoutingIndex, is_valid_pattern
+
+
+@pytest.mark.parametrize('pattern, expected', [
+    ('*', True),
+    ('product.created', True),
+    ('product.*', True),
+    ('import.*', True),
+    ('order.*', False),
+    ('product.archived', False),
+    ('product', False),
+    ('product.', False),
+    ('', False),
+])
+def test_is_valid_pattern(pattern, expected):
+    assert is_valid_pattern(pattern) is expected
+
+
+def _index(monkeypatch, rows):
+    """A RoutingIndex that loads `rows` of (id, url, event_types) instead of querying webhooks."""
+    index = RoutingIndex()
+    loads = []
+
+    def load():
+        loads.append(rows)
+        by_pattern = {}
+        for webhook_id, url, event_types in rows:
+            for pattern in set(event_types):
+                by_pattern.setdefault(pattern, []).append((webhook_id, url))
+        index._routing = (by_pattern, {})
+        index._loaded = True
+
+    class Redis:
+        def get(self, key):
+            return b'1'
+
+    monkeypatch.setattr(index, '_load', load)
+    monkeypatch.setattr(webhooks, '_client', Redis)
+    return index, loads
+
+
+def test_subscribers_match_exact_prefix_and_wildcard_patterns(monkeypatch):
+    index, _ = _index(monkeypatch, [
+        (1, 'http://a', ['product.created']),
+        (2, 'http://b', ['product.*']),
+        (3, 'http://c', ['*']),
+        (4, 'http://d', ['import.*', 'product.deleted']),
+    ])
+    assert index.subscribers('product.created') == ((1, 'http://a'), (2, 'http://b'), (3, 'http://c'))
+    assert index.subscribers('product.deleted') == ((4, 'http://d'), (2, 'http://b'), (3, 'http://c'))
+    assert index.subscribers('import.failed') == ((4, 'http://d'), (3, 'http://c'))
+
+
+def test_subscribers_lists_each_webhook_once(monkeypatch):
+    index, _ = _index(monkeypatch, [(1, 'http://a', ['product.updated', 'product.*', '*'])])
+    assert index.subscribers('product.updated') == ((1, 'http://a'),)
+
+
+def test_subscribers_are_memoized_until_reload(monkeypatch):
+    index, loads = _index(monkeypatch, [(1, 'http://a', ['product.*'])])
+    first = index.subscribers('product.updated')
+    assert index.subscribers('product.updated') is first
+    index.invalidate()
+    assert index.subscribers('product.updated') == first
+    assert index.subscribers('product.updated') is not first
+    assert len(loads) == 2
+
+
+def test_subscribers_of_unsubscribed_event(monkeypatch):
+    index, _ = _index(monkeypatch, [(1, 'http://a', ['import.*'])])
+    assert index.subscribers('product.created') == ()